@@ -3,3 +3,8 @@ try:
 except:
     SerialPort = None
 from .socket_port import SocketPort
+from .async_port import AsyncSocketPort
+from .io_hub import IOHub
+from .recorder import FlightRecorder, Recording
+from .replay_port import ReplayPort
+from .report_queue import ReportQueue, ReportConsumer
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+asyncio transport of the main and report sockets
+No thread is created, one event loop can drive the sockets of many arms
+"""
+
+import os
+import asyncio
+import platform
+from ..utils.log import logger
+from ..utils import convert
+from ..config.x_config import XCONF
+from .base import RxRingBuffer
+from .recorder import KIND_REPORT, KIND_TX, KIND_RX
+from .socket_port import HEARTBEAT_DATA
+
+
+class AsyncTransactionDispatcher(object):
+    """
+    Same interface as TransactionDispatcher, the waiters are futures of the event loop
+    Feedback frames (funcode 0xFF) are given to fb_callback
+    """
+    def __init__(self, fb_callback=None):
+        self.fb_callback = fb_callback
+        self._waiters = {}
+        self.drop_unmatched = True
+        self.unmatched_count = 0
+        # CommStats of the command layer, counts the dropped frames per function code
+        self.stats = None
+
+    def register(self, trans_id):
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters[trans_id] = waiter
+        return waiter
+
+    def unregister(self, trans_id):
+        return self._waiters.pop(trans_id, None)
+
+    def get_waiter(self, trans_id):
+        return self._waiters.get(trans_id, None)
+
+    def cancel_all(self):
+        for waiter in list(self._waiters.values()):
+            if not waiter.done():
+                waiter.set_result(-1)
+
+    def put(self, data, is_report=False):
+        if data[6] == 0xFF:
+            if self.fb_callback:
+                self.fb_callback(bytes(data))
+            return
+        waiter = self._waiters.get(data[0] << 8 | data[1], None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(bytes(data))
+        else:
+            self.unmatched_count += 1
+            if self.stats is not None:
+                self.stats.record_stale(data)
+
+
+class _MainProtocol(asyncio.BufferedProtocol):
+    def __init__(self, port):
+        self._port = port
+        self._ring = RxRingBuffer(max(port.buffer_size * 8, 8192), min_free=port.buffer_size)
+
+    def connection_made(self, transport):
+        self._port._connection_made(transport)
+
+    def get_buffer(self, sizehint):
+        return self._ring.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self._ring.advance(nbytes)
+        if not self._ring.ready:
+            return
+        recorder = self._port.recorder
+        for frame in self._ring.frames():
+            if recorder is not None:
+                recorder.record(KIND_RX, frame)
+            self._port.rx_parse.put(frame)
+
+    def connection_lost(self, exc):
+        self._port._connection_lost(exc)
+
+
+class _ReportProtocol(asyncio.Protocol):
+    def __init__(self, port):
+        self._port = port
+        self._buf = bytearray()
+        self._size = 0
+        self._size_is_not_confirm = False
+
+    def connection_made(self, transport):
+        self._port._connection_made(transport)
+
+    def data_received(self, data):
+        buf = self._buf
+        buf += data
+        pos = 0
+        while len(buf) - pos >= 4:
+            if self._size == 0:
+                self._size = convert.bytes_to_u32(buf[pos:pos + 4])
+                if self._size == 233:
+                    self._size_is_not_confirm = True
+                    self._size = 245
+                logger.info('report_data_size: {}, size_is_not_confirm={}'.format(self._size, self._size_is_not_confirm))
+            if self._size_is_not_confirm:
+                # some firmwares announce 233 bytes but send 245, decided by the length of the next frame
+                if len(buf) - pos < 237:
+                    break
+                self._size_is_not_confirm = False
+                if convert.bytes_to_u32(buf[pos + 233:pos + 237]) == 233:
+                    self._size = 233
+                    logger.info('report_data_size: {}, size_is_not_confirm={}'.format(self._size, self._size_is_not_confirm))
+            size = self._size
+            if len(buf) - pos < size:
+                break
+            if convert.bytes_to_u32(buf[pos:pos + 4]) != size:
+                logger.error('report data error, close, length={}, size={}'.format(convert.bytes_to_u32(buf[pos:pos + 4]), size))
+                self._port.close()
+                return
+            self._port._put_report(bytes(buf[pos:pos + size]))
+            pos += size
+        del buf[:pos]
+
+    def connection_lost(self, exc):
+        self._port._connection_lost(exc)
+
+
+class AsyncSocketPort(object):
+    """
+    asyncio counterpart of SocketPort, the same methods are used by the command layer,
+    but wait_response and read are coroutines
+    """
+    def __init__(self, server_ip, server_port, heartbeat=False, buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE,
+                 forbid_uds=False, fb_callback=None, report_callback=None, recorder=None):
+        is_main_tcp = server_port == XCONF.SocketConf.TCP_CONTROL_PORT or server_port == XCONF.SocketConf.TCP_CONTROL_PORT + 1
+        self.port_type = 'main-socket' if is_main_tcp else 'report-socket'
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.buffer_size = buffer_size
+        self.forbid_uds = forbid_uds
+        self.rx_parse = AsyncTransactionDispatcher(fb_callback) if is_main_tcp else None
+        self.report_callback = report_callback
+        # FlightRecorder, records the written data and the received frames
+        self.recorder = recorder
+        self.transport = None
+        self.latest_report = None
+        self.report_count = 0
+        self._report_waiters = []
+        self._connected = False
+        self._heartbeat = heartbeat
+        self._heartbeat_task = None
+
+    @property
+    def connected(self):
+        return self._connected
+
+    async def connect(self, timeout=3):
+        loop = asyncio.get_event_loop()
+        if self.port_type == 'main-socket':
+            factory = lambda: _MainProtocol(self)
+        else:
+            factory = lambda: _ReportProtocol(self)
+        try:
+            uds_path = '/tmp/xarmcontroller_uds_{}'.format(self.server_port)
+            if not self.forbid_uds and platform.system() == 'Linux' and os.path.exists(uds_path):
+                try:
+                    await asyncio.wait_for(loop.create_unix_connection(factory, uds_path), timeout)
+                    logger.info('{} connect {} success, uds_{}'.format(self.port_type, self.server_ip, self.server_port))
+                except Exception:
+                    pass
+            if not self._connected:
+                await asyncio.wait_for(loop.create_connection(factory, self.server_ip, self.server_port), timeout)
+                logger.info('{} connect {} success'.format(self.port_type, self.server_ip))
+        except Exception as e:
+            logger.info('{} connect {} failed, {}'.format(self.port_type, self.server_ip, e))
+            self._connected = False
+        if self._connected and self._heartbeat:
+            self._heartbeat_task = loop.create_task(self._heartbeat_loop())
+        return self._connected
+
+    def _connection_made(self, transport):
+        self.transport = transport
+        self._connected = True
+
+    def _connection_lost(self, exc):
+        if self._connected and exc is not None:
+            logger.error('[{}] recv error: {}'.format(self.port_type, exc))
+        self._connected = False
+        if self.rx_parse is not None:
+            self.rx_parse.cancel_all()
+        self._put_report(-1)
+
+    async def _heartbeat_loop(self):
+        logger.debug('{} heartbeat task start'.format(self.port_type))
+        while self._connected:
+            if self.write(HEARTBEAT_DATA) == -1:
+                break
+            await asyncio.sleep(1)
+        logger.debug('{} heartbeat task had stopped'.format(self.port_type))
+
+    def close(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self.transport is not None:
+            self.transport.close()
+        self._connection_lost(None)
+
+    def flush(self, fromid=-1, toid=-1):
+        return 0 if self._connected else -1
+
+    def write(self, data):
+        if not self._connected:
+            return -1
+        try:
+            logger.verbose('[{}] send: {}'.format(self.port_type, data))
+            if self.recorder is not None:
+                self.recorder.record(KIND_TX, data)
+            self.transport.write(data)
+            return 0
+        except Exception as e:
+            self._connected = False
+            logger.error('[{}] send error: {}'.format(self.port_type, e))
+            return -1
+
+    def register_waiter(self, trans_id):
+        return self.rx_parse.register(trans_id)
+
+    def unregister_waiter(self, trans_id):
+        return self.rx_parse.unregister(trans_id)
+
+    async def wait_response(self, trans_id, timeout=None):
+        """
+        Wait the response of a registered transaction, return -1 on timeout
+        """
+        waiter = self.rx_parse.get_waiter(trans_id)
+        if waiter is None:
+            return -1
+        try:
+            return await asyncio.wait_for(waiter, timeout) if self._connected else -1
+        except asyncio.TimeoutError:
+            return -1
+        finally:
+            if self.rx_parse.get_waiter(trans_id) is waiter:
+                self.rx_parse.unregister(trans_id)
+
+    def release(self, data):
+        # report frames are plain bytes, kept for the same interface as Port
+        pass
+
+    def _put_report(self, data):
+        if data != -1:
+            if self.recorder is not None:
+                self.recorder.record(KIND_REPORT, data)
+            self.latest_report = data
+            self.report_count += 1
+            if self.report_callback:
+                self.report_callback(data)
+        waiters, self._report_waiters = self._report_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(data)
+
+    async def read(self, timeout=None):
+        """
+        Wait the next report frame, return -1 on timeout or disconnection
+        """
+        if not self._connected:
+            return -1
+        waiter = asyncio.get_event_loop().create_future()
+        self._report_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return -1
@@ -8,11 +8,14 @@
 
 import time
 import queue
+import collections
 import socket
 import select
 import threading
 from ..utils.log import logger
 from ..utils import convert
+from .recorder import KIND_REPORT, KIND_TX, KIND_RX
+from .report_queue import ReportQueue
 
 
 class RxParse(object):
@@ -24,12 +27,304 @@ class RxParse(object):
         pass
 
     def put(self, data, is_report=False):
-        if not is_report and data[6] == 0xFF:
+        if is_report:
+            # report buffers come from the port's pool, ownership is handed over without copying
+            self.rx_que.put(data)
+            return
+        # data may be a memoryview into the receive buffer, copy it once before queueing
+        if data[6] == 0xFF:
             if not self.fb_que:
                 return
-            self.fb_que.put(data)
+            self.fb_que.put(bytes(data))
         else:
-            self.rx_que.put(data)
+            self.rx_que.put(bytes(data))
+
+
+class ResponseWaiter(object):
+    """
+    Response slot of one transaction, set by the receive thread
+    """
+    __slots__ = ('trans_id', 'data', '_event')
+
+    def __init__(self, trans_id):
+        self.trans_id = trans_id
+        self.data = -1
+        self._event = threading.Event()
+
+    def set(self, data):
+        self.data = data
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        self._event.wait(timeout)
+        return self.data
+
+
+class TransactionDispatcher(RxParse):
+    """
+    Demultiplex main socket responses by transaction id into the registered waiters
+    Frames without a waiter go to rx_que, or are counted and dropped if drop_unmatched is set
+    """
+    def __init__(self, rx_que, fb_que=None):
+        super(TransactionDispatcher, self).__init__(rx_que, fb_que)
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self.drop_unmatched = False
+        self.unmatched_count = 0
+        # CommStats of the command layer, counts the dropped frames per function code
+        self.stats = None
+
+    def register(self, trans_id):
+        waiter = ResponseWaiter(trans_id)
+        with self._lock:
+            self._waiters[trans_id] = waiter
+        return waiter
+
+    def unregister(self, trans_id):
+        with self._lock:
+            return self._waiters.pop(trans_id, None)
+
+    def get_waiter(self, trans_id):
+        return self._waiters.get(trans_id, None)
+
+    def cancel_all(self):
+        # wake up all waiters with -1, used when the connection is closed
+        with self._lock:
+            waiters = list(self._waiters.values())
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set(-1)
+
+    def put(self, data, is_report=False):
+        if not is_report and data[6] != 0xFF:
+            with self._lock:
+                waiter = self._waiters.get(data[0] << 8 | data[1], None)
+            if waiter is not None and not waiter.done():
+                waiter.set(bytes(data))
+                return
+            if self.drop_unmatched:
+                self.unmatched_count += 1
+                if self.stats is not None:
+                    self.stats.record_stale(data)
+                return
+        super(TransactionDispatcher, self).put(data, is_report)
+
+
+class RxRingBuffer(object):
+    """
+    Preallocated receive buffer of the main socket, filled by recv_into
+    Complete Modbus-TCP frames are handed out as memoryview slices, a slice is only valid until the next recv
+    The end of the next frame (or of its header) is kept, so a read of a fragment which does not complete it
+        is not parsed (ready is False)
+    """
+    HEADER_SIZE = 6
+
+    def __init__(self, size=8192, min_free=1024):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._min_free = min_free
+        self._head = 0  # start of the unparsed data
+        self._tail = 0  # end of the received data
+        self._need = self.HEADER_SIZE  # end of the next frame, or of its header if its length is not received yet
+
+    @property
+    def pending(self):
+        return self._tail - self._head
+
+    @property
+    def ready(self):
+        # a complete frame is received
+        return self._tail >= self._need
+
+    def recv_into(self, recv_into_func):
+        if len(self._buf) - self._tail < self._min_free:
+            self._compact()
+        size = recv_into_func(self._view[self._tail:])
+        self._tail += size
+        return size
+
+    def recv_frame_into(self, recv_into_func):
+        """
+        Read until a frame is complete, for a receive thread (a selector reads once with recv_into)
+        :return: size of the data received, 0 if the connection is closed
+        """
+        received = 0
+        while True:
+            if len(self._buf) - self._tail < self._min_free:
+                self._compact()
+            size = recv_into_func(self._view[self._tail:])
+            if size == 0:
+                return 0
+            self._tail += size
+            received += size
+            if self._tail >= self._need:
+                return received
+
+    def get_buffer(self):
+        # free space behind the received data, see asyncio.BufferedProtocol.get_buffer
+        if len(self._buf) - self._tail < self._min_free:
+            self._compact()
+        return self._view[self._tail:]
+
+    def advance(self, size):
+        self._tail += size
+
+    def _compact(self):
+        pending = self._tail - self._head
+        if self._head == 0:
+            # the pending frame does not fit, grow the buffer
+            buf = bytearray(len(self._buf) * 2)
+            buf[:pending] = self._view[:pending]
+            self._buf = buf
+            self._view = memoryview(self._buf)
+        else:
+            # only the tail of a partial frame is moved
+            self._view[:pending] = self._view[self._head:self._tail]
+        self._need -= self._head
+        self._head = 0
+        self._tail = pending
+
+    def frames(self):
+        buf = self._buf
+        while self._tail - self._head >= self.HEADER_SIZE:
+            head = self._head
+            length = (buf[head + 4] << 8 | buf[head + 5]) + self.HEADER_SIZE
+            if self._tail - head < length:
+                self._need = head + length
+                return
+            self._head = head + length
+            yield self._view[head:self._head]
+        if self._head == self._tail:
+            self._head = self._tail = 0
+        self._need = self._head + self.HEADER_SIZE
+
+
+class ReportBufferPool(object):
+    """
+    Fixed-size buffers reused by the report reader, kept as memoryviews so that a frame costs no allocation
+    The consumer owns a buffer after reading it from the port and gives it back by Port.release
+    A buffer handed to several holders (share) goes back to the pool after the last release
+    Only the buffers of the pool are taken back, the ones allocated while it is empty are left to the GC
+    """
+    def __init__(self, size, count=4):
+        self.size = size
+        self.count = count
+        self._views = {}
+        for _ in range(count):
+            buf = bytearray(size)
+            self._views[id(buf)] = memoryview(buf)
+        self._free = collections.deque(self._views.values())
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._free.pop()
+        except IndexError:
+            return memoryview(bytearray(self.size))
+
+    def share(self, data, count):
+        """
+        data (or a slice of it) is handed to count holders, each of them releases it once
+        """
+        if type(data) is memoryview and id(data.obj) in self._views:
+            with self._lock:
+                self._shared[id(data.obj)] = count
+
+    def release(self, data):
+        if type(data) is not memoryview:
+            return
+        key = id(data.obj)
+        view = self._views.get(key, None)
+        if view is None:
+            return
+        if self._shared:
+            with self._lock:
+                count = self._shared.pop(key, 1)
+                if count > 1:
+                    self._shared[key] = count - 1
+                    return
+        if len(self._free) < self.count:
+            self._free.append(view)
+
+
+class ReportReader(object):
+    """
+    Framing state of the report socket, the first length prefix is read into header,
+    then every frame is read whole into a pool buffer (one recv_into per frame once the size is known)
+    """
+    def __init__(self, port):
+        self._port = port
+        self.size = 0
+        self.data_num = 0
+        self.header = bytearray(4)
+        self.view = memoryview(self.header)
+        self.size_is_not_confirm = False
+
+    def _read_size(self, length):
+        port = self._port
+        self.data_num += length
+        if self.data_num != 4:
+            return length
+        self.size = convert.bytes_to_u32(self.header)
+        if self.size == 233:
+            self.size_is_not_confirm = True
+            self.size = 245
+        logger.info('report_data_size: {}, size_is_not_confirm={}'.format(self.size, self.size_is_not_confirm))
+        if port._report_pool is None or port._report_pool.size < self.size:
+            port._report_pool = ReportBufferPool(self.size)
+        self.view = port._report_pool.acquire()
+        self.view[:4] = self.header
+        return length
+
+    def _confirm_size(self, view, length):
+        port = self._port
+        self.size_is_not_confirm = False
+        if convert.bytes_to_u32(view[233:237]) != 233:
+            return False
+        # the frame is really 233 bytes, the rest already belongs to the next frame
+        self.size = 233
+        logger.info('report_data_size: {}, size_is_not_confirm={}'.format(self.size, self.size_is_not_confirm))
+        next_view = port._report_pool.acquire()
+        self.data_num = 245 - self.size
+        next_view[:self.data_num] = view[self.size:245]
+        port._put_report(view[:self.size])
+        self.view = next_view
+        return True
+
+    def read(self):
+        """
+        Read once from the socket, return the read length, 0 if nothing was read, -1 on a data error
+        """
+        size = self.size
+        data_num = self.data_num
+        view = self.view
+        if data_num == 0 and size != 0:
+            # the usual case, a whole frame is read into the buffer without slicing it
+            length = self._port.com_read_into(view, size)
+        else:
+            length = self._port.com_read_into(view[data_num:size or 4])
+        if length == 0:
+            return 0
+        if size == 0:
+            return self._read_size(length)
+        data_num += length
+        if data_num < size:
+            self.data_num = data_num
+            return length
+        if self.size_is_not_confirm and self._confirm_size(view, length):
+            return length
+        if (view[0] << 24 | view[1] << 16 | view[2] << 8 | view[3]) != size:
+            logger.error('report data error, close, length={}, size={}'.format(convert.bytes_to_u32(view[0:4]), size))
+            return -1
+        self.data_num = 0
+        port = self._port
+        self.view = port._report_pool.acquire()
+        port._put_report(view if len(view) == size else view[:size])
+        return length
 
 
 class Port(threading.Thread):
@@ -43,16 +338,39 @@ class Port(threading.Thread):
         self.com = None
         self.rx_parse = RxParse(self.rx_que, self.fb_que)
         self.com_read = None
+        self.com_read_into = None
         self.com_write = None
         self.port_type = ''
         self.buffer_size = 1
         self.heartbeat_thread = None
         self.alive = True
+        self._report_pool = None
+        # the socket is read by the IOHub thread instead of this thread if io_hub is set
+        self.io_hub = None
+        self._hub_reader = None
+        self._heartbeat_timer = None
+        # FlightRecorder, records the written data and the received frames
+        self.recorder = None
+        # ReportConsumer list, every report frame is given to them
+        self._report_consumers = ()
+        # HubTask scheduled after each report frame, the reader of the frames when there is no report thread
+        self.report_task = None
 
     @property
     def connected(self):
         return self._connected
 
+    @property
+    def report_consumers(self):
+        return self._report_consumers
+
+    @report_consumers.setter
+    def report_consumers(self, consumers):
+        # the consumers give the frames back to the pool of this port
+        for consumer in consumers:
+            consumer.queue.release = self.release
+        self._report_consumers = consumers
+
     def run(self):
         if self.port_type == 'report-socket':
             self.recv_report_proc()
@@ -62,6 +380,16 @@ class Port(threading.Thread):
 
     def close(self):
         self.alive = False
+        if self.io_hub is not None:
+            # there is no receive thread which would notice the closed socket
+            self._connected = False
+            self.io_hub.unregister(self)
+            if self._heartbeat_timer is not None:
+                self._heartbeat_timer.cancel()
+        if isinstance(self.rx_parse, TransactionDispatcher):
+            self.rx_parse.cancel_all()
+        if isinstance(self.rx_que, ReportQueue):
+            self.rx_que.close()
         if 'socket' in self.port_type:
             try:
                 self.com.shutdown(socket.SHUT_RDWR)
@@ -72,6 +400,27 @@ class Port(threading.Thread):
         except:
             pass
 
+    def handle_read(self):
+        """
+        Read once the socket which is ready to read, called by the IOHub thread
+        Return False if the connection should be closed
+        """
+        if self.port_type == 'report-socket':
+            if self._hub_reader is None:
+                self._hub_reader = ReportReader(self)
+            return self._hub_reader.read() > 0
+        if self._hub_reader is None:
+            self._hub_reader = RxRingBuffer(max(self.buffer_size * 8, 8192), min_free=self.buffer_size)
+        if self._hub_reader.recv_into(self.com_read_into) == 0:
+            return False
+        if not self._hub_reader.ready:
+            return True
+        for frame in self._hub_reader.frames():
+            if self.recorder is not None:
+                self.recorder.record(KIND_RX, frame)
+            self.rx_parse.put(frame)
+        return True
+
     def flush(self, fromid=-1, toid=-1):
         if not self.connected:
             return -1
@@ -86,6 +435,8 @@ class Port(threading.Thread):
         try:
             with self.write_lock:
                 logger.verbose('[{}] send: {}'.format(self.port_type, data))
+                if self.recorder is not None:
+                    self.recorder.record(KIND_TX, data)
                 self.com_write(data)
             return 0
         except Exception as e:
@@ -93,6 +444,36 @@ class Port(threading.Thread):
             logger.error("[{}] send error: {}".format(self.port_type, e))
             return -1
 
+    def register_waiter(self, trans_id):
+        """
+        Register a waiter for the response of trans_id, must be called before the request is written
+        """
+        register = getattr(self.rx_parse, 'register', None)
+        return register(trans_id) if register is not None else None
+
+    def unregister_waiter(self, trans_id):
+        unregister = getattr(self.rx_parse, 'unregister', None)
+        return unregister(trans_id) if unregister is not None else None
+
+    def wait_response(self, trans_id, timeout=None):
+        """
+        Wait the response of a registered transaction, return -1 on timeout
+        """
+        waiter = self.rx_parse.get_waiter(trans_id)
+        if waiter is None:
+            return -1
+        try:
+            return waiter.wait(timeout) if self.connected else -1
+        finally:
+            self.unregister_waiter(trans_id)
+
+    def release(self, data):
+        """
+        Give a report buffer returned by read back to the pool, the data must not be used afterwards
+        """
+        if self._report_pool is not None:
+            self._report_pool.release(data)
+
     def read(self, timeout=None):
         if not self.connected:
             return -1
@@ -135,32 +516,47 @@ class Port(threading.Thread):
     #     logger.debug('[{}] recv thread had stopped'.format(self.port_type))
     #     self._connected = False
 
+    def set_report_queue(self, report_queue):
+        # ReportQueue of the report frames, the dropped buffers go back to the pool
+        report_queue.release = self.release
+        self.rx_que = report_queue
+        self.rx_parse = RxParse(self.rx_que, self.fb_que)
+
+    def _put_report(self, data):
+        if self.recorder is not None:
+            self.recorder.record(KIND_REPORT, data)
+        consumers = self.report_consumers
+        if consumers:
+            # the consumers and the report queue share the buffer, it goes back to the pool after the last release
+            if self._report_pool is not None:
+                self._report_pool.share(data, len(consumers) + 1)
+            timestamp = time.monotonic()
+            for consumer in consumers:
+                consumer.put(data, timestamp)
+        if isinstance(self.rx_que, ReportQueue):
+            self.rx_que.offer(data)
+            if self.report_task is not None:
+                self.report_task.schedule()
+            return
+        # only the latest reports are kept, a dropped buffer goes back to the pool
+        if self.rx_que.qsize() > 1:
+            try:
+                self.release(self.rx_que.get_nowait())
+            except queue.Empty:
+                pass
+        self.rx_parse.put(data, True)
+
     def recv_report_proc(self):
         self.alive = True
         logger.debug('[{}] recv thread start'.format(self.port_type))
         failed_read_count = 0
         timeout_count = 0
-        size = 0
-        data_num = 0
-        buffer = b''
-        size_is_not_confirm = False
-
-        data_prev_us = 0
-        data_curr_us = 0
-        data_max_interval_us = 0
-        data_over_us = 205 * 1000  # over 205ms, cnts++
-        data_over_cnts = 0
-
-        recv_prev_us = 0
-        recv_curr_us = 0
-        recv_max_interval_us = 0
-        recv_over_us = 300 * 1000  # over 300ms, cnts++
-        recv_over_cnts = 0
+        reader = ReportReader(self)
 
         try:
             while self.connected and self.alive:
                 try:
-                    data = self.com_read(4 - data_num if size == 0 else (size - data_num))
+                    length = reader.read()
                 except socket.timeout:
                     timeout_count += 1
                     if timeout_count > 3:
@@ -169,7 +565,7 @@ class Port(threading.Thread):
                         break
                     continue
                 else:
-                    if len(data) == 0:
+                    if length == 0:
                         failed_read_count += 1
                         if failed_read_count > 5:
                             self._connected = False
@@ -177,69 +573,8 @@ class Port(threading.Thread):
                             break
                         time.sleep(0.1)
                         continue
-                    data_num += len(data)
-                    buffer += data
-                    if size == 0:
-                        if data_num != 4:
-                            continue
-                        size = convert.bytes_to_u32(buffer[0:4])
-                        if size == 233:
-                            size_is_not_confirm = True
-                            size = 245
-                        logger.info('report_data_size: {}, size_is_not_confirm={}'.format(size, size_is_not_confirm))
-                    else:
-                        if data_num < size:
-                            continue
-                        if size_is_not_confirm:
-                            size_is_not_confirm = True
-                            if convert.bytes_to_u32(buffer[233:237]) == 233:
-                                size = 233
-                                buffer = buffer[233:]
-                                continue
-
-                        if convert.bytes_to_u32(buffer[0:4]) != size:
-                            logger.error('report data error, close, length={}, size={}'.format(convert.bytes_to_u32(buffer[0:4]), size))
-                            break
-
-                        # # buffer[494:502]
-                        # data_curr_us = convert.bytes_to_u64(buffer[-8:])
-                        # recv_curr_us = time.monotonic() * 1000000
-                        #
-                        # if data_prev_us != 0 and recv_prev_us != 0:
-                        #     data_interval_us = data_curr_us - data_prev_us
-                        #     data_over_cnts += 1 if data_interval_us > data_over_us else 0
-                        #
-                        #     recv_interval_us = recv_curr_us - recv_prev_us
-                        #     recv_over_cnts += 1 if recv_interval_us > recv_over_us else 0
-                        #
-                        #     print_flag = False
-                        #
-                        #     if data_interval_us > data_max_interval_us:
-                        #         data_max_interval_us = data_interval_us
-                        #         print_flag = True
-                        #     elif data_interval_us > data_over_us:
-                        #         print_flag = True
-                        #
-                        #     if recv_interval_us > recv_max_interval_us:
-                        #         recv_max_interval_us = recv_interval_us
-                        #         print_flag = True
-                        #     elif recv_interval_us > recv_over_us:
-                        #         print_flag = True
-                        #
-                        #     if print_flag:
-                        #         print('[RECV] Di={}, Dmax={}, Dcnts={}, Ri={}, Rmax={}, Rcnts={}'.format(
-                        #             data_interval_us / 1000, data_max_interval_us / 1000, data_over_cnts,
-                        #             recv_interval_us / 1000, recv_max_interval_us / 1000, recv_over_cnts
-                        #         ))
-                        # data_prev_us = data_curr_us
-                        # recv_prev_us = recv_curr_us
-
-                        if self.rx_que.qsize() > 1:
-                            self.rx_que.get()
-                        self.rx_parse.put(buffer, True)
-                        buffer = b''
-                        data_num = 0
-
+                    if length < 0:
+                        break
                     timeout_count = 0
                     failed_read_count = 0
         except Exception as e:
@@ -257,14 +592,14 @@ class Port(threading.Thread):
         is_main_serial = self.port_type == 'main-serial'
         try:
             failed_read_count = 0
-            buffer = b''
+            ring = RxRingBuffer(max(self.buffer_size * 8, 8192), min_free=self.buffer_size) if is_main_tcp else None
             while self.connected and self.alive:
                 if is_main_tcp:
                     try:
-                        rx_data = self.com_read(self.buffer_size)
+                        size = ring.recv_frame_into(self.com_read_into)
                     except socket.timeout:
                         continue
-                    if len(rx_data) == 0:
+                    if size == 0:
                         failed_read_count += 1
                         if failed_read_count > 5:
                             self._connected = False
@@ -272,16 +607,10 @@ class Port(threading.Thread):
                             break
                         time.sleep(0.1)
                         continue
-                    buffer += rx_data
-                    while True:
-                        if len(buffer) < 6:
-                            break
-                        length = convert.bytes_to_u16(buffer[4:6]) + 6
-                        if len(buffer) < length:
-                            break
-                        rx_data = buffer[:length]
-                        buffer = buffer[length:]
-                        self.rx_parse.put(rx_data)
+                    for frame in ring.frames():
+                        if self.recorder is not None:
+                            self.recorder.record(KIND_RX, frame)
+                        self.rx_parse.put(frame)
                 elif is_main_serial:
                     rx_data = self.com_read(self.com.in_waiting or self.buffer_size)
                     self.rx_parse.put(rx_data)
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Shared I/O hub: one selector thread reads the sockets of many arms
+and runs their periodic tasks from a timer wheel
+"""
+
+import math
+import time
+import functools
+import queue
+import socket
+import selectors
+import threading
+import collections
+from ..utils.log import logger
+
+
+class HubTimer(object):
+    __slots__ = ('callback', 'interval', 'blocking', 'deadline', 'rounds', 'cancelled', 'running')
+
+    def __init__(self, callback, delay, interval=None, blocking=False):
+        self.callback = callback
+        self.interval = interval
+        # blocking callbacks (e.g. a request waiting for its response) run on the worker threads
+        self.blocking = blocking
+        self.deadline = time.monotonic() + delay
+        self.rounds = 0
+        self.cancelled = False
+        self.running = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class HubTask(object):
+    """
+    Callback run on the workers of the hub, never twice at the same time
+    schedule while it runs: it runs once more afterwards, so the work given before schedule is always seen
+    """
+    def __init__(self, hub, callback):
+        self.hub = hub
+        self.callback = callback
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._again = False
+
+    def schedule(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            if self._scheduled:
+                self._again = True
+                return
+            self._scheduled = True
+        self.hub.submit(self._run)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _run(self):
+        while True:
+            try:
+                self.callback()
+            except Exception as e:
+                logger.error('[io-hub] task error: {}'.format(e))
+            with self._lock:
+                if not self._again or self.cancelled:
+                    self._scheduled = False
+                    return
+                self._again = False
+
+
+class HubQueue(HubTask):
+    """
+    Items handled in order by handler(item) on the workers of the hub, instead of a queue read by a thread of its own
+    """
+    def __init__(self, hub, handler):
+        super(HubQueue, self).__init__(hub, self._handle_all)
+        self.handler = handler
+        self._items = collections.deque()
+
+    def put(self, item):
+        self._items.append(item)
+        self.schedule()
+
+    def _handle_all(self):
+        while self._items and not self.cancelled:
+            item = self._items.popleft()
+            try:
+                self.handler(item)
+            except Exception as e:
+                logger.error('[io-hub] queue handler error: {}'.format(e))
+
+
+class TimerWheel(object):
+    """
+    Hashed timing wheel, scheduling is O(1) and only the timers of the current slot are visited per tick
+    """
+    def __init__(self, tick=0.01, slots=512):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._index = 0
+        self._tick_time = time.monotonic()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, timer):
+        ticks = max(1, int(math.ceil((timer.deadline - self._tick_time) / self.tick)))
+        timer.rounds = (ticks - 1) // len(self._slots)
+        self._slots[(self._index + ticks) % len(self._slots)].append(timer)
+        self._count += 1
+
+    def next_timeout(self):
+        if self._count == 0:
+            return None
+        return max(0, self._tick_time + self.tick - time.monotonic())
+
+    def advance(self, now):
+        """
+        Move the wheel to now, return the expired timers
+        """
+        expired = []
+        while self._tick_time + self.tick <= now:
+            self._tick_time += self.tick
+            self._index = (self._index + 1) % len(self._slots)
+            slot = self._slots[self._index]
+            if not slot:
+                continue
+            keep = []
+            for timer in slot:
+                if timer.cancelled:
+                    self._count -= 1
+                elif timer.rounds > 0:
+                    timer.rounds -= 1
+                    keep.append(timer)
+                else:
+                    self._count -= 1
+                    expired.append(timer)
+            self._slots[self._index] = keep
+        return expired
+
+
+class IOHub(threading.Thread):
+    """
+    Multiplex the sockets of many SocketPort with one selector thread
+    The blocking work (timers with blocking=True, HubTask) runs on the worker threads: if the work waits longer than
+        stall_time while no worker is idle, one more worker is started (up to max_workers), the extra ones stop after
+        idle_timeout, so an arm which does not answer holds one worker instead of delaying the work of the other arms
+    Usage:
+        hub = IOHub.get_shared()
+        arm1 = XArmAPI('192.168.1.185', io_hub=hub)
+        arm2 = XArmAPI('192.168.1.186', io_hub=hub)
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, tick=0.01, workers=2, max_workers=64, stall_time=0.1, idle_timeout=10):
+        super(IOHub, self).__init__(name='xarm-io-hub')
+        self.daemon = True
+        self.alive = True
+        self._selector = selectors.DefaultSelector()
+        self._wheel = TimerWheel(tick=tick)
+        self._pending = collections.deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._work_que = queue.Queue()
+        self._min_workers = max(workers, 1)
+        self._max_workers = max(max_workers, self._min_workers)
+        self._stall_time = stall_time
+        self._idle_timeout = idle_timeout
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        self._idle_workers = 0
+        # time a worker took the last work from _work_que
+        self._last_take_time = time.monotonic()
+        # time the last extra worker was started
+        self._grow_time = 0
+        self._started_lock = threading.Lock()
+
+    @classmethod
+    def get_shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None or not cls._shared.alive:
+                cls._shared = cls()
+            return cls._shared
+
+    def _ensure_started(self):
+        with self._started_lock:
+            if not self.is_alive() and self.alive:
+                with self._workers_lock:
+                    while len(self._workers) < self._min_workers:
+                        self._start_worker()
+                self.start()
+
+    def _start_worker(self):
+        # called with _workers_lock held
+        worker = threading.Thread(target=self._worker_proc, daemon=True, name='xarm-io-hub-worker')
+        self._workers.append(worker)
+        worker.start()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\x00')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _call_soon(self, func, *args):
+        # the selector and the wheel are only touched by the hub thread
+        self._pending.append((func, args))
+        self._ensure_started()
+        if threading.current_thread() is not self:
+            self._wakeup()
+
+    def register(self, port):
+        self._call_soon(self._register, port)
+
+    def unregister(self, port):
+        self._call_soon(self._unregister, port)
+
+    def call_later(self, delay, callback, blocking=False):
+        timer = HubTimer(callback, delay, blocking=blocking)
+        self._call_soon(self._wheel.add, timer)
+        return timer
+
+    def call_every(self, interval, callback, blocking=False, delay=None):
+        timer = HubTimer(callback, interval if delay is None else delay, interval=interval, blocking=blocking)
+        self._call_soon(self._wheel.add, timer)
+        return timer
+
+    def submit(self, func):
+        """
+        Run func() on a worker
+        """
+        self._ensure_started()
+        self._work_que.put(func)
+
+    def task(self, callback):
+        return HubTask(self, callback)
+
+    def queue(self, handler):
+        return HubQueue(self, handler)
+
+    def stop(self, timeout=None):
+        """
+        Stop the hub thread, the selector and the wakeup sockets are closed once it has stopped
+        """
+        self.alive = False
+        self._wakeup()
+        if self.ident is None:
+            # never started
+            self._close()
+        elif threading.current_thread() is not self:
+            self.join(timeout)
+
+    def _close(self):
+        with self._started_lock:
+            if self._selector is None:
+                return
+            selector, self._selector = self._selector, None
+        for sock in (self._wakeup_r, self._wakeup_w):
+            try:
+                sock.close()
+            except OSError:
+                pass
+        try:
+            selector.close()
+        except (OSError, ValueError):
+            pass
+
+    def _register(self, port):
+        try:
+            self._selector.register(port.com, selectors.EVENT_READ, port)
+        except (KeyError, ValueError, OSError) as e:
+            logger.error('[io-hub] register {} failed, {}'.format(port.port_type, e))
+
+    def _unregister(self, port):
+        try:
+            self._selector.unregister(port.com)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _prune(self):
+        # sockets closed before they were unregistered
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None and key.fileobj.fileno() < 0:
+                self._unregister(key.data)
+
+    def _close_port(self, port):
+        self._unregister(port)
+        port._connected = False
+        try:
+            port.close()
+        except Exception:
+            pass
+
+    def _run_timer(self, timer):
+        if timer.cancelled:
+            return
+        try:
+            timer.callback()
+        except Exception as e:
+            logger.error('[io-hub] timer error: {}'.format(e))
+        finally:
+            timer.running = False
+
+    def _worker_proc(self):
+        current = threading.current_thread()
+        while self.alive:
+            with self._workers_lock:
+                if len(self._workers) > self._min_workers and time.monotonic() - self._grow_time > self._idle_timeout:
+                    # an extra worker, no work waited for a worker since idle_timeout
+                    self._workers.remove(current)
+                    return
+                self._idle_workers += 1
+            try:
+                func = self._work_que.get(timeout=self._idle_timeout)
+            except queue.Empty:
+                func = False
+            with self._workers_lock:
+                self._idle_workers -= 1
+            if func is None:
+                break
+            if func is False:
+                continue
+            self._last_take_time = time.monotonic()
+            try:
+                func()
+            except Exception as e:
+                logger.error('[io-hub] worker error: {}'.format(e))
+        with self._workers_lock:
+            if current in self._workers:
+                self._workers.remove(current)
+
+    def _check_workers(self, now):
+        # called by the hub thread, the workers are busy (e.g. waiting for an arm which does not answer)
+        # and the work waits: one more worker
+        if self._work_que.empty() or now - self._last_take_time < self._stall_time:
+            return
+        with self._workers_lock:
+            if self._idle_workers == 0 and len(self._workers) < self._max_workers:
+                self._start_worker()
+                self._last_take_time = self._grow_time = now
+
+    def run(self):
+        logger.debug('[io-hub] thread start')
+        while self.alive:
+            try:
+                timeout = self._wheel.next_timeout()
+                if not self._work_que.empty():
+                    timeout = self._stall_time if timeout is None else min(timeout, self._stall_time)
+                events = self._selector.select(timeout)
+            except (OSError, ValueError):
+                self._prune()
+                continue
+            for key, _ in events:
+                if key.data is None:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                port = key.data
+                try:
+                    ok = port.alive and port.handle_read()
+                except socket.timeout:
+                    continue
+                except Exception as e:
+                    if port.alive:
+                        logger.error('[{}] recv error: {}'.format(port.port_type, e))
+                    ok = False
+                if not ok:
+                    logger.debug('[{}] closed by io-hub'.format(port.port_type))
+                    self._close_port(port)
+            while self._pending:
+                func, args = self._pending.popleft()
+                func(*args)
+            now = time.monotonic()
+            self._check_workers(now)
+            for timer in self._wheel.advance(now):
+                if timer.cancelled:
+                    continue
+                if timer.interval is not None:
+                    timer.deadline += timer.interval
+                    self._wheel.add(timer)
+                if timer.running:
+                    # the previous run of a blocking task is not finished yet
+                    continue
+                timer.running = True
+                if timer.blocking:
+                    self.submit(functools.partial(self._run_timer, timer))
+                else:
+                    self._run_timer(timer)
+        with self._workers_lock:
+            workers = len(self._workers)
+        for _ in range(workers):
+            self._work_que.put(None)
+        self._close()
+        logger.debug('[io-hub] thread had stopped')
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Flight recorder of the raw frames of the sockets
+The frames are appended to memory-mapped segment files ({path}.{n:04d}.rec),
+every segment has a time index ({path}.{n:04d}.idx) to seek a recording by time
+Segment: header(16 bytes) + records
+    header: magic(4s), version(u32), wall time of the creation(f64)
+    record: host monotonic time(f64), kind(u8), padding(3), length(u32), frame
+Index: entries of (host monotonic time(f64), offset of the record(u64))
+"""
+
+import os
+import glob
+import mmap
+import time
+import bisect
+import struct
+import threading
+from ..utils.log import logger
+
+KIND_REPORT = 1  # frame received on a report socket
+KIND_TX = 2      # data written to the main socket
+KIND_RX = 3      # frame received on the main socket
+
+SEGMENT_MAGIC = b'XREC'
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct('<4sId')
+RECORD_HEADER = struct.Struct('<dB3xI')
+INDEX_ENTRY = struct.Struct('<dQ')
+
+
+def _segment_path(path, index, ext):
+    return '{}.{:04d}.{}'.format(path, index, ext)
+
+
+class FlightRecorder(object):
+    """
+    Append the raw frames with the host monotonic time to memory-mapped segment files
+    Usage:
+        arm = XArmAPI('192.168.1.185', flight_recorder='/tmp/xarm_185')
+        ...
+        arm.disconnect()
+        recording = Recording('/tmp/xarm_185')
+    """
+    def __init__(self, path, segment_size=64 * 1024 * 1024, index_interval=0.1):
+        self.path = path
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._mm = None
+        self._index_file = None
+        self._offset = 0
+        self._last_index_time = 0
+        self._segment_index = 0
+        existing = glob.glob('{}.*.rec'.format(glob.escape(path)))
+        if existing:
+            # continue after the segments of a previous recording
+            self._segment_index = max(int(p.rsplit('.', 2)[-2]) for p in existing) + 1
+        self.record_count = 0
+
+    def _open_segment(self):
+        rec_path = _segment_path(self.path, self._segment_index, 'rec')
+        self._file = open(rec_path, 'w+b')
+        self._file.truncate(self.segment_size)
+        self._mm = mmap.mmap(self._file.fileno(), self.segment_size)
+        SEGMENT_HEADER.pack_into(self._mm, 0, SEGMENT_MAGIC, SEGMENT_VERSION, time.time())
+        self._offset = SEGMENT_HEADER.size
+        self._index_file = open(_segment_path(self.path, self._segment_index, 'idx'), 'wb')
+        self._last_index_time = 0
+        self._segment_index += 1
+        logger.info('flight recorder segment: {}'.format(rec_path))
+
+    def _close_segment(self):
+        if self._mm is None:
+            return
+        self._mm.flush()
+        self._mm.close()
+        # the unused tail of the preallocated segment is cut
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._index_file.close()
+        self._mm = self._file = self._index_file = None
+
+    def record(self, kind, data):
+        length = len(data)
+        size = RECORD_HEADER.size + length
+        with self._lock:
+            if self._mm is None or self._offset + size > self.segment_size:
+                self._close_segment()
+                if SEGMENT_HEADER.size + size > self.segment_size:
+                    return
+                self._open_segment()
+            now = time.monotonic()
+            offset = self._offset
+            RECORD_HEADER.pack_into(self._mm, offset, now, kind, length)
+            self._mm[offset + RECORD_HEADER.size:offset + size] = data
+            self._offset = offset + size
+            if now - self._last_index_time >= self.index_interval:
+                self._last_index_time = now
+                self._index_file.write(INDEX_ENTRY.pack(now, offset))
+            self.record_count += 1
+
+    def close(self):
+        """
+        Finish the current segment, a later record starts a new segment
+        """
+        with self._lock:
+            self._close_segment()
+
+
+class _Segment(object):
+    def __init__(self, rec_path):
+        self._file = open(rec_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self.mm = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+        self.size = size
+        magic, version, self.wall_time = SEGMENT_HEADER.unpack_from(self.mm, 0) \
+            if size >= SEGMENT_HEADER.size else (b'', 0, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError('{} is not a recording segment'.format(rec_path))
+        self.index_times, self.index_offsets = [], []
+        idx_path = rec_path[:-3] + 'idx'
+        if os.path.exists(idx_path):
+            with open(idx_path, 'rb') as f:
+                data = f.read()
+            for t, offset in INDEX_ENTRY.iter_unpack(data[:len(data) // INDEX_ENTRY.size * INDEX_ENTRY.size]):
+                self.index_times.append(t)
+                self.index_offsets.append(offset)
+        self.start_time = self.index_times[0] if self.index_times else None
+
+    def offset_of(self, start):
+        if start is None or not self.index_times:
+            return SEGMENT_HEADER.size
+        pos = bisect.bisect_right(self.index_times, start) - 1
+        return self.index_offsets[pos] if pos >= 0 else SEGMENT_HEADER.size
+
+    def records(self, offset=SEGMENT_HEADER.size):
+        mm, size = self.mm, self.size
+        while offset + RECORD_HEADER.size <= size:
+            t, kind, length = RECORD_HEADER.unpack_from(mm, offset)
+            if kind == 0:
+                # preallocated tail of a segment which was not closed
+                break
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            yield t, kind, mm[offset + RECORD_HEADER.size:end]
+            offset = end
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._file.close()
+
+
+class Recording(object):
+    """
+    Read a recording of FlightRecorder
+    Usage:
+        recording = Recording('/tmp/xarm_185')
+        for t, kind, frame in recording.frames(kinds=(KIND_REPORT,)):
+            ...
+    """
+    def __init__(self, path):
+        self.path = path
+        paths = sorted(glob.glob('{}.*.rec'.format(glob.escape(path))), key=lambda p: int(p.rsplit('.', 2)[-2]))
+        if not paths:
+            raise FileNotFoundError('no recording: {}'.format(path))
+        self._segments = [_Segment(p) for p in paths]
+
+    @property
+    def start_time(self):
+        if self._segments[0].start_time is not None:
+            return self._segments[0].start_time
+        for t, _, _ in self.frames():
+            return t
+        return 0
+
+    def frames(self, kinds=None, start=None, end=None):
+        """
+        Iterate the records in time order
+        :param kinds: kinds of the records, None means all
+        :param start: host monotonic time of the recording to start from, the index is used to seek
+        :param end: host monotonic time of the recording to stop at
+        :return: generator of (time, kind, frame(bytes))
+        """
+        segments = self._segments
+        if start is not None:
+            # skip the segments which end before start
+            first = 0
+            for i, segment in enumerate(segments):
+                if segment.start_time is not None and segment.start_time <= start:
+                    first = i
+            segments = segments[first:]
+        for segment in segments:
+            for t, kind, frame in segment.records(segment.offset_of(start)):
+                if start is not None and t < start:
+                    continue
+                if end is not None and t > end:
+                    return
+                if kinds is None or kind in kinds:
+                    yield t, kind, bytes(frame)
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import time
+import threading
+import collections
+from ..utils.log import logger
+from ..utils.comm_stats import frame_key
+from ..config.x_config import XCONF
+from .base import Port, TransactionDispatcher
+from .recorder import Recording, KIND_REPORT, KIND_RX
+from .report_queue import ReportQueue
+
+
+class ReplayPort(Port):
+    """
+    Port which plays a recording of FlightRecorder back instead of a socket
+    report-socket: the report frames are fed at the recorded pace divided by speed,
+        speed <= 0 feeds them as fast as they are read (the replay waits for free space in the report queue and in
+        the queues of the report consumers), the port is closed at the end
+    main-socket: every request is answered with the next recorded response of the same function code,
+        the recorded feedback frames are fed at the recorded pace
+    """
+    def __init__(self, recording, server_port, speed=1.0, rxque_max=XCONF.SocketConf.TCP_RX_QUE_MAX,
+                 buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, fb_que=None, start=None,
+                 report_queue=None, report_consumers=None):
+        super(ReplayPort, self).__init__(rxque_max, fb_que)
+        self.recording = recording if isinstance(recording, Recording) else Recording(recording)
+        self.speed = speed
+        self.buffer_size = buffer_size
+        self._start = start
+        self._closed = threading.Event()
+        self._responses = collections.defaultdict(collections.deque)
+        if server_port == XCONF.SocketConf.TCP_CONTROL_PORT or server_port == XCONF.SocketConf.TCP_CONTROL_PORT + 1:
+            self.port_type = 'main-socket'
+            self.rx_parse = TransactionDispatcher(self.rx_que, self.fb_que)
+            for _, _, frame in self.recording.frames(kinds=(KIND_RX,), start=start):
+                if frame[6] != 0xFF:
+                    self._responses[frame_key(frame)].append(frame)
+        else:
+            self.port_type = 'report-socket'
+            if speed <= 0 and (report_queue is None or report_queue.policy != ReportQueue.LOSSLESS):
+                # as fast as possible: the replay waits for the reader instead of dropping
+                report_queue = ReportQueue(ReportQueue.LOSSLESS)
+            self.set_report_queue(report_queue if report_queue is not None else ReportQueue())
+            self.report_consumers = report_consumers if report_consumers is not None else ()
+        self._connected = True
+        self.start()
+
+    def close(self):
+        self._closed.set()
+        super(ReplayPort, self).close()
+        self._connected = False
+
+    def write(self, data):
+        if not self.connected:
+            return -1
+        if self.port_type != 'main-socket':
+            return 0
+        # batched requests are written together
+        offset = 0
+        while offset + 7 <= len(data):
+            end = offset + 6 + (data[offset + 4] << 8 | data[offset + 5])
+            responses = self._responses.get(frame_key(data[offset:end]), None)
+            if responses:
+                frame = bytearray(responses.popleft())
+                frame[0:2] = data[offset:offset + 2]
+                self.rx_parse.put(frame)
+            offset = end
+        return 0
+
+    def run(self):
+        logger.debug('[{}] replay thread start'.format(self.port_type))
+        is_report = self.port_type == 'report-socket'
+        start_time = None
+        host_start_time = time.monotonic()
+        for t, kind, frame in self.recording.frames(kinds=(KIND_REPORT if is_report else KIND_RX,), start=self._start):
+            if self._closed.is_set():
+                break
+            if not is_report and frame[6] != 0xFF:
+                continue
+            if start_time is None:
+                start_time = t
+            if self.speed > 0:
+                delay = (t - start_time) / self.speed - (time.monotonic() - host_start_time)
+                if delay > 0 and self._closed.wait(delay):
+                    break
+            if is_report:
+                if self.speed <= 0:
+                    # the replay has its own thread, it waits for the slowest reader instead of queueing everything
+                    for report_queue in (self.rx_que,) + tuple(consumer.queue for consumer in self.report_consumers):
+                        report_queue.wait_for_space()
+                self._put_report(frame)
+            else:
+                self.rx_parse.put(frame)
+        if is_report and not self._closed.is_set():
+            while not self.rx_que.empty() and not self._closed.wait(0.01):
+                pass
+            logger.info('[{}] replay finished'.format(self.port_type))
+            self._connected = False
+        logger.debug('[{}] replay thread had stopped'.format(self.port_type))
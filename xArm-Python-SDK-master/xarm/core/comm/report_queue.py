@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import time
+import queue
+import threading
+from ..utils.log import logger
+from ..utils.comm_stats import LatencyHistogram
+from ..config.x_config import XCONF
+from .recorder import KIND_REPORT
+
+
+class ReportQueue(queue.Queue):
+    """
+    Queue of the report frames between the socket reader and a consumer, with an overflow policy
+        latest: the oldest frames are dropped, only the latest maxsize frames are kept (default, maxsize=2)
+        lossless: every frame is kept, the queue grows past maxsize while the consumer is behind (overflowed counts
+            the frames queued past maxsize)
+        spill: the frames which do not fit are written to the spill FlightRecorder instead of the queue
+    The reader calls offer, which never waits: the reader may be the thread of an IOHub shared by several arms
+    A producer on its own thread (a replay) may wait for free space with wait_for_space
+    The consumer calls get as with queue.Queue
+    lag: time between offer and get of the delivered frames
+    """
+    LATEST = 'latest'
+    LOSSLESS = 'lossless'
+    SPILL = 'spill'
+    POLICIES = (LATEST, LOSSLESS, SPILL)
+
+    def __init__(self, policy=LATEST, maxsize=None, spill=None, spill_recorded=False, release=None):
+        """
+        :param spill: FlightRecorder of the spilled frames (policy spill)
+        :param spill_recorded: the frames are recorded by the port already, the spilled frames are only counted
+        :param release: release(data) is called with the frames which are dropped, see Port.release
+        """
+        if policy not in self.POLICIES:
+            raise ValueError('report policy must be one of {}'.format(self.POLICIES))
+        if maxsize is None:
+            maxsize = 2 if policy == self.LATEST else XCONF.SocketConf.TCP_RX_QUE_MAX
+        super(ReportQueue, self).__init__(max(maxsize, 1))
+        self.policy = policy
+        self.spill = spill
+        self.spill_recorded = spill_recorded
+        self.release = release
+        self.closed = False
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.overflowed = 0
+        self.max_depth = 0
+        self.lag = LatencyHistogram()
+
+    # the items are (time of the offer, frame), see queue.Queue
+    def _put(self, item):
+        self.queue.append(item)
+        if len(self.queue) > self.max_depth:
+            self.max_depth = len(self.queue)
+
+    def _get(self):
+        item = self.queue.popleft()
+        self.delivered += 1
+        self.lag.record(time.monotonic() - item[0])
+        return item
+
+    def get(self, block=True, timeout=None):
+        return super(ReportQueue, self).get(block, timeout)[1]
+
+    def get_with_time(self, timeout=None):
+        """
+        :return: (time.monotonic() of the offer, frame)
+        """
+        return super(ReportQueue, self).get(True, timeout)
+
+    def _drop(self, data):
+        self.dropped += 1
+        if self.release is not None:
+            self.release(data)
+
+    def offer(self, data, timestamp=None):
+        """
+        Put a frame according to the policy, called by the reader
+        :return: True if the frame was queued
+        """
+        self.received += 1
+        item = (time.monotonic() if timestamp is None else timestamp, data)
+        if self.policy == self.LATEST:
+            with self.mutex:
+                dropped = []
+                while self._qsize() >= self.maxsize:
+                    dropped.append(self.queue.popleft()[1])
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            for old in dropped:
+                self._drop(old)
+            return True
+        if self.policy == self.LOSSLESS:
+            with self.mutex:
+                if self._qsize() >= self.maxsize:
+                    self.overflowed += 1
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            return True
+        try:
+            self.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        if self.spill is not None or self.spill_recorded:
+            if not self.spill_recorded:
+                self.spill.record(KIND_REPORT, data)
+            self.spilled += 1
+            if self.release is not None:
+                self.release(data)
+        else:
+            self._drop(data)
+        return False
+
+    def wait_for_space(self, timeout=None):
+        """
+        Wait until the queue is below maxsize, for a producer on its own thread, never called by a socket reader
+        :return: True if there is free space, False on timeout or if the queue is closed
+        """
+        expired = None if timeout is None else time.monotonic() + timeout
+        with self.not_full:
+            while self._qsize() >= self.maxsize and not self.closed:
+                remaining = None if expired is None else expired - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.not_full.wait(remaining)
+            return not self.closed
+
+    def close(self):
+        # wake up a producer waiting for free space
+        self.closed = True
+        with self.mutex:
+            self.not_full.notify_all()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'depth': self.qsize(),
+            'max_depth': self.max_depth,
+            'received': self.received,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'overflowed': self.overflowed,
+            'lag': self.lag.snapshot(),
+        }
+
+
+class ReportConsumer(object):
+    """
+    Consumer of every report frame (high-rate logging, analysis), called on its own thread in the order of the frames
+    callback(frame, timestamp):
+        frame: ReportFrame if layout is given, else the frame data (bytes or a memoryview)
+        timestamp: time.monotonic() of the reception of the frame
+    The frame data is a receive buffer shared with the other consumers, it is given back to the port after the
+        callback: call frame.detach() (bytes(frame) without layout) to keep a frame past the callback
+    The frames are queued with the policy of ReportQueue, default is spill (the frames beyond maxsize are dropped,
+        or written to spill), lossless keeps every frame in memory while the callback is behind
+    """
+    def __init__(self, callback, policy=ReportQueue.SPILL, maxsize=None, spill=None, layout=None):
+        self.callback = callback
+        self.layout = layout
+        self.queue = ReportQueue(policy, maxsize=maxsize, spill=spill)
+        self.alive = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, data, timestamp):
+        return self.queue.offer(data, timestamp)
+
+    def _run(self):
+        while self.alive:
+            try:
+                timestamp, data = self.queue.get_with_time(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.callback(self.layout.decode(data) if self.layout is not None else data, timestamp)
+            except Exception as e:
+                logger.error('report consumer callback exception: {}'.format(e))
+            finally:
+                if self.queue.release is not None:
+                    self.queue.release(data)
+
+    def stop(self):
+        self.alive = False
+        self.queue.close()
+        if self._thread is not threading.current_thread():
+            self._thread.join(1)
@@ -11,12 +11,15 @@
 import queue
 import os
 import socket
+import select
 import struct
 import platform
 import threading
 import time
 from ..utils.log import logger
-from .base import Port
+from .base import Port, TransactionDispatcher
+from .recorder import KIND_TX
+from .report_queue import ReportQueue
 from ..config.x_config import XCONF
 
 # try:
@@ -49,6 +52,9 @@ from ..config.x_config import XCONF
 #     return False
 
 
+HEARTBEAT_DATA = bytes([0, 0, 0, 1, 0, 2, 0, 0])
+
+
 def get_all_ips():
     addrs = ['localhost', '127.0.0.1']
     addrs = set(addrs)
@@ -71,6 +77,15 @@ def get_all_ips():
     return addrs
 
 
+def _is_writable(sock):
+    # without waiting, poll has no limit on the fd numbers (select has, 1024 on Linux)
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(sock, select.POLLOUT)
+        return bool(poller.poll(0))
+    return bool(select.select((), (sock,), (), 0)[1])
+
+
 class HeartBeatThread(threading.Thread):
     def __init__(self, sock_class):
         threading.Thread.__init__(self)
@@ -79,10 +94,9 @@ class HeartBeatThread(threading.Thread):
 
     def run(self):
         logger.debug('{} heartbeat thread start'.format(self.sock_class.port_type))
-        heat_data = bytes([0, 0, 0, 1, 0, 2, 0, 0])
 
         while self.sock_class.connected:
-            if self.sock_class.write(heat_data) == -1:
+            if self.sock_class.write(HEARTBEAT_DATA) == -1:
                 break
             time.sleep(1)
         logger.debug('{} heartbeat thread had stopped'.format(self.sock_class.port_type))
@@ -90,14 +104,20 @@ class HeartBeatThread(threading.Thread):
 
 class SocketPort(Port):
     def __init__(self, server_ip, server_port, rxque_max=XCONF.SocketConf.TCP_RX_QUE_MAX, heartbeat=False,
-                 buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, forbid_uds=False, fb_que=None):
+                 buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, forbid_uds=False, fb_que=None, io_hub=None, recorder=None,
+                 report_queue=None, report_consumers=None, report_task=None):
         is_main_tcp = server_port == XCONF.SocketConf.TCP_CONTROL_PORT or server_port == XCONF.SocketConf.TCP_CONTROL_PORT + 1
         super(SocketPort, self).__init__(rxque_max, fb_que)
+        self.recorder = recorder
         if is_main_tcp:
             self.port_type = 'main-socket'
+            self.rx_parse = TransactionDispatcher(self.rx_que, self.fb_que)
             # self.com.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, 5)
         else:
             self.port_type = 'report-socket'
+            self.set_report_queue(report_queue if report_queue is not None else ReportQueue())
+            self.report_consumers = report_consumers if report_consumers is not None else ()
+            self.report_task = report_task
         try:
             socket.setdefaulttimeout(1)
             use_uds = False
@@ -137,8 +157,18 @@ class SocketPort(Port):
             # time.sleep(1)
 
             self.com_read = self.com.recv
-            self.com_write = self.com.send
+            self.com_read_into = self.com.recv_into
+            # batched requests may be larger than one send
+            self.com_write = self.com.sendall
             self.write_lock = threading.Lock()
+            if io_hub is not None:
+                # no thread of its own, the socket is read and the heartbeat is sent by the hub
+                self.io_hub = io_hub
+                io_hub.register(self)
+                if heartbeat:
+                    # sent by the selector thread itself, it never waits, see _send_heartbeat
+                    self._heartbeat_timer = io_hub.call_every(1, self._send_heartbeat, delay=0)
+                return
             self.start()
             if heartbeat:
                 self.heartbeat_thread = HeartBeatThread(self)
@@ -148,3 +178,25 @@ class SocketPort(Port):
             # logger.error('{} connect {}:{} failed, {}'.format(self.port_type, server_ip, server_port, e))
             self._connected = False
 
+    def _send_heartbeat(self):
+        # the heartbeat is skipped while a request is written (the connection is busy anyway)
+        # or while the send buffer of a stalled peer is full, the next one is 1s later
+        if not self.connected:
+            self._heartbeat_timer.cancel()
+            return
+        if not self.write_lock.acquire(False):
+            return
+        try:
+            if _is_writable(self.com):
+                if self.recorder is not None:
+                    self.recorder.record(KIND_TX, HEARTBEAT_DATA)
+                sent = self.com.send(HEARTBEAT_DATA)
+                if sent < len(HEARTBEAT_DATA):
+                    # writable means much more free space than a heartbeat, not expected
+                    self.com_write(HEARTBEAT_DATA[sent:])
+        except Exception as e:
+            self._connected = False
+            self._heartbeat_timer.cancel()
+            logger.error("[{}] send error: {}".format(self.port_type, e))
+        finally:
+            self.write_lock.release()
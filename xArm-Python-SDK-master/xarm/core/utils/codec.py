@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2020, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Bulk codec with cached struct.Struct instances
+code: 'f'(fp32), 'i'(int32), 'I'(u32), 'H'(u16), 'h'(int16), 'B'(u8)
+Floats/int32 of the protocol are little-endian, u16/u32 are big-endian
+"""
+
+import struct
+try:
+    import numpy as np
+except:
+    np = None
+
+# below this count the struct path is faster than building a numpy array
+NUMPY_MIN_COUNT = 64
+
+_STRUCTS = {}
+
+
+def get_struct(code, count=1, is_big_endian=False):
+    key = (code, count, is_big_endian)
+    st = _STRUCTS.get(key)
+    if st is None:
+        st = struct.Struct('{}{}{}'.format('>' if is_big_endian else '<', count, code))
+        _STRUCTS[key] = st
+    return st
+
+
+def as_buffer(data):
+    """lists of ints (as returned by UxbusCmd) are converted once, buffers are used as they are"""
+    return data if isinstance(data, (bytes, bytearray, memoryview)) else bytes(data)
+
+
+def pack(code, values, count=None, is_big_endian=False):
+    count = len(values) if count is None else count
+    return get_struct(code, count, is_big_endian).pack(*values[:count])
+
+
+def pack_into(code, buffer, offset, values, count=None, is_big_endian=False):
+    """pack into a caller buffer, return the offset after the packed data"""
+    count = len(values) if count is None else count
+    st = get_struct(code, count, is_big_endian)
+    st.pack_into(buffer, offset, *values[:count])
+    return offset + st.size
+
+
+def unpack(code, data, count, offset=0, is_big_endian=False):
+    return list(get_struct(code, count, is_big_endian).unpack_from(as_buffer(data), offset))
+
+
+def unpack_from(code, data, count, offset=0, is_big_endian=False):
+    """same as unpack but return the tuple from struct without converting it to a list"""
+    return get_struct(code, count, is_big_endian).unpack_from(as_buffer(data), offset)
+
+
+def _dtype(code, is_big_endian):
+    return np.dtype(code).newbyteorder('>' if is_big_endian else '<')
+
+
+def unpack_array(code, data, count, offset=0, is_big_endian=False):
+    """
+    Large arrays are returned as a read-only numpy view of data when numpy is available, lists otherwise
+    """
+    if np is not None and count >= NUMPY_MIN_COUNT:
+        return np.frombuffer(as_buffer(data), dtype=_dtype(code, is_big_endian), count=count, offset=offset)
+    return unpack(code, data, count, offset=offset, is_big_endian=is_big_endian)
+
+
+def pack_array(code, values, is_big_endian=False):
+    if np is not None and isinstance(values, np.ndarray):
+        return values.astype(_dtype(code, is_big_endian), copy=False).tobytes()
+    return pack(code, values, is_big_endian=is_big_endian)
+
+
+def fp32s_to_bytes(values, count=None, is_big_endian=False):
+    return pack('f', values, count, is_big_endian)
+
+
+def bytes_to_fp32s(data, count, offset=0, is_big_endian=False):
+    return unpack('f', data, count, offset, is_big_endian)
+
+
+def int32s_to_bytes(values, count=None, is_big_endian=False):
+    return pack('i', values, count, is_big_endian)
+
+
+def bytes_to_int32s(data, count, offset=0, is_big_endian=False):
+    return unpack('i', data, count, offset, is_big_endian)
+
+
+def u16s_to_bytes(values, count=None):
+    return pack('H', values, count, True)
+
+
+def bytes_to_u16s(data, count, offset=0):
+    return unpack('H', data, count, offset, True)
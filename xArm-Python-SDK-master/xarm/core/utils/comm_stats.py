@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Communication statistics of the command socket, kept per function code
+"""
+
+import time
+import threading
+from ..config.x_config import XCONF
+
+FUNCODE_NAMES = {v: k for k, v in vars(XCONF.UxbusReg).items() if not k.startswith('_') and isinstance(v, int)}
+
+# codes which are the state of the arm, not a communication error
+_NOT_COMM_ERRORS = (0, XCONF.UxbusState.ERR_CODE, XCONF.UxbusState.WAR_CODE)
+# requests of the standard Modbus TCP protocol are keyed by STANDARD_MODBUS_KEY | modbus function code
+STANDARD_MODBUS_KEY = 0x100
+
+
+def funcode_name(key):
+    if key & STANDARD_MODBUS_KEY:
+        return 'MODBUS_0x{:02X}'.format(key & 0xFF)
+    return FUNCODE_NAMES.get(key, str(key))
+
+
+def frame_key(data):
+    # key of a received frame, byte 6 is the function code of the private protocol
+    if data[2] == 0 and data[3] == 0:
+        return STANDARD_MODBUS_KEY | data[7]
+    return data[6]
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear (HDR style) histogram of durations with microsecond resolution
+    Values below 2 * SUB_BUCKETS us are exact, above that every power of two is split
+    into SUB_BUCKETS buckets, so the relative error of a percentile is below 1 / SUB_BUCKETS
+    """
+    SUB_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BITS
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, us):
+        if us < 2 * cls.SUB_BUCKETS:
+            return us
+        shift = us.bit_length() - cls.SUB_BITS - 1
+        return shift * cls.SUB_BUCKETS + (us >> shift)
+
+    @classmethod
+    def _value(cls, index):
+        # middle of the bucket
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        mantissa = index - shift * cls.SUB_BUCKETS
+        return (mantissa << shift) + ((1 << shift) - 1) / 2
+
+    def record(self, seconds):
+        us = int(seconds * 1000000) if seconds > 0 else 0
+        index = self._index(us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        if self.count == 0 or us < self.min:
+            self.min = us
+        if us > self.max:
+            self.max = us
+        self.count += 1
+        self.total += us
+
+    def percentile(self, p):
+        """
+        :param p: 0 ~ 100
+        :return: duration in seconds
+        """
+        if self.count == 0:
+            return 0
+        target = max(1, self.count * p / 100)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(max(self._value(index), self.min), self.max) / 1000000
+        return self.max / 1000000
+
+    def snapshot(self):
+        """
+        :return: dict, the durations are in milliseconds
+        """
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count / 1000, 3),
+            'min': self.min / 1000,
+            'p50': round(self.percentile(50) * 1000, 3),
+            'p90': round(self.percentile(90) * 1000, 3),
+            'p99': round(self.percentile(99) * 1000, 3),
+            'p999': round(self.percentile(99.9) * 1000, 3),
+            'max': self.max / 1000,
+        }
+
+
+class FuncodeStats(object):
+    __slots__ = ('funcode', 'count', 'timeouts', 'errors', 'stale', 'send', 'rtt', 'lock_wait')
+
+    def __init__(self, funcode):
+        self.funcode = funcode
+        self.count = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.stale = 0
+        self.send = LatencyHistogram()
+        self.rtt = LatencyHistogram()
+        self.lock_wait = LatencyHistogram()
+
+    def snapshot(self, elapsed):
+        return {
+            'funcode': self.funcode,
+            'count': self.count,
+            'rate': round(self.count / elapsed, 3) if elapsed > 0 else 0,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'stale': self.stale,
+            'send': self.send.snapshot(),
+            'rtt': self.rtt.snapshot(),
+            'lock_wait': self.lock_wait.snapshot(),
+        }
+
+
+class CommStats(object):
+    """
+    Counters and latency histograms of the requests, keyed by function code
+        send: time spent writing the request to the socket
+        rtt: from the end of the write to the arrival of the response
+        lock_wait: time waited for the command lock before the request was sent
+        timeouts: requests without a response in time
+        errors: responses rejected by the protocol checks (protocol id, function code, invalid)
+        stale: responses dropped because nobody waited for them any more (ERR_NUM)
+    """
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._funcodes = {}
+        self._start_time = time.monotonic()
+
+    def _get(self, funcode):
+        stats = self._funcodes.get(funcode, None)
+        if stats is None:
+            stats = self._funcodes.setdefault(funcode, FuncodeStats(funcode))
+        return stats
+
+    def set_lock_wait(self, seconds):
+        # the function code is not known when the lock is taken, kept until the request of this thread is sent
+        self._local.lock_wait = seconds
+
+    def record_send(self, funcode, seconds=None):
+        lock_wait = getattr(self._local, 'lock_wait', None)
+        self._local.lock_wait = None
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._get(funcode)
+            stats.count += 1
+            if seconds is not None:
+                stats.send.record(seconds)
+            if lock_wait is not None:
+                stats.lock_wait.record(lock_wait)
+
+    def record_response(self, funcode, rtt, code):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._get(funcode)
+            if code == XCONF.UxbusState.ERR_TOUT:
+                stats.timeouts += 1
+                return
+            if code not in _NOT_COMM_ERRORS:
+                stats.errors += 1
+            stats.rtt.record(rtt)
+
+    def record_stale(self, data):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(frame_key(data)).stale += 1
+
+    def reset(self):
+        with self._lock:
+            self._funcodes = {}
+            self._start_time = time.monotonic()
+
+    def snapshot(self, reset=False):
+        """
+        :param reset: clear the statistics after the snapshot
+        :return: {
+            'elapsed': seconds since the start (or the last reset),
+            'total': {'count', 'rate', 'timeouts', 'errors', 'stale'},
+            'funcodes': {name: {'funcode', 'count', 'rate', 'timeouts', 'errors', 'stale', 'send', 'rtt', 'lock_wait'}}
+        }
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self._start_time
+            funcodes = {}
+            total = {'count': 0, 'rate': 0, 'timeouts': 0, 'errors': 0, 'stale': 0}
+            for funcode in sorted(self._funcodes):
+                stats = self._funcodes[funcode]
+                funcodes[funcode_name(funcode)] = stats.snapshot(elapsed)
+                for key in ('count', 'timeouts', 'errors', 'stale'):
+                    total[key] += getattr(stats, key)
+            total['rate'] = round(total['count'] / elapsed, 3) if elapsed > 0 else 0
+            if reset:
+                self._funcodes = {}
+                self._start_time = time.monotonic()
+        return {'elapsed': round(elapsed, 3), 'total': total, 'funcodes': funcodes}
@@ -9,69 +9,51 @@
 #
 
 import struct
+from . import codec
 
 
 def fp32_to_bytes(data, is_big_endian=False):
     """小端字节序"""
-    return bytes(struct.pack('>f' if is_big_endian else '<f', data))
+    return codec.get_struct('f', 1, is_big_endian).pack(data)
 
 
 def int32_to_bytes(data, is_big_endian=False):
     """小端字节序"""
-    return bytes(struct.pack('>i' if is_big_endian else '<i', data))
+    return codec.get_struct('i', 1, is_big_endian).pack(data)
 
 
 def int32s_to_bytes(data, n):
     """小端字节序"""
     assert n > 0
-    ret = int32_to_bytes(data[0])
-    for i in range(1, n):
-        ret += int32_to_bytes(data[i])
-    return ret
+    return codec.int32s_to_bytes(data, n)
 
 
 def bytes_to_fp32(data):
     """小端字节序"""
-    byte = bytes([data[0]])
-    byte += bytes([data[1]])
-    byte += bytes([data[2]])
-    byte += bytes([data[3]])
-    ret = struct.unpack('<f', byte)
-    return ret[0]
+    return codec.get_struct('f').unpack_from(codec.as_buffer(data[:4]))[0]
 
 
 def fp32s_to_bytes(data, n):
     """小端字节序"""
     assert n > 0
-    ret = fp32_to_bytes(data[0])
-    for i in range(1, n):
-        ret += fp32_to_bytes(data[i])
-    return ret
+    return codec.fp32s_to_bytes(data, n)
 
 
 def bytes_to_fp32s(data, n):
     """小端字节序"""
-    ret = [0] * n
-    for i in range(n):
-        ret[i] = bytes_to_fp32(data[i * 4:i * 4 + 4])
-    return ret
+    return codec.bytes_to_fp32s(data, n)
 
 
 def u16_to_bytes(data):
     """大端字节序"""
-    bts = bytes([data // 256 % 256])
-    bts += bytes([data % 256])
-    return bts
+    return codec.get_struct('H', 1, True).pack(data & 0xFFFF)
 
 
 def u16s_to_bytes(data, num):
     """大端字节序"""
-    bts = b''
-    if num != 0:
-        bts = u16_to_bytes(data[0])
-        for i in range(1, num):
-            bts += u16_to_bytes(data[i])
-    return bts
+    if num == 0:
+        return b''
+    return codec.u16s_to_bytes([val & 0xFFFF for val in data[:num]], num)
 
 
 def bytes_to_u16(data):
@@ -82,18 +64,12 @@ def bytes_to_u16(data):
 
 def bytes_to_u16s(data, n):
     """大端字节序"""
-    ret = [0] * n
-    for i in range(n):
-        ret[i] = bytes_to_u16(data[i * 2: i * 2 + 2])
-    return ret
+    return codec.bytes_to_u16s(data, n)
 
 
 def bytes_to_16s(data, n):
     """大端字节序"""
-    ret = [0] * n
-    for i in range(n):
-        ret[i] = struct.unpack('>h', bytes(data[i * 2: i * 2 + 2]))[0]
-    return ret
+    return codec.unpack('h', data, n, is_big_endian=True)
 
 
 def bytes_to_u32(data):
@@ -108,12 +84,7 @@ def bytes_to_u64(data):
 
 
 def bytes_to_num32(data, fmt='>l'):
-    byte = bytes([data[0]])
-    byte += bytes([data[1]])
-    byte += bytes([data[2]])
-    byte += bytes([data[3]])
-    ret = struct.unpack(fmt, byte)
-    return ret[0]
+    return struct.unpack(fmt, codec.as_buffer(data[:4]))[0]
 
 
 def bytes_to_long_big(data):
@@ -9,3 +9,4 @@
 
 from .uxbus_cmd_ser import UxbusCmdSer
 from .uxbus_cmd_tcp import UxbusCmdTcp
+from .uxbus_cmd_async import AsyncUxbusCmd
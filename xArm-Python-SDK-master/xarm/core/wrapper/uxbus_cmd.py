@@ -11,14 +11,25 @@ import time
 import threading
 import functools
 from ..utils import convert
+from ..utils.comm_stats import CommStats
 from ..config.x_config import XCONF
 
 
 def lock_require(func):
     @functools.wraps(func)
     def decorator(*args, **kwargs):
-        with args[0].lock:
+        lock = args[0].lock
+        if lock.acquire(False):
+            wait = 0
+        else:
+            start = time.perf_counter()
+            lock.acquire()
+            wait = time.perf_counter() - start
+        try:
+            args[0].stats.set_lock_wait(wait)
             return func(*args, **kwargs)
+        finally:
+            lock.release()
     return decorator
 
 
@@ -35,6 +46,7 @@ class UxbusCmd(object):
         self._cmd_num = 0
         self._debug = False
         self.lock = threading.Lock()
+        self.stats = CommStats()
         self._G_TOUT = XCONF.UxbusConf.GET_TIMEOUT / 1000
         self._S_TOUT = XCONF.UxbusConf.SET_TIMEOUT / 1000
         self._last_comm_time = time.monotonic()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Awaitable UxbusCmd over AsyncSocketPort
+Every command of UxbusCmd/UxbusCmdTcp is a coroutine here, the protocol code is not duplicated:
+the command body runs until it needs a response, the request is already sent at that point,
+the response is awaited and the body is replayed with the received responses (requests are not sent again)
+"""
+
+import asyncio
+import functools
+from .uxbus_cmd import UxbusCmd
+from .uxbus_cmd_tcp import UxbusCmdTcp
+from ..config.x_config import XCONF
+
+
+class AsyncUxbusCmd(UxbusCmdTcp):
+    def __init__(self, arm_port, set_feedback_key_tranid=None):
+        super(AsyncUxbusCmd, self).__init__(arm_port, set_feedback_key_tranid=set_feedback_key_tranid)
+        # requests of different coroutines are always in flight at the same time
+        self._pipelined = True
+
+    def set_pipelined(self, pipelined):
+        return 0 if pipelined else -1
+
+    async def _call(self, func, *args, **kwargs):
+        responses = []
+        while True:
+            done, value = self._run_deferred(func, (self,) + args, kwargs, responses)
+            if done:
+                return value
+            rx_data = await self.arm_port.wait_response(value[1], value[3])
+            responses.append(self._deferred_response(value, rx_data))
+
+    def recv_modbus_response(self, t_unit_id, t_trans_id, num, timeout, t_prot_id=-1, ret_raw=False):
+        if getattr(self._deferred, 'responses', None) is None:
+            raise RuntimeError('AsyncUxbusCmd commands must be awaited')
+        return super(AsyncUxbusCmd, self).recv_modbus_response(t_unit_id, t_trans_id, num, timeout, t_prot_id=t_prot_id, ret_raw=ret_raw)
+
+    async def run_batch(self, calls):
+        # the requests of concurrent coroutines are in flight together, so one round trip as well
+        return list(await asyncio.gather(*[getattr(self, name)(*args, **kwargs) for name, args, kwargs in calls]))
+
+    async def save_traj(self, filename, wait_time=2, feedback_key=None):
+        ret = await self._call(UxbusCmd.save_traj, filename, wait_time=0, feedback_key=feedback_key)
+        await asyncio.sleep(wait_time)
+        return ret
+
+    async def load_traj(self, filename, wait_time=2, feedback_key=None):
+        ret = await self._call(UxbusCmd.load_traj, filename, wait_time=0, feedback_key=feedback_key)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return ret
+
+    async def set_modbus_baudrate(self, baudrate):
+        if baudrate not in self.BAUDRATES:
+            return [-1, -1]
+        ret = await self.tgpio_addr_r16(XCONF.ServoConf.MODBUS_BAUDRATE & 0x0FFF)
+        if ret[0] == 0:
+            baud_val = self.BAUDRATES.index(baudrate)
+            if ret[1] != baud_val:
+                await self.tgpio_addr_w16(0x1A0B, baud_val)
+                await asyncio.sleep(0.3)
+                return await self.tgpio_addr_w16(XCONF.ServoConf.SOFT_REBOOT, 1)
+        return ret[:2]
+
+
+def _awaitable(func):
+    @functools.wraps(func)
+    def decorator(self, *args, **kwargs):
+        if getattr(self._deferred, 'responses', None) is not None:
+            # nested command of a running command body
+            return func(self, *args, **kwargs)
+        return self._call(func, *args, **kwargs)
+    return decorator
+
+
+# methods which do not talk to the controller stay synchronous
+_SYNC_METHODS = {
+    'set_timeout', 'set_debug', 'send_modbus_request', 'recv_modbus_response',
+    'set_protocol_identifier', 'get_protocol_identifier', 'set_pipelined',
+    'check_protocol_header', 'check_private_protocol',
+}
+
+for _name in set(vars(UxbusCmd)) | set(vars(UxbusCmdTcp)):
+    _func = vars(UxbusCmdTcp).get(_name, vars(UxbusCmd).get(_name))
+    if _name.startswith('_') or _name in _SYNC_METHODS or _name in vars(AsyncUxbusCmd) \
+            or not callable(_func) or isinstance(_func, (staticmethod, classmethod, type)):
+        continue
+    setattr(AsyncUxbusCmd, _name, _awaitable(_func))
@@ -30,6 +30,7 @@ class UxbusCmdSer(UxbusCmd):
         self.toid = toid
         arm_port.flush(fromid, toid)
         self._has_err_warn = False
+        self._sent_at = (0, 0)
 
     @property
     def has_err_warn(self):
@@ -70,7 +71,13 @@ class UxbusCmdSer(UxbusCmd):
         self.arm_port.flush()
         if self._debug:
             debug_log_datas(send_data, label='send')
-        return self.arm_port.write(send_data)
+        start = time.perf_counter()
+        ret = self.arm_port.write(send_data)
+        if ret == 0:
+            end = time.perf_counter()
+            self.stats.record_send(reg, end - start)
+            self._sent_at = (reg, end)
+        return ret
     
     def recv_modbus_response(self, t_funcode, t_trans_id, num, timeout, t_prot_id=-1, ret_raw=False):
         ret = [0] * 254 if num == -1 else [0] * (num + 1)
@@ -89,6 +96,8 @@ class UxbusCmdSer(UxbusCmd):
                     if i >= length:
                         break
                     ret[i + 1] = rx_data[i + 4]
+                self.stats.record_response(self._sent_at[0], time.perf_counter() - self._sent_at[1], ret[0])
                 return ret
             time.sleep(0.001)
+        self.stats.record_response(self._sent_at[0], 0, ret[0])
         return ret
@@ -10,13 +10,16 @@
 
 import time
 import struct
+import threading
 from ..utils import convert
+from ..utils.comm_stats import STANDARD_MODBUS_KEY
 from .uxbus_cmd import UxbusCmd, lock_require
 from ..config.x_config import XCONF
 
 STANDARD_MODBUS_TCP_PROTOCOL = 0x00
 PRIVATE_MODBUS_TCP_PROTOCOL = 0x02
 TRANSACTION_ID_MAX = 65535    # cmd序号 最大值
+MODBUS_TCP_HEADER = struct.Struct('>HHHB')  # trans_id, prot_id, length, unit_id
 
 
 def debug_log_datas(datas, label=''):
@@ -28,6 +31,11 @@ def debug_log_datas(datas, label=''):
     print()
 
 
+class _ResponseRequired(BaseException):
+    # raised by a deferred command body, BaseException so that "except Exception" of the body does not swallow it
+    pass
+
+
 class UxbusCmdTcp(UxbusCmd):
     def __init__(self, arm_port, set_feedback_key_tranid=None):
         super(UxbusCmdTcp, self).__init__(set_feedback_key_tranid=set_feedback_key_tranid)
@@ -36,6 +44,18 @@ class UxbusCmdTcp(UxbusCmd):
         self._last_comm_time = time.monotonic()
         self._transaction_id = 1
         self._protocol_identifier = PRIVATE_MODBUS_TCP_PROTOCOL
+        self._pipelined = False
+        # responses are delivered to per-transaction waiters if the port can demultiplex them
+        self._dispatch = hasattr(arm_port.rx_parse, 'register')
+        if self._dispatch:
+            # nobody reads rx_que any more, stale responses (e.g. after a timeout) are counted and dropped
+            arm_port.rx_parse.drop_unmatched = True
+            arm_port.rx_parse.stats = self.stats
+        # trans_id => (stats key, time the request was written)
+        self._sent_at = {}
+        # deferred execution (batch / asyncio): the command body is run until it needs a response
+        # and replayed with the received responses, requests already sent are not sent again
+        self._deferred = threading.local()
 
     @property
     def has_err_warn(self):
@@ -54,10 +74,107 @@ class UxbusCmdTcp(UxbusCmd):
     
     def get_protocol_identifier(self):
         return self._protocol_identifier
+
+    @property
+    def pipelined(self):
+        return self._pipelined
+
+    @property
+    def stale_response_count(self):
+        return self.arm_port.rx_parse.unmatched_count if self._dispatch else 0
+
+    def set_pipelined(self, pipelined):
+        """
+        Pipelined mode: responses are demultiplexed by transaction id and the command lock is
+        released while waiting, so commands from different threads can be in flight at the same time
+        """
+        if pipelined and not self._dispatch:
+            # the port can not demultiplex responses
+            return -1
+        self._pipelined = bool(pipelined)
+        return 0
+
+    def _wait_response_unlocked(self, trans_id, timeout):
+        # callers hold self.lock (lock_require), release it so that other requests can be sent meanwhile
+        try:
+            self.lock.release()
+            released = True
+        except RuntimeError:
+            released = False
+        try:
+            return self.arm_port.wait_response(trans_id, timeout)
+        finally:
+            if released:
+                self.lock.acquire()
     
     def _get_trans_id(self):
+        responses = getattr(self._deferred, 'responses', None)
+        if responses is not None and self._deferred.step < len(responses):
+            return responses[self._deferred.step][0]
         return self._transaction_id
 
+    def _run_deferred(self, func, args, kwargs, responses, frames=None):
+        """
+        Run a command body with the responses received so far
+        Return (True, result) if it finished, or (False, pending) if it needs the response of the request it sent
+        If frames is a bytearray, the requests are appended to it instead of being written
+        """
+        state = self._deferred
+        state.responses, state.step, state.frames, state.pending = responses, 0, frames, None
+        try:
+            return True, func(*args, **kwargs)
+        except _ResponseRequired:
+            return False, state.pending
+        finally:
+            state.responses = state.frames = state.pending = None
+
+    def _deferred_response(self, pending, rx_data):
+        t_unit_id, t_trans_id, num, timeout, prot_id, ret_raw = pending
+        ret = [0] * 320 if num == -1 else [0] * (num + 1)
+        ret[0] = XCONF.UxbusState.ERR_TOUT
+        if rx_data != -1:
+            data = self._parse_modbus_response(rx_data, ret, t_unit_id, t_trans_id, prot_id, ret_raw)
+            ret = ret if data is None else data
+        self._record_response(t_trans_id, ret[0])
+        return t_trans_id, ret
+
+    def _record_response(self, trans_id, code):
+        sent_at = self._sent_at.pop(trans_id, None)
+        if sent_at is not None:
+            self.stats.record_response(sent_at[0], time.perf_counter() - sent_at[1], code)
+
+    def run_batch(self, calls):
+        """
+        Run several commands, the requests are written with one socket write per round
+        (one round unless a command sends further requests after a response), the responses are waited together
+        :param calls: [(name, args, kwargs), ...]
+        :return: the results of the commands in the same order
+        """
+        if not self._dispatch:
+            return [getattr(self, name)(*args, **kwargs) for name, args, kwargs in calls]
+        results = [None] * len(calls)
+        responses = [[] for _ in calls]
+        waiting = list(range(len(calls)))
+        while waiting:
+            frames = bytearray()
+            pendings = []
+            for index in waiting:
+                name, args, kwargs = calls[index]
+                done, value = self._run_deferred(getattr(self, name), args, kwargs, responses[index], frames)
+                if done:
+                    results[index] = value
+                else:
+                    pendings.append((index, value))
+            if frames and self.arm_port.write(bytes(frames)) != 0:
+                for _, pending in pendings:
+                    self.arm_port.unregister_waiter(pending[1])
+                return [ret if ret is not None else [XCONF.UxbusState.ERR_NOTTCP] for ret in results]
+            for index, pending in pendings:
+                rx_data = self.arm_port.wait_response(pending[1], pending[3])
+                responses[index].append(self._deferred_response(pending, rx_data))
+            waiting = [index for index, _ in pendings]
+        return results
+
     def check_protocol_header(self, data, t_trans_id, t_prot_id, t_unit_id):
         trans_id = convert.bytes_to_u16(data[0:2])
         prot_id = convert.bytes_to_u16(data[2:4])
@@ -88,28 +205,67 @@ class UxbusCmdTcp(UxbusCmd):
         return 0
     
     def send_modbus_request(self, unit_id, pdu_data, pdu_len, prot_id=-1, t_id=None):
+        responses = getattr(self._deferred, 'responses', None)
+        if responses is not None and self._deferred.step < len(responses):
+            # replayed command body, the request was sent before
+            return responses[self._deferred.step][0]
         trans_id = self._transaction_id if t_id is None else t_id
         prot_id = self._protocol_identifier if prot_id < 0 else prot_id
-        send_data = convert.u16_to_bytes(trans_id)
-        send_data += convert.u16_to_bytes(prot_id)
-        send_data += convert.u16_to_bytes(pdu_len + 1)
-        send_data += bytes([unit_id])
-        for i in range(pdu_len):
-            send_data += bytes([pdu_data[i]])
-        self.arm_port.flush()
+        send_data = MODBUS_TCP_HEADER.pack(trans_id, prot_id, pdu_len + 1, unit_id)
+        if pdu_len > 0:
+            send_data += bytes(pdu_data[:pdu_len])
+        stats_key = STANDARD_MODBUS_KEY | pdu_data[0] if prot_id == STANDARD_MODBUS_TCP_PROTOCOL and pdu_len > 0 else unit_id
+        frames = getattr(self._deferred, 'frames', None)
+        if frames is not None:
+            # batched, written together with the other requests of the batch
+            self.arm_port.register_waiter(trans_id)
+            frames += send_data
+            self.stats.record_send(stats_key)
+            self._sent_at[trans_id] = (stats_key, time.perf_counter())
+            if t_id is None:
+                self._transaction_id = self._transaction_id % TRANSACTION_ID_MAX + 1
+            return trans_id
+        if self._dispatch:
+            # registered before writing, the response may arrive before write returns
+            self.arm_port.register_waiter(trans_id)
+        else:
+            self.arm_port.flush()
         if self._debug:
             debug_log_datas(send_data, label='send({})'.format(unit_id))
+        start = time.perf_counter()
         ret = self.arm_port.write(send_data)
         if ret != 0:
+            if self._dispatch:
+                self.arm_port.unregister_waiter(trans_id)
             return -1
+        end = time.perf_counter()
+        self.stats.record_send(stats_key, end - start)
+        self._sent_at[trans_id] = (stats_key, end)
         if t_id is None:
             self._transaction_id = self._transaction_id % TRANSACTION_ID_MAX + 1
         return trans_id
     
     def recv_modbus_response(self, t_unit_id, t_trans_id, num, timeout, t_prot_id=-1, ret_raw=False):
         prot_id = self._protocol_identifier if t_prot_id < 0 else t_prot_id
+        responses = getattr(self._deferred, 'responses', None)
+        if responses is not None:
+            if self._deferred.step < len(responses):
+                ret = responses[self._deferred.step][1]
+                self._deferred.step += 1
+                return ret
+            self._deferred.pending = (t_unit_id, t_trans_id, num, timeout, prot_id, ret_raw)
+            raise _ResponseRequired
         ret = [0] * 320 if num == -1 else [0] * (num + 1)
         ret[0] = XCONF.UxbusState.ERR_TOUT
+        if self._dispatch:
+            if self._pipelined:
+                rx_data = self._wait_response_unlocked(t_trans_id, timeout)
+            else:
+                rx_data = self.arm_port.wait_response(t_trans_id, timeout)
+            if rx_data != -1:
+                ret = self._parse_modbus_response(rx_data, ret, t_unit_id, t_trans_id, prot_id, ret_raw)
+            self._record_response(t_trans_id, ret[0])
+            return ret
         expired = time.monotonic() + timeout
         while time.monotonic() < expired:
             remaining = expired - time.monotonic()
@@ -117,37 +273,47 @@ class UxbusCmdTcp(UxbusCmd):
             if rx_data == -1:
                 time.sleep(0.001)
                 continue
-            self._last_comm_time = time.monotonic()
-            if self._debug:
-                debug_log_datas(rx_data, label='recv({})'.format(t_unit_id))
-            code = self.check_protocol_header(rx_data, t_trans_id, prot_id, t_unit_id)
-            if code != 0:
-                if code != XCONF.UxbusState.ERR_NUM:
-                    ret[0] = code
-                    return ret
-                else:
-                    continue
-            if prot_id != STANDARD_MODBUS_TCP_PROTOCOL and not ret_raw:
-                # Private Modbus TCP Protocol
-                ret[0] = self.check_private_protocol(rx_data)
-                num = convert.bytes_to_u16(rx_data[4:6]) - 2
-                ret = ret[:num + 1] if len(ret) >= num + 1 else [ret[0]] * (num + 1)
-                length = len(rx_data) - 8
-                for i in range(num):
-                    if i >= length:
-                        break
-                    ret[i + 1] = rx_data[i + 8]       
+            data = self._parse_modbus_response(rx_data, ret, t_unit_id, t_trans_id, prot_id, ret_raw)
+            if data is None:
+                self.stats.record_stale(rx_data)
+                continue
+            self._record_response(t_trans_id, data[0])
+            return data
+        self._record_response(t_trans_id, ret[0])
+        return ret
+
+    def _parse_modbus_response(self, rx_data, ret, t_unit_id, t_trans_id, prot_id, ret_raw=False):
+        # return None if the frame belongs to another transaction
+        self._last_comm_time = time.monotonic()
+        if self._debug:
+            debug_log_datas(rx_data, label='recv({})'.format(t_unit_id))
+        code = self.check_protocol_header(rx_data, t_trans_id, prot_id, t_unit_id)
+        if code != 0:
+            if code != XCONF.UxbusState.ERR_NUM:
+                ret[0] = code
+                return ret
             else:
-                # Standard Modbus TCP Protocol
-                ret[0] = 0
-                num = convert.bytes_to_u16(rx_data[4:6]) + 6
-                ret = ret[:num + 1] if len(ret) >= num + 1 else [ret[0]] * (num + 1)
-                length = len(rx_data)
-                for i in range(num):
-                    if i >= length:
-                        break
-                    ret[i + 1] = rx_data[i]
-            return ret
+                return None
+        if prot_id != STANDARD_MODBUS_TCP_PROTOCOL and not ret_raw:
+            # Private Modbus TCP Protocol
+            ret[0] = self.check_private_protocol(rx_data)
+            num = convert.bytes_to_u16(rx_data[4:6]) - 2
+            ret = ret[:num + 1] if len(ret) >= num + 1 else [ret[0]] * (num + 1)
+            length = len(rx_data) - 8
+            for i in range(num):
+                if i >= length:
+                    break
+                ret[i + 1] = rx_data[i + 8]
+        else:
+            # Standard Modbus TCP Protocol
+            ret[0] = 0
+            num = convert.bytes_to_u16(rx_data[4:6]) + 6
+            ret = ret[:num + 1] if len(ret) >= num + 1 else [ret[0]] * (num + 1)
+            length = len(rx_data)
+            for i in range(num):
+                if i >= length:
+                    break
+                ret[i + 1] = rx_data[i]
         return ret
 
     # def send_hex_request(self, send_data):
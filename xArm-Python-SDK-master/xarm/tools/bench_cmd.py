@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2020, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Command round trips of XArmAPI against the controller simulator (xarm/tools/simulator.py), no robot needed
+Pipelined mode (XArmAPI(pipelined=True), see UxbusCmdTcp.set_pipelined): several threads call get_state at the
+    same time, the commands per second of the default mode and of the pipelined mode are compared
+Response wait: sequential get_state calls, the latency histogram of the per-transaction waiters (default, see
+    TransactionDispatcher) against the polling of rx_que (the wait of UxbusCmdTcp before the waiters, kept for the
+    ports without a dispatcher)
+The simulator answers after --delay seconds (the requests received together are answered together, as a
+    controller behind a link with that latency), the report socket is not connected
+Usage:
+    python -m xarm.tools.bench_cmd
+    python -m xarm.tools.bench_cmd --threads 8 --calls 100 --delay 0.002
+    python -m xarm.tools.bench_cmd --latency-calls 5000 --latency-delay 0
+The exit status is 1 if a command failed
+"""
+
+import sys
+import time
+import argparse
+import threading
+from ..wrapper import XArmAPI
+from ..core.utils.comm_stats import LatencyHistogram
+from .simulator import ControllerSimulator, SimulatedArm
+
+
+def connect(host, **kwargs):
+    return XArmAPI(host, enable_report=False, forbid_uds=True, **kwargs)
+
+
+def throughput(host, pipelined, threads=8, calls=100):
+    """
+    :return: (commands per second, failed commands, stale responses)
+    """
+    arm = connect(host, pipelined=pipelined)
+    errors = []
+    barrier = threading.Barrier(threads + 1)
+
+    def run():
+        barrier.wait()
+        for _ in range(calls):
+            code, _ = arm.get_state()
+            if code != 0:
+                errors.append(code)
+
+    workers = [threading.Thread(target=run, daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    _, stats = arm.get_comm_stats()
+    arm.disconnect()
+    return threads * calls / elapsed, len(errors), stats['total']['stale']
+
+
+def use_polling(arm):
+    # the fallback of UxbusCmdTcp: the responses go to rx_que, which is read until the expected one comes
+    arm_cmd = arm._arm.arm_cmd
+    arm_cmd._dispatch = False
+    arm_cmd.arm_port.rx_parse.drop_unmatched = False
+
+
+def latency(host, polling, calls=2000):
+    """
+    :return: (LatencyHistogram of the get_state calls, failed commands)
+    """
+    arm = connect(host)
+    if polling:
+        use_polling(arm)
+    histogram = LatencyHistogram()
+    errors = 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        code, _ = arm.get_state()
+        histogram.record(time.perf_counter() - start)
+        if code != 0:
+            errors += 1
+    arm.disconnect()
+    return histogram, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Command round trips against the controller simulator')
+    parser.add_argument('--host', default='127.0.0.2', help='address of the simulator')
+    parser.add_argument('--delay', type=float, default=0.002, help='seconds waited by the simulator per response')
+    parser.add_argument('--threads', type=int, default=8, help='threads calling get_state at the same time')
+    parser.add_argument('--calls', type=int, default=100, help='get_state calls per thread')
+    parser.add_argument('--latency-calls', type=int, default=2000, help='sequential get_state calls per wait mode')
+    parser.add_argument('--latency-delay', type=float, default=0, help='response delay of the latency run')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    with ControllerSimulator(args.host, arm=SimulatedArm(axis=6, arm_type=6), response_delay=args.delay) as simulator:
+        print('throughput: {} threads x {} get_state, response delay {} ms'.format(
+            args.threads, args.calls, args.delay * 1e3))
+        for label, pipelined in (('default', False), ('pipelined', True)):
+            rate, errors, stale = throughput(args.host, pipelined, args.threads, args.calls)
+            failed += errors
+            print('  {:<10} {:8.0f} commands/s  errors {}  stale responses {}'.format(label, rate, errors, stale))
+        simulator.response_delay = args.latency_delay
+        print('response wait: {} sequential get_state, response delay {} ms'.format(
+            args.latency_calls, args.latency_delay * 1e3))
+        for label, polling in (('waiter', False), ('polling', True)):
+            histogram, errors = latency(args.host, polling, args.latency_calls)
+            failed += errors
+            print('  {:<10} p50 {:7.0f} us  p90 {:7.0f} us  p99 {:7.0f} us  max {:8.0f} us  errors {}'.format(
+                label, histogram.percentile(50) * 1e6, histogram.percentile(90) * 1e6,
+                histogram.percentile(99) * 1e6, histogram.max, errors))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2020, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Equivalence check and benchmark of the convert helpers (backed by codec) against their previous implementations
+Every helper is run on a fixed corpus (edge values included) with both implementations, the outputs must be equal
+    byte for byte (the floats are compared by their bit patterns, nan/-0.0 included), the exceptions must be
+    of the same type, then both are timed
+Usage:
+    python -m xarm.tools.bench_codec
+    python -m xarm.tools.bench_codec --number 20000
+The exit status is 1 if an output differs
+"""
+
+import sys
+import math
+import struct
+import timeit
+import argparse
+from ..core.utils import convert
+
+
+class Reference(object):
+    """
+    The convert helpers before codec, kept as the reference
+    """
+    @staticmethod
+    def fp32_to_bytes(data, is_big_endian=False):
+        return bytes(struct.pack('>f' if is_big_endian else '<f', data))
+
+    @staticmethod
+    def int32_to_bytes(data, is_big_endian=False):
+        return bytes(struct.pack('>i' if is_big_endian else '<i', data))
+
+    @staticmethod
+    def int32s_to_bytes(data, n):
+        assert n > 0
+        ret = Reference.int32_to_bytes(data[0])
+        for i in range(1, n):
+            ret += Reference.int32_to_bytes(data[i])
+        return ret
+
+    @staticmethod
+    def bytes_to_fp32(data):
+        byte = bytes([data[0]])
+        byte += bytes([data[1]])
+        byte += bytes([data[2]])
+        byte += bytes([data[3]])
+        ret = struct.unpack('<f', byte)
+        return ret[0]
+
+    @staticmethod
+    def fp32s_to_bytes(data, n):
+        assert n > 0
+        ret = Reference.fp32_to_bytes(data[0])
+        for i in range(1, n):
+            ret += Reference.fp32_to_bytes(data[i])
+        return ret
+
+    @staticmethod
+    def bytes_to_fp32s(data, n):
+        ret = [0] * n
+        for i in range(n):
+            ret[i] = Reference.bytes_to_fp32(data[i * 4:i * 4 + 4])
+        return ret
+
+    @staticmethod
+    def u16_to_bytes(data):
+        bts = bytes([data // 256 % 256])
+        bts += bytes([data % 256])
+        return bts
+
+    @staticmethod
+    def u16s_to_bytes(data, num):
+        bts = b''
+        if num != 0:
+            bts = Reference.u16_to_bytes(data[0])
+            for i in range(1, num):
+                bts += Reference.u16_to_bytes(data[i])
+        return bts
+
+    @staticmethod
+    def bytes_to_u16s(data, n):
+        ret = [0] * n
+        for i in range(n):
+            ret[i] = data[i * 2] << 8 | data[i * 2 + 1]
+        return ret
+
+    @staticmethod
+    def bytes_to_16s(data, n):
+        ret = [0] * n
+        for i in range(n):
+            ret[i] = struct.unpack('>h', bytes(data[i * 2: i * 2 + 2]))[0]
+        return ret
+
+    @staticmethod
+    def bytes_to_num32(data, fmt='>l'):
+        byte = bytes([data[0]])
+        byte += bytes([data[1]])
+        byte += bytes([data[2]])
+        byte += bytes([data[3]])
+        ret = struct.unpack(fmt, byte)
+        return ret[0]
+
+    @staticmethod
+    def bytes_to_long_big(data):
+        return Reference.bytes_to_num32(data, '>l')
+
+
+FLOATS = [0.0, -0.0, 1.0, -1.0, 0.1, math.pi, -math.pi, 1e-45, -1e-45, 1.1754943508222875e-38,
+          3.4028234663852886e+38, -3.4028234663852886e+38, 1e38, 123456.789, float('inf'), float('-inf'),
+          float('nan'), 2 ** 24 + 1, 7]
+INT32S = [0, 1, -1, 255, 256, 65535, 65536, 2 ** 31 - 1, -2 ** 31, 123456789, -987654321]
+U16S = [0, 1, 255, 256, 4660, 32767, 32768, 65535]
+
+
+def _raw_corpus():
+    # raw data as received: lists of ints (UxbusCmd), bytes, bytearray and memoryview, every byte value and
+    # the bit patterns of the edge floats (nan, inf, denormals)
+    raw = bytes(range(256)) + b''.join(struct.pack('<f', v) for v in FLOATS) \
+        + bytes([0xFF, 0xFF, 0x7F, 0xFF, 0x00, 0x00, 0x80, 0x7F, 0x01, 0x00, 0xC0, 0x7F, 0x00, 0x00, 0x00, 0x80])
+    raw = raw[:len(raw) // 8 * 8]
+    return [('list', list(raw)), ('bytes', raw), ('bytearray', bytearray(raw)), ('memoryview', memoryview(raw))]
+
+
+def _cases():
+    """
+    :return: [(name, args), ...] per helper
+    """
+    raw = _raw_corpus()
+    cases = {
+        'fp32_to_bytes': [(v,) for v in FLOATS] + [(v, True) for v in FLOATS] + [(1e39,), ('x',)],
+        'int32_to_bytes': [(v,) for v in INT32S] + [(v, True) for v in INT32S] + [(2 ** 31,), (1.5,)],
+        'int32s_to_bytes': [(INT32S, len(INT32S)), (INT32S, 1), (INT32S[:3], 3), (INT32S + [2 ** 32], 12),
+                            ([], 0)],
+        'fp32s_to_bytes': [(FLOATS, len(FLOATS)), (FLOATS, 1), (FLOATS[:7] + [0] * 3, 10), (FLOATS, 0)],
+        'u16_to_bytes': [(v,) for v in U16S] + [(65536,), (70000,), (-1,)],
+        'u16s_to_bytes': [(U16S, len(U16S)), (U16S, 0), (U16S, 3), ([65536, 70000, -2], 3)],
+        'bytes_to_fp32': [],
+        'bytes_to_fp32s': [],
+        'bytes_to_u16s': [],
+        'bytes_to_16s': [],
+        'bytes_to_num32': [],
+        'bytes_to_long_big': [],
+    }
+    for _, data in raw:
+        size = len(data)
+        for offset in range(0, size - 4, 4):
+            cases['bytes_to_fp32'].append((data[offset:offset + 4],))
+            cases['bytes_to_num32'].append((data[offset:offset + 4],))
+            cases['bytes_to_num32'].append((data[offset:offset + 4], '<l'))
+            cases['bytes_to_num32'].append((data[offset:offset + 4], '>I'))
+            cases['bytes_to_long_big'].append((data[offset:offset + 4],))
+        for count in (0, 1, 7, size // 4):
+            cases['bytes_to_fp32s'].append((data, count))
+        for count in (0, 1, 7, size // 2):
+            cases['bytes_to_u16s'].append((data, count))
+            cases['bytes_to_16s'].append((data, count))
+        cases['bytes_to_fp32'].append((data[1:5],))
+    return cases
+
+
+def _key(value):
+    # comparable form of an output: the floats by their bit patterns (nan and -0.0 are equal only to themselves)
+    if isinstance(value, float):
+        return 'f', struct.pack('<d', value)
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, [_key(v) for v in value]
+    return type(value).__name__, value
+
+
+def _outcome(func, args):
+    try:
+        return _key(func(*args))
+    except Exception as e:
+        return 'raises', type(e).__name__
+
+
+def check(cases, verbose=False):
+    """
+    :return: list of the mismatches (name, args, reference outcome, new outcome)
+    """
+    mismatches = []
+    for name, arg_list in cases.items():
+        old, new = getattr(Reference, name), getattr(convert, name)
+        for args in arg_list:
+            expected, got = _outcome(old, args), _outcome(new, args)
+            if expected != got:
+                mismatches.append((name, args, expected, got))
+        if verbose:
+            print('{:<20} {} cases'.format(name, len(arg_list)))
+    return mismatches
+
+
+def bench(number=10000, repeat=5):
+    """
+    :return: [(name, reference us/call, new us/call), ...], the best of repeat runs
+    """
+    floats7 = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]
+    floats10 = floats7 + [100, 2000, 0]
+    ints = [1, -2, 3, -4, 5, -6, 7]
+    u16s = list(range(0, 64000, 1000))
+    frame = list(struct.pack('<40f', *range(40)))
+    workloads = [
+        ('fp32_to_bytes', (math.pi,)),
+        ('int32s_to_bytes', (ints, 7)),
+        ('fp32s_to_bytes', (floats10, 10)),
+        ('u16s_to_bytes', (u16s, len(u16s))),
+        ('bytes_to_fp32', (frame[:4],)),
+        ('bytes_to_fp32s', (frame, 7)),
+        ('bytes_to_fp32s', (frame, 40)),
+        ('bytes_to_fp32s', (bytes(frame), 40)),
+        ('bytes_to_u16s', (frame, 64)),
+        ('bytes_to_16s', (frame, 64)),
+        ('bytes_to_long_big', (frame[:4],)),
+    ]
+    results = []
+    for name, args in workloads:
+        timings = []
+        for func in (getattr(Reference, name), getattr(convert, name)):
+            best = min(timeit.repeat(lambda: func(*args), number=number, repeat=repeat))
+            timings.append(best / number * 1e6)
+        label = '{}({}, {})'.format(name, type(args[0]).__name__, args[1]) if len(args) > 1 else name
+        results.append((label, timings[0], timings[1]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the convert helpers against the previous implementations '
+                                                 'and time both')
+    parser.add_argument('--number', type=int, default=10000, help='calls per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs, the best is kept')
+    parser.add_argument('--check-only', action='store_true', help='do not time')
+    args = parser.parse_args(argv)
+
+    cases = _cases()
+    mismatches = check(cases, verbose=True)
+    total = sum(len(arg_list) for arg_list in cases.values())
+    print('equivalence: {} cases, {} mismatches'.format(total, len(mismatches)))
+    for name, case_args, expected, got in mismatches[:20]:
+        print('  MISMATCH {}{}: reference={} new={}'.format(name, case_args, expected, got))
+    if not args.check_only:
+        print('{:<36} {:>14} {:>14} {:>8}'.format('helper', 'reference us', 'codec us', 'speedup'))
+        for label, old, new in bench(args.number, args.repeat):
+            print('{:<36} {:>14.3f} {:>14.3f} {:>7.1f}x'.format(label, old, new, old / new))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
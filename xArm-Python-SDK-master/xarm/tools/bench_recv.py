@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Replay of burst traffic through the receive loops of Port, against the loops before recv_into
+Main socket: responses of several sizes mixed with feedback packets (funcode 0xFF), Modbus-TCP framing
+Report socket: report frames with a length prefix
+The stream is cut in fragments of random sizes (seeded, so every run replays the same traffic), the frames handed
+    out by both loops must be equal to the generated ones, then the wall time and the CPU time are compared
+Report socket, allocations: the memory allocated per frame by the report loops (tracemalloc, peak above the memory
+    held between two frames), rich frames of 495 bytes read from a prefilled socketpair
+Report socket, jitter (--jitter): rich frames are sent on a socketpair at a fixed period while a thread allocates
+    and frees objects (GC load of an application), the delay between the send and the delivery of every frame is
+    measured for both loops
+Transport:
+    socketpair: the fragments are written into a socketpair by the calling thread (includes the kernel and the
+        sender competing for the GIL, noisy)
+    memory: the fragments are returned by recv/recv_into of an in-memory socket, one fragment per read at most
+        (the cost of the receive loops only)
+Usage:
+    python -m xarm.tools.bench_recv
+    python -m xarm.tools.bench_recv --transport socketpair --frames 50000 --max-fragment 4096
+    python -m xarm.tools.bench_recv --jitter --period 0.004 --jitter-frames 2500
+The exit status is 1 if the frames differ
+"""
+
+import sys
+import time
+import random
+import socket
+import struct
+import argparse
+import threading
+import tracemalloc
+from ..core.config.x_config import XCONF
+from ..core.utils import convert
+from ..core.comm.base import Port
+
+MODBUS_TCP_HEADER = struct.Struct('>HHHB')
+# payload sizes (without the funcode) of common responses: set_state, get_state, get_position, get_servo_angle,
+# get_joint_states, and of the feedback packets
+RESPONSE_SIZES = (1, 2, 25, 29, 85)
+FEEDBACK_SIZE = 16
+
+
+def old_recv_proc(port):
+    """
+    Receive loop of the main socket before RxRingBuffer (TCP branch of Port.recv_proc)
+    """
+    buffer = b''
+    while port.connected and port.alive:
+        try:
+            rx_data = port.com_read(port.buffer_size)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        if len(rx_data) == 0:
+            break
+        buffer += rx_data
+        while True:
+            if len(buffer) < 6:
+                break
+            length = convert.bytes_to_u16(buffer[4:6]) + 6
+            if len(buffer) < length:
+                break
+            rx_data = buffer[:length]
+            buffer = buffer[length:]
+            port.rx_parse.put(rx_data)
+
+
+def old_recv_report_proc(port):
+    """
+    Receive loop of the report socket before the pooled buffers (framing of Port.recv_report_proc)
+    """
+    size = 0
+    data_num = 0
+    buffer = b''
+    while port.connected and port.alive:
+        try:
+            data = port.com_read(4 - data_num if size == 0 else (size - data_num))
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        if len(data) == 0:
+            break
+        data_num += len(data)
+        buffer += data
+        if size == 0:
+            if data_num != 4:
+                continue
+            size = convert.bytes_to_u32(buffer[0:4])
+        else:
+            if data_num < size:
+                continue
+            if convert.bytes_to_u32(buffer[0:4]) != size:
+                break
+            if port.rx_que.qsize() > 1:
+                port.rx_que.get()
+            port.rx_parse.put(buffer, True)
+            buffer = b''
+            data_num = 0
+
+
+class Collector(object):
+    """
+    Sink of the frames (rx_parse of the port), stops the receive loop after the expected frames
+    keep: a copy of every frame is kept for the comparison
+    else the sink costs what RxParse costs: the main socket frames are copied once (bytes of the memoryview of
+        RxRingBuffer, free for the bytes of the old loop), the report frames are handed over without a copy
+    """
+    def __init__(self, port, expected, keep=False, trace=False, stamp=False):
+        self.expected = expected
+        self.keep = keep
+        self.frames = []
+        self.count = 0
+        self.done = threading.Event()
+        self._port = port
+        # allocations: memory allocated per frame, delivery times of the frames
+        self.trace = trace
+        self.allocated = []
+        self._traced = 0
+        self.times = [] if stamp else None
+
+    def put(self, data, is_report=False):
+        if self.times is not None:
+            self.times.append(time.perf_counter())
+        if self.keep:
+            self.frames.append(bytes(data))
+        elif not is_report:
+            bytes(data)
+        else:
+            # pooled report buffers go back to the pool, as the consumer of the report queue does
+            self._port.release(data)
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.count > 0:
+                self.allocated.append(peak - self._traced)
+            tracemalloc.reset_peak()
+            self._traced = current
+        self.count += 1
+        if self.count >= self.expected:
+            self._port.alive = False
+            self.done.set()
+
+
+def main_socket_traffic(count, rng):
+    frames = []
+    for trans_id in range(count):
+        if rng.random() < 0.2:
+            frame = MODBUS_TCP_HEADER.pack(0, 2, FEEDBACK_SIZE + 1, 0xFF) + bytes(rng.getrandbits(8) for _ in range(FEEDBACK_SIZE))
+        else:
+            size = rng.choice(RESPONSE_SIZES)
+            frame = MODBUS_TCP_HEADER.pack(trans_id & 0xFFFF, 2, size + 1, XCONF.UxbusReg.GET_STATE) \
+                + bytes(rng.getrandbits(8) for _ in range(size))
+        frames.append(frame)
+    return frames
+
+
+def report_traffic(count, rng, size=XCONF.SocketConf.TCP_REPORT_NORMAL_BUF_SIZE):
+    body = bytes(rng.getrandbits(8) for _ in range(size - 4))
+    return [struct.pack('>I', size) + body[i % 16:] + body[:i % 16] for i in range(count)]
+
+
+def fragments(stream, rng, max_fragment):
+    # bursts of coalesced or split frames, as the TCP stack hands them out
+    chunks = []
+    offset = 0
+    while offset < len(stream):
+        size = rng.randint(1, max_fragment)
+        chunks.append(stream[offset:offset + size])
+        offset += size
+    return chunks
+
+
+class ChunkSocket(object):
+    """
+    In-memory socket returning the recorded fragments, a read never spans two fragments (as a TCP read of a
+        burst), b''/0 at the end
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b'')
+
+    def _next(self, size):
+        if not self._chunk:
+            self._chunk = memoryview(next(self._chunks, b''))
+        data, self._chunk = self._chunk[:size], self._chunk[size:]
+        return data
+
+    def recv(self, size):
+        return bytes(self._next(size))
+
+    def recv_into(self, buffer, size=0):
+        data = self._next(size or len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def replay(frames, chunks, port_type, loop, keep=False, transport='memory', collector=None, period=0):
+    """
+    :param loop: None for the current loop of Port, else one of the old loops
+    :param keep: keep a copy of the received frames (not timed then)
+    :param transport: memory, socketpair, or prefilled (socketpair written before the loop starts, no sender
+        thread, the chunks must fit in the socket buffer)
+    :param collector: Collector with tracing or time stamps, default is a plain one
+    :param period: the chunks are sent every period seconds (socketpair), their send times are returned
+    :return: (received frames, wall time, CPU time of the process, send times)
+    """
+    if transport == 'memory':
+        rx_sock, tx_sock = ChunkSocket(chunks), None
+    else:
+        rx_sock, tx_sock = socket.socketpair()
+        rx_sock.settimeout(1)
+    if transport == 'prefilled':
+        tx_sock.sendall(b''.join(chunks))
+        tx_sock.close()
+        tx_sock = None
+    sent = []
+    port = Port(1024)
+    port.port_type = port_type
+    port.com = rx_sock
+    port.com_read = rx_sock.recv
+    port.com_read_into = rx_sock.recv_into
+    port.buffer_size = XCONF.SocketConf.TCP_CONTROL_BUF_SIZE
+    port._connected = True
+    if collector is None:
+        collector = Collector(port, len(frames), keep=keep)
+    collector._port = port
+    port.rx_parse = collector
+    if port_type == 'report-socket' and loop is None:
+        # the pooled buffers are handed to the collector instead of the report queue
+        port._put_report = lambda data: collector.put(data, True)
+    target = port.run if loop is None else (lambda: loop(port))
+    start, cpu_start = time.perf_counter(), time.process_time()
+    if tx_sock is None:
+        # the loop returns once the collector stops it
+        target()
+    else:
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        deadline = time.perf_counter()
+        for chunk in chunks:
+            if period > 0:
+                deadline += period
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                sent.append(time.perf_counter())
+            tx_sock.sendall(chunk)
+        collector.done.wait(60)
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    if tx_sock is not None:
+        port.alive = False
+        port._connected = False
+        tx_sock.close()
+        thread.join(5)
+    rx_sock.close()
+    return collector.frames, wall, cpu, sent
+
+
+def run(name, frames, chunks, port_type, old_loop, repeat, transport):
+    ok = True
+    loops = (('old', old_loop), ('new', None))
+    for label, loop in loops:
+        received = replay(frames, chunks, port_type, loop, keep=True, transport=transport)[0]
+        if received != frames:
+            ok = False
+            print('  MISMATCH {} {}: {} frames received, {} expected'.format(name, label, len(received), len(frames)))
+    # the runs of both loops alternate, so that a slow phase of the machine hits both
+    best = [None, None]
+    for _ in range(repeat):
+        for i, (_, loop) in enumerate(loops):
+            _, wall, cpu, _ = replay(frames, chunks, port_type, loop, transport=transport)
+            best[i] = (wall, cpu) if best[i] is None or wall < best[i][0] else best[i]
+    (old_wall, old_cpu), (new_wall, new_cpu) = best
+    print('{:<8} {:>7} frames {:>6} chunks  old {:8.1f} ms (cpu {:8.1f})  new {:8.1f} ms (cpu {:8.1f})  '
+          'speedup {:4.1f}x'.format(name, len(frames), len(chunks), old_wall * 1e3, old_cpu * 1e3,
+                                    new_wall * 1e3, new_cpu * 1e3, old_wall / new_wall))
+    return ok
+
+
+def allocations(frames, chunks):
+    """
+    Read from a prefilled socketpair, so that only the allocations of the loops (and of the collector, the same for
+        both) are traced
+    :return: [(label, bytes allocated per frame: mean, max), ...] of both report loops
+    """
+    ret = []
+    for label, loop in (('old', old_recv_report_proc), ('new', None)):
+        collector = Collector(None, len(frames), trace=True)
+        tracemalloc.start()
+        try:
+            replay(frames, chunks, 'report-socket', loop, transport='prefilled', collector=collector)
+        finally:
+            tracemalloc.stop()
+        # the first frames (first reads, pool) are not counted
+        allocated = collector.allocated[10:]
+        ret.append((label, sum(allocated) / len(allocated), max(allocated)))
+    return ret
+
+
+class GCLoad(threading.Thread):
+    """
+    Allocates and frees containers, as an application does between two reports (triggers the cyclic GC)
+    """
+    def __init__(self):
+        super(GCLoad, self).__init__(daemon=True)
+        self.alive = True
+
+    def run(self):
+        while self.alive:
+            [[i] * 8 for i in range(200)]
+            time.sleep(0.0005)
+
+
+def jitter(frames, period, repeat):
+    """
+    :return: [(label, delays from send to delivery in seconds), ...] of both report loops, the runs alternate
+    """
+    delays = {'old': [], 'new': []}
+    load = GCLoad()
+    load.start()
+    try:
+        for _ in range(repeat):
+            for label, loop in (('old', old_recv_report_proc), ('new', None)):
+                collector = Collector(None, len(frames), stamp=True)
+                sent = replay(frames, frames, 'report-socket', loop, transport='socketpair', collector=collector,
+                              period=period)[3]
+                delays[label].extend(t - s for s, t in zip(sent, collector.times))
+    finally:
+        load.alive = False
+    return [(label, delays[label]) for label in ('old', 'new')]
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay burst traffic through the old and new receive loops')
+    parser.add_argument('--frames', type=int, default=20000, help='frames per stream')
+    parser.add_argument('--max-fragment', type=int, default=2048, help='largest fragment written at once')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per loop, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--transport', choices=('memory', 'socketpair'), default='memory')
+    parser.add_argument('--jitter', action='store_true', help='measure the delivery delays of the report loops')
+    parser.add_argument('--period', type=float, default=0.004, help='send period of the jitter run')
+    parser.add_argument('--jitter-frames', type=int, default=1000, help='frames per jitter run')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    ok = True
+    main_frames = main_socket_traffic(args.frames, rng)
+    for max_fragment, label in ((args.max_fragment, 'main'), (7, 'main/7')):
+        chunks = fragments(b''.join(main_frames), rng, max_fragment)
+        ok = run(label, main_frames, chunks, 'main-socket', old_recv_proc, args.repeat, args.transport) and ok
+    reports = report_traffic(args.frames, rng)
+    for max_fragment, label in ((args.max_fragment, 'report'), (7, 'report/7')):
+        chunks = fragments(b''.join(reports), rng, max_fragment)
+        ok = run(label, reports, chunks, 'report-socket', old_recv_report_proc, args.repeat,
+                 args.transport) and ok
+    # 200 frames fit in the buffer of the socketpair
+    rich = report_traffic(200, rng, size=495)
+    print('rich     allocated bytes per frame  ' + '  '.join(
+        '{} mean {:7.1f} max {:6d}'.format(name, mean, peak) for name, mean, peak in allocations(rich, rich)))
+    if args.jitter:
+        rich = report_traffic(args.jitter_frames, rng, size=495)
+        print('jitter: {} frames every {} ms, GC load, delay from send to delivery'.format(
+            args.jitter_frames, args.period * 1e3))
+        for label, delays in jitter(rich, args.period, args.repeat):
+            mean = sum(delays) / len(delays)
+            std = (sum((d - mean) ** 2 for d in delays) / len(delays)) ** 0.5
+            print('  {}  mean {:7.1f} us  std {:7.1f} us  p50 {:7.1f} us  p99 {:7.1f} us  max {:8.1f} us'.format(
+                label, mean * 1e6, std * 1e6, _percentile(delays, 50) * 1e6, _percentile(delays, 99) * 1e6,
+                max(delays) * 1e6))
+    print('frames equal: {}'.format(ok))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2020, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Equivalence check and benchmark of the report decoders: the precompiled layouts of xarm/x3/report.py against the
+    slice-and-convert decode of Base._handle_report_data before them (with the convert helpers of that time)
+Both decoders are run over the same frames (real, normal and rich reports of every length the firmwares send,
+    random field values, seeded), every field must be equal (the floats by their bit patterns), then both are timed
+The timed work is the decode of one report as the handler does it: every field it reads, the servo codes as raw bytes
+Usage:
+    python -m xarm.tools.bench_report
+    python -m xarm.tools.bench_report --number 20000 --input memoryview
+The exit status is 1 if a field differs
+"""
+
+import sys
+import struct
+import random
+import timeit
+import argparse
+from ..x3.report import REPORT_REAL_LAYOUT, REPORT_NORMAL_LAYOUT, REPORT_RICH_LAYOUT
+from .bench_codec import Reference
+
+# lengths of the frames sent by the firmwares
+REAL_LENGTHS = (87, 135)
+NORMAL_LENGTHS = (145,)
+RICH_LENGTHS = (245, 252, 284, 288, 312, 314, 417, 433, 481, 482, 494, 495)
+
+
+def _u16(data):
+    return data[0] << 8 | data[1]
+
+
+def _u32(data):
+    return data[0] << 24 | data[1] << 16 | data[2] << 8 | data[3]
+
+
+def old_decode_common(rx_data):
+    fp32s = Reference.bytes_to_fp32s
+    return {
+        'total': _u32(rx_data[0:4]),
+        'state_mode': rx_data[4],
+        'cmd_num': _u16(rx_data[5:7]),
+        'angles': fp32s(rx_data[7:7 * 4 + 7], 7),
+        'pose': fp32s(rx_data[35:6 * 4 + 35], 6),
+        'torque': fp32s(rx_data[59:7 * 4 + 59], 7),
+    }
+
+
+def old_decode_real(rx_data):
+    ret = old_decode_common(rx_data)
+    if len(rx_data) >= 135:
+        ret['ft_ext_force'] = Reference.bytes_to_fp32s(rx_data[87:111], 6)
+        ret['ft_raw_force'] = Reference.bytes_to_fp32s(rx_data[111:135], 6)
+    return ret
+
+
+def old_decode_normal(rx_data):
+    fp32s = Reference.bytes_to_fp32s
+    ret = old_decode_common(rx_data)
+    ret['mtbrake'], ret['mtable'], ret['error_code'], ret['warn_code'] = rx_data[87:91]
+    ret['pose_offset'] = fp32s(rx_data[91:6 * 4 + 91], 6)
+    ret['tcp_load'] = fp32s(rx_data[115:4 * 4 + 115], 4)
+    ret['collis_sens'], ret['teach_sens'] = rx_data[131:133]
+    ret['gravity_direction'] = fp32s(rx_data[133:3 * 4 + 133], 3)
+    return ret
+
+
+def old_decode_rich(rx_data):
+    fp32s = Reference.bytes_to_fp32s
+    ret = old_decode_normal(rx_data)
+    ret['arm_info'] = list(rx_data[145:151])
+    ret['trs_msg'] = fp32s(rx_data[181:201], 5)
+    ret['p2p_msg'] = fp32s(rx_data[201:221], 5)
+    ret['rot_msg'] = fp32s(rx_data[221:229], 2)
+    ret['servo_codes'] = [val for val in rx_data[229:245]]
+    length = len(rx_data)
+    if length >= 252:
+        ret['temperatures'] = list(struct.unpack('>7b', struct.pack('>7B', *rx_data[245:252])))
+    if length >= 284:
+        ret['speeds'] = fp32s(rx_data[252:8 * 4 + 252], 8)
+    if length >= 288:
+        ret['count'] = _u32(rx_data[284:288])
+    if length >= 312:
+        ret['world_offset'] = fp32s(rx_data[288:6 * 4 + 288], 6)
+    if length >= 314:
+        ret['gpio_reset_enable'] = list(rx_data[312:314])
+    if length >= 417:
+        ret['is_simulation_robot'] = rx_data[314]
+        ret['collision_detection'] = list(rx_data[315:317])
+        ret['collision_tool_params'] = fp32s(rx_data[317:341], 6)
+        ret['voltages'] = Reference.bytes_to_u16s(rx_data[341:355], 7)
+        ret['currents'] = fp32s(rx_data[355:383], 7)
+        ret['cgpio_func'] = list(rx_data[383:385])
+        ret['cgpio_values'] = Reference.bytes_to_u16s(rx_data[385:401], 8)
+        ret['cgpio_input_conf'] = list(map(int, rx_data[401:409]))
+        ret['cgpio_output_conf'] = list(map(int, rx_data[409:417]))
+    if length >= 433:
+        ret['cgpio_input_conf2'] = list(map(int, rx_data[417:425]))
+        ret['cgpio_output_conf2'] = list(map(int, rx_data[425:433]))
+    if length >= 481:
+        ret['ft_ext_force'] = fp32s(rx_data[433:457], 6)
+        ret['ft_raw_force'] = fp32s(rx_data[457:481], 6)
+    if length >= 482:
+        ret['iden_progress'] = rx_data[481]
+    if length >= 494:
+        ret['pose_aa'] = fp32s(rx_data[482:494], 3)
+    if length >= 495:
+        ret['flags'] = rx_data[494]
+    return ret
+
+
+def new_decode(layout, data):
+    frame = layout.decode(data)
+    if frame.has('servo_codes'):
+        frame.raw('servo_codes')
+    return frame
+
+
+DECODERS = (
+    ('real', REPORT_REAL_LAYOUT, old_decode_real, REAL_LENGTHS),
+    ('normal', REPORT_NORMAL_LAYOUT, old_decode_normal, NORMAL_LENGTHS),
+    ('rich', REPORT_RICH_LAYOUT, old_decode_rich, RICH_LENGTHS),
+)
+
+
+def random_frame(layout, length, rng):
+    # random bytes, the floats of the edge values included, then the length prefix
+    data = bytearray(rng.getrandbits(8) for _ in range(length))
+    edges = (float('nan'), float('inf'), -0.0, 1e-45, 3.4028234663852886e+38)
+    for field in layout.fields:
+        if field.fmt == 'f' and field.end <= length and rng.random() < 0.3:
+            struct.pack_into('<f', data, field.offset, rng.choice(edges))
+    struct.pack_into('>I', data, 0, length)
+    return bytes(data)
+
+
+def _key(value):
+    if isinstance(value, float):
+        return struct.pack('<d', value)
+    if isinstance(value, (list, tuple)):
+        return [_key(v) for v in value]
+    return value
+
+
+def check(frames_per_length, rng, verbose=False):
+    """
+    :return: list of the mismatches (report, length, field, old value, new value)
+    """
+    mismatches = []
+    for name, layout, old_decode, lengths in DECODERS:
+        for length in lengths:
+            for _ in range(frames_per_length):
+                data = random_frame(layout, length, rng)
+                expected = old_decode(data)
+                for view in (data, memoryview(bytearray(data))):
+                    frame = layout.decode(view)
+                    for field, value in expected.items():
+                        got = getattr(frame, field) if frame.has(field) else None
+                        if _key(value) != _key(got):
+                            mismatches.append((name, length, field, value, got))
+                    # no field decoded by one side only
+                    for field in layout.fields:
+                        if frame.has(field.name) and field.name not in expected and field.name not in ('version', 'sv3_msg'):
+                            mismatches.append((name, length, field.name, None, getattr(frame, field.name)))
+        if verbose:
+            print('{:<8} lengths {}'.format(name, ', '.join(map(str, lengths))))
+    return mismatches
+
+
+def bench(rng, number=10000, repeat=5, input_type='bytes'):
+    """
+    :return: [(label, old us/frame, new us/frame), ...], the best of repeat runs
+    """
+    results = []
+    for name, layout, old_decode, lengths in DECODERS:
+        for length in (lengths[0], lengths[-1]) if len(lengths) > 1 else lengths:
+            data = random_frame(layout, length, rng)
+            if input_type == 'memoryview':
+                # the pooled receive buffers of the report socket
+                data = memoryview(bytearray(data))
+            timings = []
+            for func in (lambda: old_decode(data), lambda: new_decode(layout, data)):
+                best = min(timeit.repeat(func, number=number, repeat=repeat))
+                timings.append(best / number * 1e6)
+            results.append(('{}/{}'.format(name, length), timings[0], timings[1]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the report layouts against the previous decoder and time both')
+    parser.add_argument('--frames', type=int, default=50, help='random frames checked per length')
+    parser.add_argument('--number', type=int, default=10000, help='frames per timing run')
+    parser.add_argument('--repeat', type=int, default=5, help='timing runs, the best is kept')
+    parser.add_argument('--input', choices=('bytes', 'memoryview'), default='bytes', help='type of the timed frames')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--check-only', action='store_true', help='do not time')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    mismatches = check(args.frames, rng, verbose=True)
+    print('equivalence: {} mismatches'.format(len(mismatches)))
+    for name, length, field, expected, got in mismatches[:20]:
+        print('  MISMATCH {}/{} {}: old={} new={}'.format(name, length, field, expected, got))
+    if not args.check_only:
+        print('{:<12} {:>10} {:>10} {:>8}'.format('report', 'old us', 'new us', 'speedup'))
+        for label, old, new in bench(rng, args.number, args.repeat, args.input):
+            print('{:<12} {:>10.2f} {:>10.2f} {:>7.1f}x'.format(label, old, new, old / new))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+"""
+Stand-in of the xArm controller for tests and benchmarks without a robot
+The control ports (502, 503) speak the private Modbus TCP protocol of UxbusCmdTcp,
+the report ports (30001 normal, 30002 rich, 30003 real) stream frames built with the report layouts
+The ports of the controller are fixed, so every simulator binds its own address (127.0.0.2, 127.0.0.3, ...)
+Model: the motions are queued (cmd_num) and executed with a trapezoidal speed profile,
+    there is no kinematic model of the arm: joint motions move the angles, linear motions move the pose
+Usage:
+    from xarm.tools.simulator import ControllerSimulator
+    with ControllerSimulator('127.0.0.2'):
+        arm = XArmAPI('127.0.0.2')
+        ...
+    python -m xarm.tools.simulator 127.0.0.2 --count 4 --rate 250
+"""
+
+import math
+import time
+import struct
+import socket
+import argparse
+import threading
+import collections
+from ..core.config.x_config import XCONF
+from ..core.utils.log import logger
+from ..x3.report import REPORT_NORMAL_LAYOUT, REPORT_RICH_LAYOUT, REPORT_REAL_LAYOUT
+
+Reg = XCONF.UxbusReg
+
+MODBUS_TCP_HEADER = struct.Struct('>HHHB')  # trans_id, prot_id, length, unit_id(funcode)
+FEEDBACK_BODY = struct.Struct('>BBBHBQ')  # state, feedback type, funcode, task id, feedback code, us
+STANDARD_PROTOCOL = 0
+HEARTBEAT_PROTOCOL = 1
+PRIVATE_PROTOCOL = 2
+FEEDBACK_FUNCODE = 0xFF
+# payload of the response of the function codes without a model, long enough for the getters of the SDK
+DEFAULT_RESPONSE = bytes(128)
+
+REPORT_PORTS = {
+    XCONF.SocketConf.TCP_REPORT_NORM_PORT: REPORT_NORMAL_LAYOUT,
+    XCONF.SocketConf.TCP_REPORT_RICH_PORT: REPORT_RICH_LAYOUT,
+    XCONF.SocketConf.TCP_REPORT_REAL_PORT: REPORT_REAL_LAYOUT,
+}
+CONTROL_PORTS = (XCONF.SocketConf.TCP_CONTROL_PORT, XCONF.SocketConf.TCP_CONTROL_PORT + 1)
+
+_LINE_FUNCODES = (Reg.MOVE_LINE, Reg.MOVE_LINEB, Reg.MOVE_LINE_TOOL, Reg.MOVE_LINE_AA)
+_JOINT_FUNCODES = (Reg.MOVE_JOINT, Reg.MOVE_JOINTB)
+_TRIGGER_FUNCODES = (Reg.SET_TCP_OFFSET, Reg.SET_LOAD_PARAM)
+
+
+def _floats(payload, count, offset=0):
+    count = min(count, (len(payload) - offset) // 4)
+    return list(struct.unpack_from('<{}f'.format(count), payload, offset)) if count > 0 else []
+
+
+def _wrap(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+class _Motion(object):
+    """
+    A queued motion, moved along a trapezoidal speed profile
+    kind: 'joint' (angles, rad/s), 'line' (pose, mm/s), 'sleep' (duration)
+    """
+    # speed of the rotations of the linear motions without translation (rad/s)
+    ROTATION_SPEED = 1.0
+
+    def __init__(self, kind, funcode, trans_id, feedback_type, conn, target=None, speed=0, acc=0, duration=0):
+        self.kind = kind
+        self.funcode = funcode
+        self.trans_id = trans_id
+        self.feedback_type = feedback_type
+        self.conn = conn
+        self.target = target
+        self.speed = speed
+        self.acc = acc
+        self.duration = duration
+        self.start_time = None
+        self.origin = None
+        self.distance = 0
+
+    def start(self, now, arm):
+        self.start_time = now
+        if self.kind == 'joint':
+            self.origin = list(arm.angles)
+            self.distance = max(abs(t - o) for t, o in zip(self.target, self.origin))
+        elif self.kind == 'line':
+            self.origin = list(arm.pose)
+            self.distance = math.sqrt(sum((t - o) ** 2 for t, o in zip(self.target[:3], self.origin[:3])))
+            if self.distance == 0:
+                self.distance = max(abs(_wrap(t - o)) for t, o in zip(self.target[3:], self.origin[3:]))
+                self.speed = self.ROTATION_SPEED
+                self.acc = self.ROTATION_SPEED * 10
+        if self.kind != 'sleep':
+            speed = self.speed if self.speed > 0 else 1
+            acc = self.acc if self.acc > 0 else speed * 10
+            self._ramp = speed / acc
+            if self.distance <= speed * self._ramp:
+                # triangular profile, the speed is never reached
+                self._ramp = math.sqrt(self.distance / acc)
+                speed = acc * self._ramp
+            self._speed, self._acc = speed, acc
+            self.duration = 2 * self._ramp + (self.distance - speed * self._ramp) / speed if self.distance > 0 else 0
+
+    def fraction(self, elapsed):
+        if elapsed >= self.duration or self.distance <= 0:
+            return 1.0
+        if self.kind == 'sleep':
+            return elapsed / self.duration
+        ramp, acc = self._ramp, self._acc
+        if elapsed < ramp:
+            s = 0.5 * acc * elapsed ** 2
+        elif elapsed < self.duration - ramp:
+            s = 0.5 * acc * ramp ** 2 + self._speed * (elapsed - ramp)
+        else:
+            s = self.distance - 0.5 * acc * (self.duration - elapsed) ** 2
+        return min(max(s / self.distance, 0.0), 1.0)
+
+    def apply(self, arm, fraction):
+        if self.kind == 'joint':
+            arm.angles = [o + (t - o) * fraction for t, o in zip(self.target, self.origin)]
+        elif self.kind == 'line':
+            pose = [o + (t - o) * fraction for t, o in zip(self.target[:3], self.origin[:3])]
+            pose += [_wrap(o + _wrap(t - o) * fraction) for t, o in zip(self.target[3:], self.origin[3:])]
+            arm.pose = pose
+
+
+class SimulatedArm(object):
+    """
+    Controller state of the simulator
+    Units: mm, rad, rad/s, mm/s as in the protocol
+    The methods are called with lock held
+    """
+    def __init__(self, axis=7, arm_type=3, version='v2.5.0', sn='XS1304SIM001', enabled=False):
+        self.lock = threading.RLock()
+        self.axis = axis
+        self.arm_type = arm_type
+        self.version = '{},{},{},AC1303SIM001,{}'.format(axis, arm_type, sn, version)
+        self.sn = sn
+        self.state = 4
+        self.mode = 0
+        self._next_mode = None
+        self.error_code = 0
+        self.warn_code = 0
+        mask = (1 << axis) - 1
+        self.mtable = mask if enabled else 0
+        self.mtbrake = mask if enabled else 0
+        self.angles = [0.0] * 7
+        self.pose = [207.0, 0.0, 112.0, math.pi, 0.0, 0.0]
+        self.pose_offset = [0.0] * 6
+        self.tcp_load = [0.0] * 4
+        self.collis_sens = 3
+        self.teach_sens = 3
+        self.feedback_type = 0
+        self.tcp_speed = 0.0
+        self.joint_speeds = [0.0] * 7
+        self.count = 0
+        self._motions = collections.deque()
+        self._paused_at = None
+        self._last_update = time.monotonic()
+        # feedback frames to send: [(conn, frame)]
+        self.outbox = []
+        self.handlers = {
+            Reg.GET_VERSION: lambda p: self.version.encode('utf-8')[:40].ljust(40, b'\x00'),
+            Reg.GET_ROBOT_SN: lambda p: self.sn.encode('utf-8')[:40].ljust(40, b'\x00'),
+            Reg.GET_STATE: lambda p: bytes([self.state]),
+            Reg.GET_CMDNUM: lambda p: struct.pack('>H', self.cmd_num),
+            Reg.GET_ERROR: lambda p: bytes([self.error_code, self.warn_code]),
+            Reg.GET_TCP_POSE: lambda p: struct.pack('<6f', *self.pose),
+            Reg.GET_JOINT_POS: lambda p: struct.pack('<7f', *self.angles),
+            Reg.MOTION_EN: self._motion_enable,
+            Reg.SET_STATE: self._set_state,
+            Reg.SET_MODE: self._set_mode,
+            Reg.CLEAN_ERR: self._clean_error,
+            Reg.CLEAN_WAR: self._clean_warn,
+            Reg.SET_TCP_OFFSET: self._set_tcp_offset,
+            Reg.SET_LOAD_PARAM: self._set_tcp_load,
+            Reg.SET_FEEDBACK_TYPE: self._set_feedback_type,
+            Reg.MOVE_SERVOJ: self._move_servoj,
+            Reg.MOVE_SERVO_CART: self._move_servo_cart,
+        }
+
+    @property
+    def cmd_num(self):
+        return len(self._motions)
+
+    @property
+    def is_ready(self):
+        mask = (1 << self.axis) - 1
+        return self.state not in (4, 5) and self.error_code == 0 \
+            and self.mtable & mask == mask and self.mtbrake & mask == mask
+
+    @property
+    def status(self):
+        # state byte of the responses, see UxbusCmdTcp.check_private_protocol
+        status = 0x40 if self.error_code else 0
+        status |= 0x20 if self.warn_code else 0
+        status |= 0 if self.is_ready else 0x10
+        return status
+
+    def feedback(self, conn, trans_id, feedback_type, funcode, code=0):
+        if conn is None:
+            return
+        body = FEEDBACK_BODY.pack(self.status, feedback_type, funcode, 0, code, int(time.monotonic() * 1000000))
+        frame = MODBUS_TCP_HEADER.pack(trans_id, PRIVATE_PROTOCOL, len(body) + 1, FEEDBACK_FUNCODE) + body
+        self.outbox.append((conn, frame))
+
+    def _discard_motions(self):
+        while self._motions:
+            motion = self._motions.popleft()
+            if motion.feedback_type & XCONF.FeedbackType.MOTION_FINISH:
+                self.feedback(motion.conn, motion.trans_id, XCONF.FeedbackType.MOTION_FINISH,
+                              motion.funcode, XCONF.FeedbackCode.DISCARD)
+        self._paused_at = None
+
+    def update(self, now=None):
+        now = time.monotonic() if now is None else now
+        dt = now - self._last_update
+        self._last_update = now
+        last_pose, last_angles = self.pose, self.angles
+        start_time = now
+        while self._motions and self.state in (1, 2):
+            motion = self._motions[0]
+            if motion.start_time is None:
+                motion.start(start_time, self)
+                self.state = 1
+                if motion.feedback_type & XCONF.FeedbackType.MOTION_START:
+                    self.feedback(motion.conn, motion.trans_id, XCONF.FeedbackType.MOTION_START, motion.funcode)
+            elapsed = now - motion.start_time
+            motion.apply(self, motion.fraction(elapsed))
+            if elapsed < motion.duration:
+                break
+            self._motions.popleft()
+            if motion.feedback_type & XCONF.FeedbackType.MOTION_FINISH:
+                self.feedback(motion.conn, motion.trans_id, XCONF.FeedbackType.MOTION_FINISH, motion.funcode)
+            # the next motion starts when this one ended
+            start_time = motion.start_time + motion.duration
+        if not self._motions and self.state == 1:
+            self.state = 2
+        if dt > 0:
+            self.tcp_speed = math.sqrt(sum((a - b) ** 2 for a, b in zip(self.pose[:3], last_pose[:3]))) / dt
+            self.joint_speeds = [(a - b) / dt for a, b in zip(self.angles, last_angles)]
+
+    def handle(self, funcode, payload, trans_id, conn=None):
+        """
+        :return: payload of the response (without the state byte)
+        """
+        if funcode in _LINE_FUNCODES or funcode in _JOINT_FUNCODES \
+                or funcode in (Reg.MOVE_RELATIVE, Reg.SLEEP_INSTT):
+            self._queue_motion(funcode, payload, trans_id, conn)
+            # the motions with only_check_type are answered with 3 bytes, ignored by the others
+            return bytes(3)
+        handler = self.handlers.get(funcode, None)
+        ret = DEFAULT_RESPONSE if handler is None else handler(payload)
+        if funcode in _TRIGGER_FUNCODES and self.feedback_type & XCONF.FeedbackType.TRIGGER:
+            self.feedback(conn, trans_id, XCONF.FeedbackType.TRIGGER, funcode)
+        return ret or b''
+
+    def _queue_motion(self, funcode, payload, trans_id, conn):
+        if funcode == Reg.SLEEP_INSTT:
+            motion = _Motion('sleep', funcode, trans_id, self.feedback_type, conn, duration=max(_floats(payload, 1) + [0]))
+        elif funcode in _JOINT_FUNCODES:
+            values = _floats(payload, 10)
+            if len(values) < 9 or (len(payload) > 40 and payload[40] > 0):
+                return
+            motion = _Motion('joint', funcode, trans_id, self.feedback_type, conn, values[:7], values[7], values[8])
+        elif funcode == Reg.MOVE_RELATIVE:
+            values = _floats(payload, 11)
+            if len(values) < 11 or (len(payload) > 46 and payload[46] > 0):
+                return
+            if len(payload) > 44 and payload[44]:
+                target = [a + d for a, d in zip(self._target('joint'), values[:7])]
+                motion = _Motion('joint', funcode, trans_id, self.feedback_type, conn, target, values[7], values[8])
+            else:
+                target = [a + d for a, d in zip(self._target('line'), values[:6])]
+                motion = _Motion('line', funcode, trans_id, self.feedback_type, conn, target, values[7], values[8])
+        else:
+            values = _floats(payload, 9)
+            if len(values) < 8:
+                return
+            relative = funcode == Reg.MOVE_LINE_TOOL
+            if funcode == Reg.MOVE_LINE and len(payload) >= 43:
+                # move_line_common: 10 floats + [coord, is_axis_angle, only_check_type]
+                check_offset, relative = 42, payload[40] == 1
+            elif funcode == Reg.MOVE_LINEB:
+                check_offset = 40
+            elif funcode == Reg.MOVE_LINE_AA:
+                # 9 floats + [coord, relative, only_check_type]
+                check_offset, relative = 38, len(payload) > 37 and payload[37] == 1
+            else:
+                check_offset = 36
+            if len(payload) > check_offset and payload[check_offset] > 0:
+                return
+            target = values[:6]
+            if relative:
+                # the tool coordinate is approximated by the base coordinate
+                target = [a + d for a, d in zip(self._target('line'), target)]
+            motion = _Motion('line', funcode, trans_id, self.feedback_type, conn, target, values[6], values[7])
+        if not self.is_ready or self.mode != 0:
+            return
+        self._motions.append(motion)
+        if self.state == 2:
+            self.state = 1
+
+    def _target(self, kind):
+        # the motions are relative to the target of the last queued motion of the same kind
+        for motion in reversed(self._motions):
+            if motion.kind == kind:
+                return motion.target
+        return self.angles if kind == 'joint' else self.pose
+
+    def _motion_enable(self, payload):
+        if len(payload) >= 2:
+            mask = (1 << self.axis) - 1 if payload[0] == 8 else 1 << (payload[0] - 1)
+            if payload[1]:
+                self.mtable |= mask
+                self.mtbrake |= mask
+            else:
+                self.mtable &= ~mask
+                self.mtbrake &= ~mask
+                self._discard_motions()
+                self.state = 4
+
+    def _set_state(self, payload):
+        state = payload[0] if payload else 0
+        if state == 0:
+            if self._next_mode is not None:
+                self.mode, self._next_mode = self._next_mode, None
+            if self._paused_at is not None:
+                # resume: the current motion is shifted by the pause
+                if self._motions and self._motions[0].start_time is not None:
+                    self._motions[0].start_time += time.monotonic() - self._paused_at
+                self._paused_at = None
+            if self.error_code == 0:
+                self.state = 1 if self._motions else 2
+        elif state == 3:
+            if self.state == 1:
+                self._paused_at = time.monotonic()
+                self.state = 3
+        elif state == 4:
+            self._discard_motions()
+            self.state = 4
+
+    def _set_mode(self, payload):
+        # the mode is switched by the next set_state(0)
+        self._next_mode = payload[0] if payload else 0
+
+    def _clean_error(self, payload):
+        self.error_code = 0
+
+    def _clean_warn(self, payload):
+        self.warn_code = 0
+
+    def _set_tcp_offset(self, payload):
+        values = _floats(payload, 6)
+        if len(values) == 6:
+            self.pose_offset = values
+
+    def _set_tcp_load(self, payload):
+        values = _floats(payload, 4)
+        if len(values) == 4:
+            self.tcp_load = values
+
+    def _set_feedback_type(self, payload):
+        self.feedback_type = payload[0] if payload else 0
+
+    def _move_servoj(self, payload):
+        values = _floats(payload, 7)
+        if self.mode == 1 and self.is_ready and len(values) == 7:
+            self.angles = values
+
+    def _move_servo_cart(self, payload):
+        values = _floats(payload, 6)
+        if self.mode == 1 and self.is_ready and len(values) == 6:
+            self.pose = values
+
+    def set_error(self, error_code):
+        """
+        Raise a controller error (0 clears it), the motions are discarded and the arm is stopped
+        """
+        self.error_code = error_code
+        if error_code:
+            self._discard_motions()
+            self.state = 4
+
+    def set_warn(self, warn_code):
+        self.warn_code = warn_code
+
+    def report_values(self):
+        # values of the report frames, see the report layouts
+        return {
+            'state_mode': (self.state & 0x0F) | (self.mode << 4),
+            'cmd_num': self.cmd_num,
+            'angles': self.angles,
+            'pose': self.pose,
+            'torque': [0.0] * 7,
+            'mtbrake': self.mtbrake,
+            'mtable': self.mtable,
+            'error_code': self.error_code,
+            'warn_code': self.warn_code,
+            'pose_offset': self.pose_offset,
+            'tcp_load': self.tcp_load,
+            'collis_sens': self.collis_sens,
+            'teach_sens': self.teach_sens,
+            'gravity_direction': [0.0, 0.0, -1.0],
+            'arm_info': [self.arm_type, self.axis, 0, 0, 0, 0],
+            'trs_msg': [10000.0, 0.1, 50000.0, 0.1, 1000.0],
+            'p2p_msg': [1000.0, 0.01, 20.0, 0.01, math.pi],
+            'rot_msg': [1000.0, 20.0],
+            'temperatures': [30] * 7,
+            'speeds': [self.tcp_speed] + self.joint_speeds,
+            'count': self.count,
+            'voltages': [4800] * 7,
+            'currents': [0.0] * 7,
+        }
+
+
+class _Client(object):
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.send_lock = threading.Lock()
+        self.alive = True
+
+    def send(self, data):
+        with self.send_lock:
+            try:
+                self.sock.sendall(data)
+                return True
+            except (OSError, socket.timeout):
+                self.close()
+                return False
+
+    def close(self):
+        self.alive = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ControllerSimulator(object):
+    """
+    Simulated controller listening on host
+    :param host: address to bind, the ports are those of the controller
+    :param report_rate: report frames per second on every report port
+    :param arm: SimulatedArm, default is a new one (enabled=False, as the arm after power on)
+    :param response_delay: seconds waited before each response, to model the network and the controller
+    """
+    def __init__(self, host='127.0.0.1', report_rate=100, arm=None, response_delay=0):
+        self.host = host
+        self.report_rate = report_rate
+        self.arm = arm if arm is not None else SimulatedArm()
+        self.response_delay = response_delay
+        self._servers = []
+        self._threads = []
+        self._report_clients = {port: [] for port in REPORT_PORTS}
+        self._control_clients = []
+        self._stopped = threading.Event()
+        self.request_count = 0
+        self.report_count = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _listen(self, port, on_accept):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, port))
+        server.listen(16)
+        self._servers.append(server)
+        self._spawn(self._accept_loop, server, port, on_accept)
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def start(self):
+        self._stopped.clear()
+        for port in CONTROL_PORTS:
+            self._listen(port, lambda client, port: self._spawn(self._control_loop, client))
+        for port in REPORT_PORTS:
+            self._listen(port, lambda client, port: self._report_clients[port].append(client))
+        self._spawn(self._report_loop)
+        logger.info('controller simulator listening on {}'.format(self.host))
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        for server in self._servers:
+            try:
+                server.close()
+            except OSError:
+                pass
+        for client in self._control_clients + [c for clients in self._report_clients.values() for c in clients]:
+            client.close()
+        for thread in self._threads:
+            thread.join(1)
+        self._servers, self._threads, self._control_clients = [], [], []
+        self._report_clients = {port: [] for port in REPORT_PORTS}
+
+    def _accept_loop(self, server, port, on_accept):
+        while not self._stopped.is_set():
+            try:
+                sock, addr = server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(1)
+            on_accept(_Client(sock, addr), port)
+
+    def _flush_feedback(self):
+        with self.arm.lock:
+            outbox, self.arm.outbox = self.arm.outbox, []
+        for client, frame in outbox:
+            client.send(frame)
+
+    def _control_loop(self, client):
+        self._control_clients.append(client)
+        buffer = b''
+        while client.alive and not self._stopped.is_set():
+            try:
+                data = client.sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            responses = []
+            while len(buffer) >= 6:
+                length = struct.unpack_from('>H', buffer, 4)[0] + 6
+                if len(buffer) < length:
+                    break
+                frame, buffer = buffer[:length], buffer[length:]
+                response = self._handle_request(frame, client)
+                if response:
+                    responses.append(response)
+            if responses:
+                if self.response_delay > 0:
+                    time.sleep(self.response_delay)
+                # the requests written together (batch) are answered together
+                client.send(b''.join(responses))
+            self._flush_feedback()
+        client.close()
+        if client in self._control_clients:
+            self._control_clients.remove(client)
+
+    def _handle_request(self, frame, client):
+        if len(frame) < 7:
+            return None
+        trans_id, prot_id, _, funcode = MODBUS_TCP_HEADER.unpack_from(frame)
+        if prot_id == HEARTBEAT_PROTOCOL:
+            return None
+        self.request_count += 1
+        if prot_id == STANDARD_PROTOCOL:
+            # standard Modbus TCP is not simulated: illegal function exception
+            function = frame[7] if len(frame) > 7 else 0
+            return MODBUS_TCP_HEADER.pack(trans_id, prot_id, 3, funcode) + bytes([function | 0x80, 0x01])
+        with self.arm.lock:
+            self.arm.update()
+            payload = self.arm.handle(funcode, frame[7:], trans_id, client)
+            status = self.arm.status
+        return MODBUS_TCP_HEADER.pack(trans_id, prot_id, len(payload) + 2, funcode) + bytes([status]) + payload
+
+    def _report_loop(self):
+        interval = 1.0 / self.report_rate if self.report_rate > 0 else 0.01
+        next_time = time.monotonic()
+        while not self._stopped.is_set():
+            with self.arm.lock:
+                self.arm.update()
+                self.arm.count += 1
+                values = self.arm.report_values()
+            self._flush_feedback()
+            for port, layout in REPORT_PORTS.items():
+                clients = self._report_clients[port]
+                if not clients:
+                    continue
+                frame = layout.pack(values)
+                for client in list(clients):
+                    if not client.send(frame):
+                        clients.remove(client)
+                self.report_count += len(clients)
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stopped.wait(delay)
+            else:
+                next_time = time.monotonic()
+
+
+def _next_host(host, index):
+    parts = host.split('.')
+    parts[-1] = str(int(parts[-1]) + index)
+    return '.'.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated xArm controller')
+    parser.add_argument('host', nargs='?', default='127.0.0.1', help='address to bind')
+    parser.add_argument('--count', type=int, default=1, help='number of simulators, on consecutive addresses')
+    parser.add_argument('--rate', type=float, default=100, help='report frames per second')
+    parser.add_argument('--enabled', action='store_true', help='start with the motors enabled')
+    parser.add_argument('--delay', type=float, default=0, help='seconds waited before each response')
+    args = parser.parse_args()
+    simulators = [ControllerSimulator(_next_host(args.host, i), report_rate=args.rate,
+                                      arm=SimulatedArm(enabled=args.enabled), response_delay=args.delay).start()
+                  for i in range(args.count)]
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for simulator in simulators:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
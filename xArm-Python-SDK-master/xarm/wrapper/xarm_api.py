@@ -80,6 +80,46 @@ class XArmAPI(object):
                 Note: only available in the param `check_cmdnum_limit` is True
             check_is_ready: check if the arm is ready to move or not, default is True
                 Note: only available if firmware_version < 1.5.20
+            pipelined: pipelined command mode of the socket connection, default is False
+                Note: if True, responses are dispatched by transaction id and commands sent from different threads
+                    do not wait for each other's responses
+            io_hub: IOHub instance (or True for the shared one) which reads the sockets and sends the heartbeats, default is None
+                Note: the sockets of all arms sharing the hub are read by one selector thread, the reports and the feedback
+                    are handled on the workers of the hub (2 threads, one more while the others are busy), there is no
+                    receive, report or feedback thread per arm
+            flight_recorder: file path prefix (or FlightRecorder instance) to record the raw frames of the sockets, default is None
+                Note: the frames are appended to memory-mapped segment files {path}.{n:04d}.rec with a time index
+            replay: file path prefix (or Recording instance) of a recording to play back instead of connecting, default is None
+                Note: the requests are answered with the recorded responses of the same function code,
+                    so the recording should contain the connection (version check) of the recorded session
+            replay_speed: speed of the replay, default is 1.0 (the recorded pace), <= 0 means as fast as possible
+            report_policy: overflow policy of the report frames waiting for the report thread, default is 'latest'
+                'latest': only the latest frames are kept, the others are dropped
+                'lossless': every frame is kept, the queue grows past report_queue_size while the report thread is behind
+                'spill': the frames which do not fit are written to report_spill (or flight_recorder) instead
+            report_queue_size: size of the queue of the report frames, default is None (2 for 'latest', else 1024)
+            report_spill: file path prefix (or FlightRecorder instance) of the spilled frames, default is None
+            report_max_rate: reports handled per second by the report thread (state and report callbacks), default is 0 (no limit)
+                Note: the frames received meanwhile are left to report_policy, report consumers still get every frame
+            telemetry_history: capacity (number of reports) or TelemetryHistory instance of the history of the reports, default is None
+                Note: requires numpy, see the telemetry_history property
+            poll_status: poll the state when the report is not enabled (enable_report=False) with a socket connection, default is False
+                Note: the state is always polled with a serial connection (if enable_report is True)
+            poll_fast_interval: interval of the polling while the arm moves or a command was just sent, default is 0.01 (seconds)
+            poll_idle_interval: interval of the polling while the arm is idle, default is 0.2 (seconds)
+            motion_future: the motion commands called with wait=False return a MotionFuture instead of the code, default is False
+                Note: set_position/set_tool_position/set_position_aa/set_servo_angle/move_circle/move_gohome,
+                    can also be given per call with the future parameter (e.g. arm.set_position(..., future=True))
+            callback_executor: run the callbacks with a CallbackExecutor (True or a CallbackExecutor instance), default is None
+                every callback has its own bounded queue, run by worker threads, so a slow callback only delays itself
+                Note: see set_callback_options and get_callback_stats
+            callback_queue_size: size of the queue of every callback (callback_executor), default is 16
+            callback_overflow: overflow of the queues (callback_executor), default is None
+                None: 'latest' for the report/location callbacks, 'drop_oldest' for the other callbacks
+                'drop_oldest': the oldest call is dropped
+                'latest': the calls are coalesced, only the latest one is kept
+                'block': the report thread waits for free space
+            callback_budget: execution time (seconds) of a callback above which a warning is logged (callback_executor), default is 0.05
         """
         self._is_radian = is_radian
         self._arm = XArm(port=port,
@@ -175,6 +215,36 @@ class XArmAPI(object):
         """
         return self._arm.version_number
 
+    @property
+    def telemetry_history(self):
+        """
+        History of the reports (TelemetryHistory), None if the telemetry_history parameter was not given
+        Note: the lengths are in mm and the angles are in radians whatever is_radian is
+        Usage:
+            window = arm.telemetry_history.window(seconds=2)  # dict of numpy arrays: t, seq, state, mode, angles, ...
+            pose = arm.telemetry_history.pose_at(t)
+            stats = arm.telemetry_history.stats('joints_torque', seconds=1)  # {'count', 'min', 'max', 'rms'}
+        """
+        return self._arm.telemetry_history
+
+    @property
+    def motion_future(self):
+        """
+        The motion commands called with wait=False return a MotionFuture, see the motion_future parameter
+        """
+        return self._arm.motion_future
+
+    @motion_future.setter
+    def motion_future(self, value):
+        self._arm.motion_future = value
+
+    @property
+    def status_poll_rate(self):
+        """
+        Polls of the state per second achieved over the last second, 0 if the state is reported (report socket) or not polled
+        """
+        return self._arm.status_poll_rate
+
     @property
     def connected(self):
         """
@@ -812,7 +882,10 @@ class XArmAPI(object):
                         speed = speed / max_tcp_speed * max_joint_speed
                         mvacc = mvacc / max_tcp_acc * max_joint_acc
                     4. if there is no suitable IK, a C40 error will be triggered
-        :return: code
+            :param future: return a MotionFuture instead of the code if wait is False, default is self.motion_future (the motion_future parameter)
+                future.result(timeout): the code of the motion once it is finished (same as the code with wait=True)
+                Note: also supports future.add_done_callback(func) and asyncio.wrap_future(future)
+        :return: code (MotionFuture if future is True and wait is False)
             code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
                 code < 0: the last_used_position/last_used_tcp_speed/last_used_tcp_acc will not be modified
                 code >= 0: the last_used_position/last_used_tcp_speed/last_used_tcp_acc will be modified
@@ -926,8 +999,9 @@ class XArmAPI(object):
             MoveArcJoint: joint fusion motion with interpolation
                 ex: code = arm.set_servo_angle(..., radius=0)
                 Note: Need to set radius>=0
-        :param kwargs: reserved
-        :return: code
+        :param kwargs: extra parameters
+            :param future: return a MotionFuture instead of the code if wait is False, default is self.motion_future, see set_position
+        :return: code (MotionFuture if future is True and wait is False)
             code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
                 code < 0: the last_used_angles/last_used_joint_speed/last_used_joint_acc will not be modified
                 code >= 0: the last_used_angles/last_used_joint_speed/last_used_joint_acc will be modified
@@ -970,6 +1044,72 @@ class XArmAPI(object):
         return self._arm.set_servo_cartesian(mvpose, speed=speed, mvacc=mvacc, mvtime=mvtime, is_radian=is_radian,
                                              is_tool_coord=is_tool_coord, **kwargs)
 
+    def create_servo_streamer(self, trajectory, rate=200, kind='joint', speed=None, mvacc=None, is_radian=None,
+                              is_tool_coord=False, **kwargs):
+        """
+        Create a streamer which sends a whole trajectory with set_servo_angle_j (kind='joint') or
+            set_servo_cartesian (kind='cartesian') at a fixed rate from its own thread, instead of a user loop
+            with time.sleep, need to be set to servo motion mode(self.set_mode(1))
+        Note:
+            1. the frames are sent at fixed deadlines (start + k / rate), the thread sleeps and spins the last
+                spin seconds before every deadline, a late frame does not shift the following ones
+            2. the frames of a list/numpy trajectory are encoded before the start and checked against the limits
+                (see check_path_limits), a generator is encoded point by point
+            3. the streaming stops at the first frame which fails (error, disconnection), see streamer.code
+        Usage:
+            streamer = arm.create_servo_streamer(angles_array, rate=200)  # shape: (n, axis)
+            code = streamer.start()
+            code = streamer.wait()
+            print(streamer.stats())  # achieved_rate, period/jitter/send percentiles (ms), late/dropped frames
+
+        :param trajectory: points, [[angle-1, ..., angle-n], ...] (kind='joint') or
+            [[x, y, z, roll, pitch, yaw], ...] (kind='cartesian'), a list, a numpy array or a generator of points
+        :param rate: frames per second, 100~250 recommended
+        :param kind: 'joint' or 'cartesian'
+        :param speed: speed field written into every frame (the speed of move_servoj/move_servo_cart),
+            kind='joint': joint speed (°/s or rad/s, see is_radian), default is self.last_used_joint_speed
+            kind='cartesian': TCP speed (mm/s), default is self.last_used_tcp_speed
+        :param mvacc: acceleration field written into every frame (the acceleration of move_servoj/move_servo_cart),
+            kind='joint': joint acceleration (°/s^2 or rad/s^2, see is_radian), default is self.last_used_joint_acc
+            kind='cartesian': TCP acceleration (mm/s^2), default is self.last_used_tcp_acc
+        :param is_radian: the angles of the trajectory in radians or not, default is self.default_is_radian
+        :param is_tool_coord: is tool coordinate or not (kind='cartesian')
+        :param kwargs:
+            spin: seconds of busy waiting before every deadline, default is 0.001
+            drop_late: skip the frames whose deadline is over by more than a period, default is False
+            validate: check the trajectory against the limits before the start, default is True
+            disable_gc: disable the garbage collector of the process while streaming, default is False
+        :return: xarm.x3.servo_streamer.ServoStreamer instance
+        """
+        return self._arm.create_servo_streamer(trajectory, rate=rate, kind=kind, speed=speed, mvacc=mvacc,
+                                               is_radian=is_radian, is_tool_coord=is_tool_coord, **kwargs)
+
+    def create_motion_queue(self, low_watermark=4, high_watermark=16):
+        """
+        Create a queue which streams linear/joint motion targets (set_position/set_servo_angle without wait) from its
+            own thread, keeping the command cache of the controller filled between two watermarks, instead of
+            calling set_position(wait=False) per target (which sleeps while cmdnum >= max_cmdnum)
+        Note:
+            1. when the reported cmdnum drops to low_watermark, the targets are sent up to high_watermark in one
+                batch (one socket write, see batch), then the next report is waited for before the next batch
+            2. without the report (serial, enable_report=False), cmdnum is requested every 50 ms
+            3. the feeding stops at the first target which fails (error, disconnection), see queue.code
+            4. the targets are not checked against the limits, see check_path_limits
+        Usage:
+            queue = arm.create_motion_queue()
+            queue.extend(poses, radius=5)  # [[x, y, z, roll, pitch, yaw], ...], a list or a numpy array (n, 6)
+            queue.extend(angles, kind='joint', speed=50)  # [[angle-1, ..., angle-n], ...]
+            queue.extend_plan(plan)  # see plan_linear_path
+            code = queue.start()
+            print(queue.progress)  # {'total': n, 'sent': ..., 'completed': ..., 'executing': index or None}
+            code = queue.wait()
+
+        :param low_watermark: cmdnum from which the next batch is sent, default is 4
+        :param high_watermark: cmdnum after a batch, at most max_cmdnum, default is 16
+        :return: xarm.x3.motion_queue.MotionQueue instance
+        """
+        return self._arm.create_motion_queue(low_watermark=low_watermark, high_watermark=high_watermark)
+
     def move_circle(self, pose1, pose2, percent, speed=None, mvacc=None, mvtime=None, is_radian=None,
                     wait=False, timeout=None, is_tool_coord=False, is_axis_angle=False, **kwargs):
         """
@@ -1410,6 +1550,163 @@ class XArmAPI(object):
         """
         return self._arm.get_state()
 
+    def batch(self):
+        """
+        Create a command batch, the recorded commands are written to the socket together
+        and their responses are waited together, so a chain of N setters costs about one round trip
+        Usage:
+            with arm.batch() as batch:
+                batch.clean_warn()
+                batch.clean_error()
+                batch.motion_enable(True)
+                batch.set_mode(0)
+                batch.set_state(0)
+            print(batch.codes)
+
+        Note: batch.motion_enable/set_mode/set_state/clean_error/clean_warn are supported by name,
+            any other command of arm.arm_cmd can be recorded by its name as well (e.g. batch.tgpio_set_digital(0, 1))
+        :return: CommandBatch instance
+        """
+        return self._arm.batch()
+
+    def get_state_snapshot(self):
+        """
+        Get the latest RobotState snapshot, all its fields belong to the same report
+        Note: the snapshot is immutable and is not copied, the sequences are tuples,
+            the lengths are in mm and the angles are in radians whatever is_radian is
+
+        :return: RobotState instance (fields: seq, timestamp, state, mode, cmd_num, error_code, warn_code, is_ready,
+            position, angles, position_offset, joints_torque, motor_brake_states, motor_enable_states,
+            realtime_tcp_speed, realtime_joint_speeds, temperatures, ft_ext_force, ft_raw_force),
+            None if no report was received since the connection
+        """
+        return self._arm.get_state_snapshot()
+
+    def wait_for_new_snapshot(self, seq=None, timeout=None):
+        """
+        Wait for a RobotState snapshot newer than seq
+
+        :param seq: sequence number of the last seen snapshot, default is None (the current one)
+        :param timeout: seconds, default is None (wait until a snapshot is published or the connection is closed)
+        :return: RobotState instance, None on timeout or disconnection
+        """
+        return self._arm.wait_for_new_snapshot(seq=seq, timeout=timeout)
+
+    def get_comm_stats(self, reset=False):
+        """
+        Get the statistics of the commands sent since the connection (or the last reset), per function code
+        Note: the durations are in milliseconds
+
+        :param reset: clear the statistics after getting them, default is False
+        :return: tuple((code, stats)), only when code is 0, the returned result is correct.
+            stats: {
+                'elapsed': seconds since the connection or the last reset,
+                'total': {'count', 'rate', 'timeouts', 'errors', 'stale'},
+                'funcodes': {
+                    name (e.g. 'GET_STATE'): {
+                        'funcode', 'count', 'rate' (commands per second),
+                        'timeouts': number of requests without response in time,
+                        'errors': number of responses with a protocol error,
+                        'stale': number of responses dropped because nobody waited for them any more,
+                        'send': histogram of the time to write the request,
+                        'rtt': histogram of the time from the write to the response,
+                        'lock_wait': histogram of the time waited for the command lock,
+                    }
+                }
+            }
+            histogram: {'count', 'mean', 'min', 'p50', 'p90', 'p99', 'p999', 'max'}
+        """
+        return self._arm.get_comm_stats(reset=reset)
+
+    def set_callback_options(self, callback, overflow=None, maxsize=None, budget=None):
+        """
+        Set the options of the queue of a callback, only available if the callback_executor parameter is given
+        Note: None means the default of the executor (callback_overflow/callback_queue_size/callback_budget parameters)
+
+        :param callback: the registered callback (for all the events it is registered for)
+        :param overflow: 'drop_oldest', 'latest' or 'block', see the callback_overflow parameter
+        :param maxsize: size of the queue
+        :param budget: execution time (seconds) of a call above which a warning is logged, 0 means no warning
+        :return: code
+            code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
+        """
+        return self._arm.set_callback_options(callback, overflow=overflow, maxsize=maxsize, budget=budget)
+
+    def get_callback_stats(self):
+        """
+        Get the statistics of the queues of the callbacks, only available if the callback_executor parameter is given
+        Note: the durations of lag/exec_time are in milliseconds, blocked_time is in seconds
+
+        :return: tuple((code, stats)), only when code is 0, the returned result is correct.
+            stats: {
+                'name:callback': {
+                    'overflow', 'maxsize', 'depth', 'max_depth',
+                    'calls': calls run, 'dropped': calls dropped, 'coalesced': calls replaced by a later one,
+                    'blocked_time': time the report thread waited for free space (block),
+                    'budget', 'over_budget': calls which took longer than the budget,
+                    'lag': histogram of the time from the submission to the start of the calls,
+                    'exec_time': histogram of the execution time of the calls,
+                }
+            }
+        """
+        return self._arm.get_callback_stats()
+
+    def get_report_stats(self):
+        """
+        Get the statistics of the report frames of the current report connection and of the report consumers
+        Note: the durations of lag are in milliseconds
+
+        :return: tuple((code, stats)), only when code is 0, the returned result is correct.
+            stats: {
+                'queue': statistics of the queue of the report thread,
+                'consumers': [statistics of the queue of every report consumer],
+                'poll': statistics of the polling of the state (without report socket): {
+                    'rate', 'interval', 'active', 'polls', 'failures', 'requests', 'round_trip'
+                },
+            }
+            statistics: {
+                'policy', 'maxsize', 'depth', 'max_depth',
+                'received': frames received, 'delivered': frames handled,
+                'dropped': frames dropped by the policy, 'spilled': frames written to the spill recorder,
+                'overflowed': frames queued past maxsize (lossless),
+                'lag': histogram of the time from the reception to the handling of the frames,
+            }
+        """
+        return self._arm.get_report_stats()
+
+    def register_report_consumer(self, callback, policy='spill', maxsize=None, decode=True):
+        """
+        Register a consumer of every report frame (e.g. force logging, vibration analysis)
+        Note:
+            1. the callback is called on a thread of the consumer, in the order of the frames,
+                independently of the report callbacks and of the state of the arm
+            2. the reading of the report socket never waits for a consumer, a slow consumer only loses frames
+                ('latest', 'spill') or holds them in memory ('lossless')
+            3. the frame is only valid during the callback, frame.detach() (bytes(frame) if decode is False) keeps it
+
+        :param callback: callback(frame, timestamp)
+            frame: decoded report frame (fields as attributes, e.g. frame.ft_ext_force, frame.angles),
+                the raw frame (bytes-like) if decode is False
+            timestamp: time.monotonic() of the reception of the frame
+        :param policy: overflow policy of the queue of the consumer, default is 'spill'
+            'spill': the frames which do not fit in the queue are dropped, in the order of the reception
+            'latest': the oldest frames are dropped
+            'lossless': every frame is kept, the queue grows past maxsize while the callback is behind
+        :param maxsize: size of the queue of the consumer, default is None (1024 frames, 2 for 'latest')
+        :param decode: decode the frames with the layout of the report type, default is True
+        :return: True/False
+        """
+        return self._arm.register_report_consumer(callback, policy=policy, maxsize=maxsize, decode=decode)
+
+    def release_report_consumer(self, callback=None):
+        """
+        Release a report consumer
+
+        :param callback: None means all consumers
+        :return: True/False
+        """
+        return self._arm.release_report_consumer(callback)
+
     def set_state(self, state=0):
         """
         Set the xArm state
@@ -1773,6 +2070,81 @@ class XArmAPI(object):
         """
         return self._arm.is_joint_limit(joint, is_radian=is_radian)
 
+    def check_path_limits(self, path, is_joint=True, is_radian=None):
+        """
+        Check a whole path against the limits of the arm at once, without a request per waypoint
+            (is_tcp_limit/is_joint_limit), so that a path can be rejected before any of it is sent
+        Note:
+            1. requires numpy
+            2. joint path: the joint limits of the arm type, and the joint ranges of the reduced mode when it is on
+            3. cartesian path: the orientation limits of the arm type (shifted by the TCP/world offsets),
+                and the TCP boundary when the reduced mode or the safety boundary is on
+            4. the reduced mode states are requested once (see get_path_validator)
+            5. the limits of the SDK are checked, the controller may still reject a waypoint (singularity, collision)
+
+        :param path: waypoints, [[angle-1, ..., angle-n], ...] (is_joint=True) or [[x, y, z, roll, pitch, yaw], ...],
+            a list or a numpy array of shape (N, 6/7)
+        :param is_joint: the waypoints are joint angles or cartesian poses
+        :param is_radian: the angles of the path are in radians or not, default is self.default_is_radian
+        :return: tuple((code, indexes)), only when code is 0, the returned result is correct.
+            code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
+            indexes: indexes of the waypoints out of the limits, empty if the whole path is valid
+        """
+        return self._arm.check_path_limits(path, is_joint=is_joint, is_radian=is_radian)
+
+    def plan_linear_path(self, waypoints, segment_times=None, cycle_time=None, speed=None, mvacc=None, jerk=None,
+                         is_radian=None, **kwargs):
+        """
+        Plan blended linear moves through waypoints to reach a cycle time or per-segment times,
+            instead of computing the speeds by hand and waiting for every move
+        Note:
+            1. requires numpy
+            2. the speed of every segment is computed with a jerk-limited profile (speed/mvacc/jerk limits),
+                the arm stops at the first/last waypoint and where the path turns back (see max_blend_angle),
+                the other waypoints are blended with a radius fitting the cruise speed and the segment lengths
+            3. the times are estimates along the straight segments, the orientation changes are not timed
+            4. the waypoints are checked against the limits (see check_path_limits)
+        Usage:
+            code, plan = arm.plan_linear_path(pos_ls, cycle_time=12)
+            plan.summary()  # speeds, radii, estimated times, feasible
+            code = plan.execute(arm)  # or: for kwargs in plan.commands(): arm.set_position(**kwargs)
+
+        :param waypoints: [[x, y, z, roll, pitch, yaw], ...]
+        :param segment_times: time (s) of every segment (len(waypoints) - 1 values), default is None
+        :param cycle_time: total time (s) of the path, one cruise speed for the whole path, default is None
+            neither segment_times nor cycle_time: the fastest plan
+        :param speed: max speed (mm/s), default is the max TCP speed
+        :param mvacc: acceleration (mm/s^2) of the moves, default is the last TCP acceleration
+        :param jerk: TCP jerk (mm/s^3), default is self.tcp_jerk
+        :param is_radian: the roll/pitch/yaw of the waypoints in radians or not, default is self.default_is_radian
+        :param kwargs:
+            blend_ratio: max blend radius as a fraction of the shortest adjacent segment, default is 0.4
+            max_blend_angle: the arm stops where the path turns by more (radians), default is 150 degrees
+            min_length: segments shorter than this (mm) are not blended, default is 0.1
+        :return: tuple((code, plan))
+            code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
+                OUT_OF_RANGE (-8): waypoints out of the limits
+            plan: xarm.x3.motion_planner.MotionPlan instance, plan.is_feasible is False if the target time
+                can not be reached (plan.min_total_time is the shortest time)
+        """
+        return self._arm.plan_linear_path(waypoints, segment_times=segment_times, cycle_time=cycle_time,
+                                          speed=speed, mvacc=mvacc, jerk=jerk, is_radian=is_radian, **kwargs)
+
+    def get_path_validator(self, refresh=False):
+        """
+        Get the path validator used by check_path_limits (limits in mm and radians, see check_path_limits)
+        Usage:
+            code, validator = arm.get_path_validator()
+            validator.check_joints(path)  # indexes of the waypoints out of the limits
+            validator.joint_violations(path)  # bool array (N, axis), which joints are out of their limits
+
+        :param refresh: request the reduced mode states again
+        :return: tuple((code, validator)), only when code is 0, the returned result is correct.
+            code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
+            validator: xarm.x3.path_validator.PathValidator instance
+        """
+        return self._arm.get_path_validator(refresh=refresh)
+
     def emergency_stop(self):
         """
         Emergency stop (set_state(4) -> motion_enable(True) -> set_state(0))
@@ -2035,7 +2407,8 @@ class XArmAPI(object):
 
     def register_report_callback(self, callback=None, report_cartesian=True, report_joints=True,
                                  report_state=True, report_error_code=True, report_warn_code=True,
-                                 report_mtable=True, report_mtbrake=True, report_cmd_num=True):
+                                 report_mtable=True, report_mtbrake=True, report_cmd_num=True,
+                                 fields=None, max_rate=0, deadband=None):
         """
         Register the report callback, only available if enable_report is True
 
@@ -2059,6 +2432,15 @@ class XArmAPI(object):
         :param report_mtable: report motor enable states or not, default is True
         :param report_mtbrake: report motor brake states or not, default is True
         :param report_cmd_num: report cmdnum or not, default is True
+        :param fields: names of the callback data, default is None (the names selected by the report_xxx params)
+            Note: besides the names above, any field of RobotState can be used (e.g. 'temperatures', 'mode'),
+                their values are the same as in arm.get_state_snapshot() (tuples, mm, rad)
+        :param max_rate: max calls per second, default is 0 (every report)
+        :param deadband: dict of change thresholds, default is None (every report)
+            Note: if not None, a report is only delivered if a field changed since the last delivered report,
+                by more than its threshold for the fields in the dict, e.g. {'cartesian': 0.5},
+                the thresholds are in mm and rad whatever is_radian is
+            Note: if the callback runs in a callback thread and a call is still pending, its data is replaced by the latest
         :return: True/False
         """
         return self._arm.register_report_callback(callback=callback,
@@ -2069,9 +2451,13 @@ class XArmAPI(object):
                                                   report_warn_code=report_warn_code,
                                                   report_mtable=report_mtable,
                                                   report_mtbrake=report_mtbrake,
-                                                  report_cmd_num=report_cmd_num)
+                                                  report_cmd_num=report_cmd_num,
+                                                  fields=fields,
+                                                  max_rate=max_rate,
+                                                  deadband=deadband)
 
-    def register_report_location_callback(self, callback=None, report_cartesian=True, report_joints=True):
+    def register_report_location_callback(self, callback=None, report_cartesian=True, report_joints=True,
+                                          fields=None, max_rate=0, deadband=None):
         """
         Register the report location callback, only available if enable_report is True
 
@@ -2083,11 +2469,17 @@ class XArmAPI(object):
             }
         :param report_cartesian: report or not, True/False, default is True
         :param report_joints: report or not, True/False, default is True
+        :param fields: same as register_report_callback
+        :param max_rate: same as register_report_callback
+        :param deadband: same as register_report_callback
         :return: True/False
         """
         return self._arm.register_report_location_callback(callback=callback,
                                                            report_cartesian=report_cartesian,
-                                                           report_joints=report_joints)
+                                                           report_joints=report_joints,
+                                                           fields=fields,
+                                                           max_rate=max_rate,
+                                                           deadband=deadband)
 
     def register_connect_changed_callback(self, callback=None):
         """
@@ -3755,6 +4147,28 @@ class XArmAPI(object):
         """
         return self._arm.set_dh_params(dh_params, flag)
 
+    def get_kinematics(self, refresh=False):
+        """
+        Get the local kinematics of the arm (forward/inverse kinematics computed by the SDK, in batches)
+        Note:
+            1. requires numpy
+            2. built from the DH parameters of the controller (see get_dh_params), the nominal DH parameters of
+                xArm5/xArm6 are used if they are not available, xArm7 requires them
+            3. the TCP offset and the world offset of the arm are applied, the units are mm and radians
+            4. the IK solution is the one reached from the seed (default: the joint angles at the creation)
+            5. use kinematics.compare(arm, angles) to cross-check with get_forward_kinematics/get_inverse_kinematics
+        Usage:
+            code, kin = arm.get_kinematics()
+            poses = kin.fk(angles_list)  # shape: (n, axis) -> (n, 6)
+            angles, ok = kin.ik(poses)  # repeated targets are served from a LRU cache
+
+        :param refresh: request the DH parameters again
+        :return: tuple((code, kinematics)), only when code is 0, the returned result is correct.
+            code: See the [API Code Documentation](./xarm_api_code.md#api-code) for details.
+            kinematics: xarm.x3.kinematics.Kinematics instance
+        """
+        return self._arm.get_kinematics(refresh=refresh)
+
     def set_feedback_type(self, feedback_type):
         """
         Set the feedback type
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import math
+import time
+import asyncio
+from ..core.config.x_config import XCONF
+from ..core.comm.async_port import AsyncSocketPort
+from ..core.wrapper.uxbus_cmd_async import AsyncUxbusCmd
+from ..core.utils.log import logger
+from ..x3.code import APIState
+from ..x3.report import get_report_layout
+from ..x3.utils import to_radian, filter_invaild_number
+
+
+class AsyncXArmAPI(object):
+    REPORT_PORTS = {
+        'real': XCONF.SocketConf.TCP_REPORT_REAL_PORT,
+        'normal': XCONF.SocketConf.TCP_REPORT_NORM_PORT,
+        'rich': XCONF.SocketConf.TCP_REPORT_RICH_PORT,
+    }
+
+    def __init__(self, port=None, is_radian=False, report_type='rich', enable_report=True, forbid_uds=False):
+        """
+        The asyncio API wrapper of xArm, no thread is created, every call to the controller is a coroutine
+        Usage:
+            arm = AsyncXArmAPI('192.168.1.185')
+            await arm.connect()
+            await arm.set_position(x=300, y=0, z=200, wait=True)
+            await arm.disconnect()
+
+        :param port: ip-address of the controller
+        :param is_radian: set the default unit is radians or not, default is False
+        :param report_type: 'real' / 'normal' / 'rich', the report socket feeds the properties
+        :param enable_report: connect the report socket or not, default is True
+        :param forbid_uds: forbid to use the unix domain socket of the controller or not, default is False
+        """
+        self._port = port
+        self._default_is_radian = is_radian
+        self._report_type = report_type if report_type in self.REPORT_PORTS else 'rich'
+        self._enable_report = enable_report
+        self._forbid_uds = forbid_uds
+        self._stream = None
+        self._stream_report = None
+        self.arm_cmd = None
+        self._state = 4
+        self._mode = 0
+        self._cmd_num = 0
+        self._error_code = 0
+        self._warn_code = 0
+        self._angles = [0] * 7
+        self._position = [201.5, 0, 140.5, 3.1415926, 0, 0]
+        self._last_report_time = 0
+        self._last_tcp_speed = 100  # mm/s, rad/s
+        self._last_tcp_acc = 2000  # mm/s^2, rad/s^2
+        self._last_joint_speed = 0.3490658503988659  # 20 °/s
+        self._last_joint_acc = 8.726646259971648  # 500 °/s^2
+
+    @property
+    def connected(self):
+        return self._stream is not None and self._stream.connected
+
+    @property
+    def reported(self):
+        return self._stream_report is not None and self._stream_report.connected
+
+    @property
+    def default_is_radian(self):
+        return self._default_is_radian
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def cmd_num(self):
+        return self._cmd_num
+
+    @property
+    def error_code(self):
+        return self._error_code
+
+    @property
+    def warn_code(self):
+        return self._warn_code
+
+    @property
+    def has_err_warn(self):
+        return self._error_code != 0 or self._warn_code != 0
+
+    @property
+    def angles(self):
+        return self._angles if self._default_is_radian else [math.degrees(angle) for angle in self._angles]
+
+    @property
+    def position(self):
+        return [math.degrees(self._position[i]) if 2 < i < 6 and not self._default_is_radian
+                else self._position[i] for i in range(len(self._position))]
+
+    @property
+    def last_report_time(self):
+        return self._last_report_time
+
+    async def connect(self, port=None):
+        self._port = port if port is not None else self._port
+        if self.connected:
+            return 0
+        self._stream = AsyncSocketPort(self._port, XCONF.SocketConf.TCP_CONTROL_PORT, heartbeat=True,
+                                       buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, forbid_uds=self._forbid_uds)
+        if not await self._stream.connect():
+            return APIState.NOT_CONNECTED
+        self.arm_cmd = AsyncUxbusCmd(self._stream)
+        if self._enable_report:
+            self._stream_report = AsyncSocketPort(self._port, self.REPORT_PORTS[self._report_type], buffer_size=1024,
+                                                  forbid_uds=self._forbid_uds, report_callback=self._handle_report_data)
+            await self._stream_report.connect()
+        await self.get_err_warn_code()
+        await self.get_state()
+        return 0
+
+    async def disconnect(self):
+        for stream in (self._stream_report, self._stream):
+            if stream is not None:
+                stream.close()
+        # let the transports finish closing
+        await asyncio.sleep(0)
+
+    def get_comm_stats(self, reset=False):
+        """
+        Same as XArmAPI.get_comm_stats, not a coroutine
+        """
+        if self.arm_cmd is None:
+            return APIState.NOT_CONNECTED, {}
+        return 0, self.arm_cmd.stats.snapshot(reset=reset)
+
+    def _handle_report_data(self, data):
+        try:
+            frame = get_report_layout(self._report_type).decode(data)
+            self._state, self._mode = frame.state_mode & 0x0F, frame.state_mode >> 4
+            self._cmd_num = frame.cmd_num
+            self._angles = [filter_invaild_number(angle, 6, default=self._angles[i]) for i, angle in enumerate(frame.angles)]
+            self._position = [filter_invaild_number(pos, 6, default=self._position[i]) for i, pos in enumerate(frame.pose)]
+            if frame.has('error_code'):
+                self._error_code, self._warn_code = frame.error_code, frame.warn_code
+            self._last_report_time = time.monotonic()
+        except Exception as e:
+            logger.error(e)
+
+    def _check_code(self, code, is_move_cmd=False):
+        if is_move_cmd:
+            if code in [0, XCONF.UxbusState.WAR_CODE]:
+                return 0 if self.arm_cmd.state_is_ready else XCONF.UxbusState.STATE_NOT_READY
+            return code
+        return 0 if code in [0, XCONF.UxbusState.ERR_CODE, XCONF.UxbusState.WAR_CODE, XCONF.UxbusState.STATE_NOT_READY] else code
+
+    async def get_version(self):
+        if not self.connected:
+            return APIState.NOT_CONNECTED, ''
+        ret = await self.arm_cmd.get_version()
+        ret[0] = self._check_code(ret[0])
+        version = ''.join(map(chr, ret[1:])).strip(chr(0)) if ret[0] == 0 else ''
+        return ret[0], version
+
+    async def get_state(self):
+        if not self.connected:
+            return APIState.NOT_CONNECTED, self._state
+        ret = await self.arm_cmd.get_state()
+        ret[0] = self._check_code(ret[0])
+        if ret[0] == 0:
+            self._state = ret[1]
+        return ret[0], self._state
+
+    async def get_cmdnum(self):
+        if not self.connected:
+            return APIState.NOT_CONNECTED, self._cmd_num
+        ret = await self.arm_cmd.get_cmdnum()
+        ret[0] = self._check_code(ret[0])
+        if ret[0] == 0:
+            self._cmd_num = ret[1]
+        return ret[0], self._cmd_num
+
+    async def get_err_warn_code(self):
+        if not self.connected:
+            return APIState.NOT_CONNECTED, [self._error_code, self._warn_code]
+        ret = await self.arm_cmd.get_err_code()
+        ret[0] = self._check_code(ret[0])
+        if ret[0] == 0:
+            self._error_code, self._warn_code = ret[1:3]
+        return ret[0], [self._error_code, self._warn_code]
+
+    async def get_position(self, is_radian=None):
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        if not self.connected:
+            return APIState.NOT_CONNECTED, self._position
+        ret = await self.arm_cmd.get_tcp_pose()
+        ret[0] = self._check_code(ret[0])
+        if ret[0] == 0 and len(ret) > 6:
+            self._position = [filter_invaild_number(ret[i], 6, default=self._position[i - 1]) for i in range(1, 7)]
+        return ret[0], [math.degrees(self._position[i]) if 2 < i < 6 and not is_radian else self._position[i]
+                        for i in range(len(self._position))]
+
+    async def get_servo_angle(self, is_radian=None):
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        if not self.connected:
+            return APIState.NOT_CONNECTED, self._angles
+        ret = await self.arm_cmd.get_joint_pos()
+        ret[0] = self._check_code(ret[0])
+        if ret[0] == 0 and len(ret) > 7:
+            self._angles = [filter_invaild_number(ret[i], 6, default=self._angles[i - 1]) for i in range(1, 8)]
+        return ret[0], [angle if is_radian else math.degrees(angle) for angle in self._angles]
+
+    async def motion_enable(self, enable=True, servo_id=None):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        ret = await self.arm_cmd.motion_en(8 if servo_id is None else servo_id, int(enable))
+        await self.get_state()
+        return self._check_code(ret[0])
+
+    async def set_mode(self, mode=0):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        ret = await self.arm_cmd.set_mode(mode)
+        return self._check_code(ret[0])
+
+    async def set_state(self, state=0):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        ret = await self.arm_cmd.set_state(state)
+        await self.get_state()
+        return self._check_code(ret[0])
+
+    async def clean_error(self):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        ret = await self.arm_cmd.clean_err()
+        await self.get_state()
+        return self._check_code(ret[0])
+
+    async def clean_warn(self):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        ret = await self.arm_cmd.clean_war()
+        return self._check_code(ret[0])
+
+    async def set_position(self, x=None, y=None, z=None, roll=None, pitch=None, yaw=None, radius=None,
+                           speed=None, mvacc=None, mvtime=None, is_radian=None, wait=False, timeout=None):
+        """
+        Absolute cartesian motion, the missing coordinates are taken from the last known position
+        """
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        pose = [
+            self._position[0] if x is None else x,
+            self._position[1] if y is None else y,
+            self._position[2] if z is None else z,
+            self._position[3] if roll is None else to_radian(roll, is_radian),
+            self._position[4] if pitch is None else to_radian(pitch, is_radian),
+            self._position[5] if yaw is None else to_radian(yaw, is_radian),
+        ]
+        spd = self._last_tcp_speed if speed is None else speed
+        acc = self._last_tcp_acc if mvacc is None else mvacc
+        mvt = 0 if mvtime is None else mvtime
+        if radius is not None and radius >= 0:
+            ret = await self.arm_cmd.move_lineb(pose, spd, acc, mvt, radius)
+        else:
+            ret = await self.arm_cmd.move_line(pose, spd, acc, mvt)
+        code = self._check_code(ret[0], is_move_cmd=True)
+        if code == 0:
+            self._last_tcp_speed, self._last_tcp_acc = spd, acc
+            if wait:
+                return await self.wait_move(timeout)
+        return code
+
+    async def set_servo_angle(self, angle=None, speed=None, mvacc=None, mvtime=None, is_radian=None, wait=False, timeout=None):
+        """
+        Absolute joint motion, angle is the list of all joints
+        """
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        angles = [to_radian(val, is_radian) for val in angle]
+        angles += [0] * (7 - len(angles))
+        spd = self._last_joint_speed if speed is None else to_radian(speed, is_radian)
+        acc = self._last_joint_acc if mvacc is None else to_radian(mvacc, is_radian)
+        mvt = 0 if mvtime is None else mvtime
+        ret = await self.arm_cmd.move_joint(angles, spd, acc, mvt)
+        code = self._check_code(ret[0], is_move_cmd=True)
+        if code == 0:
+            self._last_joint_speed, self._last_joint_acc = spd, acc
+            if wait:
+                return await self.wait_move(timeout)
+        return code
+
+    async def set_servo_angle_j(self, angles, speed=None, mvacc=None, mvtime=None, is_radian=None):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        angs = [to_radian(angle, is_radian) for angle in angles]
+        angs += [0] * (7 - len(angs))
+        spd = self._last_joint_speed if speed is None else to_radian(speed, is_radian)
+        acc = self._last_joint_acc if mvacc is None else to_radian(mvacc, is_radian)
+        ret = await self.arm_cmd.move_servoj(angs, spd, acc, 0 if mvtime is None else mvtime)
+        return self._check_code(ret[0], is_move_cmd=True)
+
+    async def set_servo_cartesian(self, mvpose, speed=None, mvacc=None, is_radian=None, is_tool_coord=False):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        tcp_pos = [to_radian(mvpose[i], is_radian or i <= 2) for i in range(6)]
+        spd = self._last_tcp_speed if speed is None else speed
+        acc = self._last_tcp_acc if mvacc is None else mvacc
+        ret = await self.arm_cmd.move_servo_cartesian(tcp_pos, spd, acc, int(is_tool_coord))
+        return self._check_code(ret[0], is_move_cmd=True)
+
+    async def move_gohome(self, speed=None, mvacc=None, mvtime=None, is_radian=None, wait=False, timeout=None):
+        if not self.connected:
+            return APIState.NOT_CONNECTED
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        spd = 0.8726646259971648 if speed is None else to_radian(speed, is_radian)  # 50 °/s
+        acc = 17.453292519943297 if mvacc is None else to_radian(mvacc, is_radian)  # 1000 °/s^2
+        ret = await self.arm_cmd.move_gohome(spd, acc, 0 if mvtime is None else mvtime)
+        code = self._check_code(ret[0], is_move_cmd=True)
+        if code == 0 and wait:
+            return await self.wait_move(timeout)
+        return code
+
+    async def wait_move(self, timeout=None):
+        """
+        Wait until the motion is finished, same rules as XArmAPI.wait_move (without feedback): the state is
+            sampled every 50 ms (from the report socket if it is connected), the motion is finished after
+            2 samples without motion (10 if it was not moving at the start), state 5 counts as no motion
+            and stops the wait after 20 samples
+        """
+        expired = time.monotonic() + timeout if timeout is not None else 0
+        code, state = await self.get_state()
+        cnt = 0
+        state5_cnt = 0
+        max_cnt = 2 if code == 0 and state == 1 else 10
+        while timeout is None or time.monotonic() < expired:
+            if not self.connected:
+                return APIState.NOT_CONNECTED
+            if self._error_code != 0:
+                return APIState.HAS_ERROR
+            if self._mode != 0 and self._mode != 11:
+                return 0
+            if self.reported:
+                state = self._state
+            else:
+                code, state = await self.get_state()
+                if code != 0:
+                    return code
+            if state >= 4:
+                if state == 5:
+                    state5_cnt += 1
+                if state != 5 or state5_cnt >= 20:
+                    return APIState.EMERGENCY_STOP
+            else:
+                state5_cnt = 0
+            if state in (0, 1, 3) or (self.reported and self._cmd_num > 0):
+                cnt = 0
+                max_cnt = 2
+            else:
+                cnt += 1
+                if cnt >= max_cnt:
+                    return 0
+            await asyncio.sleep(0.05)
+        return APIState.WAIT_FINISH_TIMEOUT
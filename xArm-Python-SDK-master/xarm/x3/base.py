@@ -12,7 +12,6 @@ import time
 import math
 import uuid
 import queue
-import struct
 import threading
 try:
     from multiprocessing.pool import ThreadPool
@@ -31,7 +30,7 @@ if not hasattr(math, 'inf'):
     setattr(math, 'inf', float('inf'))
 from .events import Events
 from ..core.config.x_config import XCONF
-from ..core.comm import SocketPort
+from ..core.comm import SocketPort, IOHub, FlightRecorder, ReplayPort, ReportQueue, ReportConsumer
 try:
     from ..core.comm import SerialPort
 except:
@@ -41,8 +40,16 @@ from ..core.utils.log import logger, pretty_print
 from ..core.utils import convert
 from ..core.config.x_code import ControllerWarn, ControllerError, ControllerErrorCodeMap, ControllerWarnCodeMap
 from .utils import compare_time, compare_version, filter_invaild_number
+from .report import get_report_layout, bits_to_list, cgpio_states_from_frame
 from .decorator import xarm_is_connected, xarm_is_ready, xarm_is_not_simulation_mode, xarm_wait_until_cmdnum_lt_max, xarm_wait_until_not_pause
 from .code import APIState
+from .batch import CommandBatch
+from .robot_state import RobotState
+from .telemetry import TelemetryHistory
+from .status_poller import StatusPoller
+from .motion_future import MotionFuture
+from .callback_executor import CallbackExecutor
+from .kinematics import Kinematics
 from ..tools.threads import ThreadManage
 from ..version import __version__
 
@@ -53,6 +60,13 @@ print('SDK_VERSION: {}'.format(__version__))
 
 
 class Base(BaseObject, Events):
+    # seconds without published state after which the motion waits poll get_state
+    _WAIT_REPORT_STALL = 0.5
+    # seconds without reported motion after which wait_move returns (a motion may not start at all)
+    _WAIT_MOVE_SETTLE = 0.5
+    # published states which may be older than a command sent meanwhile (reports waiting in the report queue)
+    _STALE_REPORT_STATES = 3
+
     def __init__(self, port=None, is_radian=False, do_not_open=False, **kwargs):
         if kwargs.get('init', False):
             super(Base, self).__init__()
@@ -79,8 +93,34 @@ class Base(BaseObject, Events):
             self._check_is_pause = kwargs.get('check_is_pause', True)
             self._timed_comm = kwargs.get('timed_comm', True)
             self._timed_comm_interval = kwargs.get('timed_comm_interval', 30)
+            self._pipelined = kwargs.get('pipelined', False)
+            self._io_hub = kwargs.get('io_hub', None)
+            if self._io_hub is True:
+                self._io_hub = IOHub.get_shared()
+            self._flight_recorder = kwargs.get('flight_recorder', None)
+            if isinstance(self._flight_recorder, str):
+                self._flight_recorder = FlightRecorder(self._flight_recorder)
+            self._replay = kwargs.get('replay', None)
+            self._replay_speed = kwargs.get('replay_speed', 1.0)
+            # overflow policy of the report frames waiting for the report thread, see ReportQueue
+            self._report_policy = kwargs.get('report_policy', ReportQueue.LATEST)
+            self._report_queue_size = kwargs.get('report_queue_size', None)
+            self._report_spill = kwargs.get('report_spill', None)
+            if isinstance(self._report_spill, str):
+                self._report_spill = FlightRecorder(self._report_spill)
+            # reports handled per second by the report thread (state and callbacks), 0 means no limit
+            self._report_max_rate = kwargs.get('report_max_rate', 0)
+            # ReportConsumer tuple, every frame is given to them by the report socket reader
+            self._report_consumers = ()
+            # polling of the state without report socket (always for serial, on demand for socket)
+            self._poll_status = kwargs.get('poll_status', False)
+            self._status_poller = StatusPoller(self, fast_interval=kwargs.get('poll_fast_interval', 0.01),
+                                               idle_interval=kwargs.get('poll_idle_interval', 0.2))
             self._timed_comm_t = None
             self._timed_comm_t_alive = False
+            self._timed_comm_timer = None
+            self._timed_comm_cnt = 0
+            self._timed_comm_last_send_time = 0
 
             self._baud_checkset = kwargs.get('baud_checkset', True)
             self._default_bio_baud = kwargs.get('default_bio_baud', 2000000)
@@ -93,6 +133,14 @@ class Base(BaseObject, Events):
             self._asyncio_loop_alive = False
             self._asyncio_loop_thread = None
             self._pool = None
+            # bounded per-callback queues run by worker threads, True or a CallbackExecutor instance
+            self._callback_executor = kwargs.get('callback_executor', None)
+            if self._callback_executor is True:
+                self._callback_executor = CallbackExecutor(
+                    workers=max(self._max_callback_thread_count, 2), maxsize=kwargs.get('callback_queue_size', 16),
+                    overflow=kwargs.get('callback_overflow', None), budget=kwargs.get('callback_budget', 0.05))
+            elif not isinstance(self._callback_executor, CallbackExecutor):
+                self._callback_executor = None
             self._thread_manage = ThreadManage()
 
             self._rewrite_modbus_baudrate_method = kwargs.get('rewrite_modbus_baudrate_method', True)
@@ -116,6 +164,12 @@ class Base(BaseObject, Events):
             self.arm_cmd_503 = None # 透传使用
             self._stream_report = None
             self._report_thread = None
+            # io_hub: no report thread, the report frames are handled by _report_task and the connections
+            # kept by _report_timer, both run on the workers of the hub
+            self._report_timer = None
+            self._report_task = None
+            self._report_resume_timer = None
+            self._report_handle_time = 0
             self._only_report_err_warn_changed = True
 
             self._last_position = [201.5, 0, 140.5, 3.1415926, 0, 0]  # [x(mm), y(mm), z(mm), roll(rad), pitch(rad), yaw(rad)]
@@ -143,6 +197,7 @@ class Base(BaseObject, Events):
             self._error_code = 0
             self._warn_code = 0
             self._servo_codes = [[0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0]]
+            self._servo_codes_raw = b''
             self._cmd_num = 0
             self._arm_type = XCONF.Robot.Type.XARM7_X4
             self._arm_axis = XCONF.Robot.Axis.XARM7
@@ -177,6 +232,7 @@ class Base(BaseObject, Events):
             self._temperatures = [0, 0, 0, 0, 0, 0, 0]
             self._voltages = [0, 0, 0, 0, 0, 0, 0]
             self._currents = [0, 0, 0, 0, 0, 0, 0]
+            self._currents_reported = False
 
             self._is_set_move = False
             self._pause_cond = threading.Condition()
@@ -240,12 +296,33 @@ class Base(BaseObject, Events):
             self._has_motion_cmd = False
             self._need_sync = False
 
+            # RobotState published per report, the sequence number keeps increasing over reconnections
+            self._state_snapshot = None
+            self._state_snapshot_seq = 0
+            self._state_snapshot_cond = threading.Condition()
+            # optional ring buffer of the reports (numpy), capacity in reports or a TelemetryHistory instance
+            self._telemetry_history = kwargs.get('telemetry_history', None)
+            if self._telemetry_history is not None and not isinstance(self._telemetry_history, TelemetryHistory):
+                self._telemetry_history = TelemetryHistory(capacity=self._telemetry_history)
+            # local kinematics (numpy) built from the DH parameters, see get_kinematics
+            self._kinematics = None
+            # limits of the paths (numpy) with the reduced mode states, see XArm.get_path_validator
+            self._path_validator = None
+
             self._support_feedback = False
             self._feedback_que = queue.Queue()
             self._feedback_thread = None
             self._fb_key_transid_map = {}
             self._fb_transid_type_map = {}
             self._fb_transid_result_map = {}
+            # MotionFuture of the motion commands sent with future=True, see decorator.xarm_motion_future
+            self._motion_future = kwargs.get('motion_future', False)
+            self._motion_future_local = threading.local()
+            self._motion_future_lock = threading.Lock()
+            self._fb_transid_future_map = {}
+            # futures without feedback, resolved by one waiter thread (see _wait_motion_futures)
+            self._motion_future_pending = []
+            self._motion_future_waiter = None
 
             if not do_not_open:
                 self.connect()
@@ -275,6 +352,7 @@ class Base(BaseObject, Events):
         self._error_code = 0
         self._warn_code = 0
         self._servo_codes = [[0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0]]
+        self._servo_codes_raw = b''
         self._cmd_num = 0
         self._arm_master_id = 0
         self._arm_slave_id = 0
@@ -301,6 +379,7 @@ class Base(BaseObject, Events):
         self._temperatures = [0, 0, 0, 0, 0, 0, 0]
         self._voltages = [0, 0, 0, 0, 0, 0, 0]
         self._currents = [0, 0, 0, 0, 0, 0, 0]
+        self._currents_reported = False
 
         self._is_set_move = False
         self._pause_cond = threading.Condition()
@@ -365,6 +444,7 @@ class Base(BaseObject, Events):
         self._need_sync = False
         self._only_check_result = 0
         self._keep_heart = True
+        self._state_snapshot = None
 
     @staticmethod
     def log_api_info(msg, *args, code=0, **kwargs):
@@ -470,6 +550,22 @@ class Base(BaseObject, Events):
     def version_number(self):
         return self._major_version_number, self._minor_version_number, self._revision_version_number
 
+    @property
+    def telemetry_history(self):
+        return self._telemetry_history
+
+    @property
+    def motion_future(self):
+        return self._motion_future
+
+    @motion_future.setter
+    def motion_future(self, value):
+        self._motion_future = bool(value)
+
+    @property
+    def status_poll_rate(self):
+        return self._status_poller.rate if self._report_thread is not None and not self._stream_report else 0
+
     @property
     def connected(self):
         return self._stream is not None and self._stream.connected
@@ -784,6 +880,8 @@ class Base(BaseObject, Events):
                     self._pause_cnts -= 1
     
     def wait_until_cmdnum_lt_max(self):
+        # called before every motion command, the state is polled fast until the motion is reported
+        self._status_poller.wakeup()
         if not self._check_cmdnum_limit:
             return
         while self.connected and self.cmd_num >= self._max_cmd_num:
@@ -799,28 +897,35 @@ class Base(BaseObject, Events):
             # no check if version >= 1.5.20
             return True
 
+    def _timed_comm_tick(self):
+        curr_time = time.monotonic()
+        if self.arm_cmd and curr_time - self._timed_comm_last_send_time > 10 and curr_time - self.arm_cmd.last_comm_time > self._timed_comm_interval:
+            try:
+                if self._timed_comm_cnt == 0:
+                    code, _ = self.get_cmdnum()
+                elif self._timed_comm_cnt == 1:
+                    code, _ = self.get_state()
+                else:
+                    code, _ = self.get_err_warn_code()
+                self._timed_comm_cnt = (self._timed_comm_cnt + 1) % 3
+                if code >= 0:
+                    self._timed_comm_last_send_time = curr_time
+            except:
+                pass
+
+    def _timed_comm_hub_tick(self):
+        if not self.connected:
+            self._timed_comm_timer.cancel()
+        elif self._keep_heart:
+            self._timed_comm_tick()
+
     def _timed_comm_thread(self):
         self._timed_comm_t_alive = True
-        cnt = 0
-        last_send_time = 0
         while self.connected and self._timed_comm_t_alive:
-            curr_time = time.monotonic()
             if not self._keep_heart:
                 time.sleep(1)
                 continue
-            if self.arm_cmd and curr_time - last_send_time > 10 and curr_time - self.arm_cmd.last_comm_time > self._timed_comm_interval:
-                try:
-                    if cnt == 0:
-                        code, _ = self.get_cmdnum()
-                    elif cnt == 1:
-                        code, _ = self.get_state()
-                    else:
-                        code, _ = self.get_err_warn_code()
-                    cnt = (cnt + 1) % 3
-                    if code >= 0:
-                        last_send_time = curr_time
-                except:
-                    pass
+            self._timed_comm_tick()
             time.sleep(0.5)
 
     def _clean_thread(self):
@@ -834,7 +939,7 @@ class Base(BaseObject, Events):
     
     def connect_503(self):
         self._stream_503 = SocketPort(self._port, XCONF.SocketConf.TCP_CONTROL_PORT + 1,
-            heartbeat=self._enable_heartbeat, buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, forbid_uds=self._forbid_uds)
+            heartbeat=self._enable_heartbeat, buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, forbid_uds=self._forbid_uds, io_hub=self._io_hub)
         if not self.connected_503:
             return -1
         self.arm_cmd_503 = UxbusCmdTcp(self._stream_503, set_feedback_key_tranid=self._set_feedback_key_tranid)
@@ -852,7 +957,7 @@ class Base(BaseObject, Events):
         self._port = port if port is not None else self._port
         self._baudrate = baudrate if baudrate is not None else self._baudrate
         self._timeout = timeout if timeout is not None else self._timeout
-        if not self._port:
+        if not self._port and self._replay is None:
             raise Exception('can not connect to port/ip {}'.format(self._port))
         if self._timed_comm_t is not None:
             try:
@@ -861,31 +966,48 @@ class Base(BaseObject, Events):
                 self._timed_comm_t = None
             except:
                 pass
+        if self._timed_comm_timer is not None:
+            self._timed_comm_timer.cancel()
+            self._timed_comm_timer = None
+        self._stop_report_hub()
         self._is_first_report = True
         self._first_report_over = False
         self._init()
-        if isinstance(self._port, (str, bytes)):
-            if self._port == 'localhost' or re.match(
+        if self._replay is not None or isinstance(self._port, (str, bytes)):
+            if self._replay is not None or self._port == 'localhost' or re.match(
                     r"^(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$",
                     self._port):
-                self._stream = SocketPort(self._port, XCONF.SocketConf.TCP_CONTROL_PORT,
-                                          heartbeat=self._enable_heartbeat,
-                                          buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, forbid_uds=self._forbid_uds, fb_que=self._feedback_que)
+                use_hub = self._io_hub is not None and self._replay is None
+                if use_hub:
+                    # the feedback frames are handled on the workers of the hub, no feedback thread
+                    self._feedback_que = self._io_hub.queue(self._feedback_callback)
+                    self._report_task = self._io_hub.task(self._report_hub_handle)
+                self._stream = self._new_socket_port(XCONF.SocketConf.TCP_CONTROL_PORT,
+                                                     heartbeat=self._enable_heartbeat,
+                                                     buffer_size=XCONF.SocketConf.TCP_CONTROL_BUF_SIZE, fb_que=self._feedback_que)
                 if not self.connected:
                     raise Exception('connect socket failed')
 
                 self._report_error_warn_changed_callback()
-                self._feedback_thread = threading.Thread(target=self._feedback_thread_handle, daemon=True)
-                self._feedback_thread.start()
+                if not use_hub:
+                    self._feedback_thread = threading.Thread(target=self._feedback_thread_handle, daemon=True)
+                    self._feedback_thread.start()
 
                 self.arm_cmd = UxbusCmdTcp(self._stream, set_feedback_key_tranid=self._set_feedback_key_tranid)
                 self.arm_cmd.set_protocol_identifier(2)
+                self.arm_cmd.set_pipelined(self._pipelined)
                 self._stream_type = 'socket'
 
                 try:
                     if self._timed_comm:
-                        self._timed_comm_t = threading.Thread(target=self._timed_comm_thread, daemon=True)
-                        self._timed_comm_t.start()
+                        self._timed_comm_cnt = 0
+                        self._timed_comm_last_send_time = 0
+                        if self._io_hub is not None:
+                            # requests wait for their responses, so the tick runs on a worker of the hub
+                            self._timed_comm_timer = self._io_hub.call_every(0.5, self._timed_comm_hub_tick, blocking=True)
+                        else:
+                            self._timed_comm_t = threading.Thread(target=self._timed_comm_thread, daemon=True)
+                            self._timed_comm_t.start()
                 except:
                     pass
 
@@ -910,10 +1032,19 @@ class Base(BaseObject, Events):
                 elif self._max_callback_thread_count > 0 and ThreadPool is not None:
                     self._pool = ThreadPool(self._max_callback_thread_count)
 
-                if self._stream.connected and self._enable_report:
+                if self._stream.connected and self._enable_report and use_hub:
+                    self._start_report_link()
+                    self._report_timer = self._io_hub.call_every(0.5, self._report_hub_tick, blocking=True, delay=0)
+                    # the frames received before are handled now
+                    self._report_task.schedule()
+                elif self._stream.connected and self._enable_report:
                     self._report_thread = threading.Thread(target=self._report_thread_handle, daemon=True)
                     self._report_thread.start()
                     self._thread_manage.append(self._report_thread)
+                elif self._stream.connected and self._poll_status and self._replay is None:
+                    self._report_thread = threading.Thread(target=self._auto_get_report_thread, daemon=True)
+                    self._report_thread.start()
+                    self._thread_manage.append(self._report_thread)
 
                 self._report_connect_changed_callback()
             else:
@@ -975,7 +1106,9 @@ class Base(BaseObject, Events):
 
     def _run_callback(self, callback, msg, name='', enable_callback_thread=True):
         try:
-            if self._asyncio_loop_alive and enable_callback_thread:
+            if self._callback_executor is not None and enable_callback_thread:
+                self._callback_executor.submit(callback, msg, name=name)
+            elif self._asyncio_loop_alive and enable_callback_thread:
                 coroutine = self._async_run_callback(callback, msg)
                 asyncio.run_coroutine_threadsafe(coroutine, self._asyncio_loop)
             elif self._pool is not None and enable_callback_thread:
@@ -1002,6 +1135,7 @@ class Base(BaseObject, Events):
             return self.arm_cmd.set_modbus_baudrate_old(baudrate)
 
     def disconnect(self):
+        self._stop_report_hub()
         try:
             self._stream.close()
         except:
@@ -1029,7 +1163,12 @@ class Base(BaseObject, Events):
         self._report_connect_changed_callback(False, False)
         with self._pause_cond:
             self._pause_cond.notifyAll()
+        with self._state_snapshot_cond:
+            self._state_snapshot_cond.notify_all()
+        self._resolve_motion_futures(code=APIState.NOT_CONNECTED)
         self._clean_thread()
+        if self._flight_recorder is not None:
+            self._flight_recorder.close()
 
     def set_timeout(self, timeout):
         self._cmd_timeout = timeout
@@ -1065,8 +1204,61 @@ class Base(BaseObject, Events):
             return 0, self._default_linear_track_baud
         return APIState.API_EXCEPTION, 0
 
+    def _new_report_queue(self):
+        spill = self._report_spill if self._report_spill is not None else self._flight_recorder
+        return ReportQueue(self._report_policy, maxsize=self._report_queue_size, spill=spill,
+                           spill_recorded=spill is not None and spill is self._flight_recorder)
+
+    def _new_socket_port(self, server_port, **kwargs):
+        if server_port not in (XCONF.SocketConf.TCP_CONTROL_PORT, XCONF.SocketConf.TCP_CONTROL_PORT + 1):
+            kwargs['report_queue'] = self._new_report_queue()
+            kwargs['report_consumers'] = self._report_consumers
+            if self._report_task is not None:
+                kwargs['report_task'] = self._report_task
+        if self._replay is not None:
+            return ReplayPort(self._replay, server_port, speed=self._replay_speed,
+                              buffer_size=kwargs.get('buffer_size', XCONF.SocketConf.TCP_CONTROL_BUF_SIZE),
+                              fb_que=kwargs.get('fb_que', None), report_queue=kwargs.get('report_queue', None),
+                              report_consumers=kwargs.get('report_consumers', None))
+        return SocketPort(self._port, server_port, forbid_uds=self._forbid_uds, io_hub=self._io_hub,
+                          recorder=self._flight_recorder, **kwargs)
+
+    def _set_report_consumers(self, consumers):
+        # a new tuple is published, the reader of the report socket iterates the old one without a lock
+        self._report_consumers = tuple(consumers)
+        if self._stream_report is not None:
+            self._stream_report.report_consumers = self._report_consumers
+
+    def register_report_consumer(self, callback, policy=ReportQueue.SPILL, maxsize=None, decode=True):
+        if not callable(callback) or any(consumer.callback == callback for consumer in self._report_consumers):
+            return False
+        layout = get_report_layout(self._report_type, self._is_old_protocol) if decode else None
+        consumer = ReportConsumer(callback, policy=policy, maxsize=maxsize, layout=layout)
+        self._set_report_consumers(self._report_consumers + (consumer,))
+        return True
+
+    def release_report_consumer(self, callback=None):
+        consumers = [consumer for consumer in self._report_consumers if callback is not None and consumer.callback != callback]
+        removed = [consumer for consumer in self._report_consumers if consumer not in consumers]
+        self._set_report_consumers(consumers)
+        for consumer in removed:
+            consumer.stop()
+        return len(removed) > 0
+
+    def get_report_stats(self):
+        stream_report = self._stream_report
+        report_queue = getattr(stream_report, 'rx_que', None) if stream_report is not None else None
+        return 0, {
+            'queue': report_queue.stats() if isinstance(report_queue, ReportQueue) else {},
+            'consumers': [consumer.queue.stats() for consumer in self._report_consumers],
+            'poll': self._status_poller.stats() if self._report_thread is not None and not stream_report else {},
+        }
+
     def _connect_report(self):
         if self._enable_report:
+            if self._replay is not None and self._stream_report:
+                # the recording is over, it is not played again
+                return
             if self._stream_report:
                 try:
                     self._stream_report.close()
@@ -1074,20 +1266,14 @@ class Base(BaseObject, Events):
                     pass
                 time.sleep(2)
             if self._report_type == 'real':
-                self._stream_report = SocketPort(
-                    self._port, XCONF.SocketConf.TCP_REPORT_REAL_PORT,
-                    buffer_size=1024 if not self._is_old_protocol else 87,
-                    forbid_uds=self._forbid_uds)
+                self._stream_report = self._new_socket_port(
+                    XCONF.SocketConf.TCP_REPORT_REAL_PORT, buffer_size=1024 if not self._is_old_protocol else 87)
             elif self._report_type == 'normal':
-                self._stream_report = SocketPort(
-                    self._port, XCONF.SocketConf.TCP_REPORT_NORM_PORT,
-                    buffer_size=XCONF.SocketConf.TCP_REPORT_NORMAL_BUF_SIZE if not self._is_old_protocol else 87,
-                    forbid_uds=self._forbid_uds)
+                self._stream_report = self._new_socket_port(
+                    XCONF.SocketConf.TCP_REPORT_NORM_PORT, buffer_size=XCONF.SocketConf.TCP_REPORT_NORMAL_BUF_SIZE if not self._is_old_protocol else 87)
             else:
-                self._stream_report = SocketPort(
-                    self._port, XCONF.SocketConf.TCP_REPORT_RICH_PORT,
-                    buffer_size=1024 if not self._is_old_protocol else 187,
-                    forbid_uds=self._forbid_uds)
+                self._stream_report = self._new_socket_port(
+                    XCONF.SocketConf.TCP_REPORT_RICH_PORT, buffer_size=1024 if not self._is_old_protocol else 187)
 
     def __report_callback(self, report_id, item, name=''):
         if report_id in self._report_callbacks.keys():
@@ -1143,6 +1329,9 @@ class Base(BaseObject, Events):
     def _report_location_callback(self):
         if self.REPORT_LOCATION_ID in self._report_callbacks.keys():
             for item in self._report_callbacks[self.REPORT_LOCATION_ID]:
+                if 'subscription' in item:
+                    # fed by _publish_state_snapshot
+                    continue
                 callback = item['callback']
                 ret = {}
                 if item['cartesian']:
@@ -1154,6 +1343,8 @@ class Base(BaseObject, Events):
     def _report_callback(self):
         if self.REPORT_ID in self._report_callbacks.keys():
             for item in self._report_callbacks[self.REPORT_ID]:
+                if 'subscription' in item:
+                    continue
                 callback = item['callback']
                 ret = {}
                 if item['cartesian']:
@@ -1176,54 +1367,89 @@ class Base(BaseObject, Events):
                     ret['cmdnum'] = self._cmd_num
                 self._run_callback(callback, ret, name='report')
 
-    def _report_thread_handle(self):
-        main_socket_connected = self.connected
-        report_socket_connected = self.reported
-        protocol_identifier = 2
-        last_send_time = 0
+    def _start_report_link(self):
+        self._report_socket_connected = self.reported
+        self._report_protocol_identifier = 2
+        self._report_keep_alive_time = 0
+        self._report_connect_failed_cnt = 0
+        self._report_retry_time = 0
+
+    def _keep_report_link(self):
+        """
+        Keep the connections alive and connect the report socket again if it was closed
+        :return: 0 if the report socket is connected, 1 if not (try again 2s later), -1 to disconnect
+        """
         max_reconnect_cnts = 10
-        connect_failed_cnt = 0
+        curr_time = time.monotonic()
+        if self._keep_heart:
+            if self._report_protocol_identifier != 3 and self.version_is_ge(1, 8, 6) and self.arm_cmd.set_protocol_identifier(3) == 0:
+                self._report_protocol_identifier = 3
+            if self._report_protocol_identifier == 3 and curr_time - self._report_keep_alive_time > 10 and curr_time - self.arm_cmd.last_comm_time > 30:
+                code, _ = self.get_state()
+                # print('send heartbeat, code={}'.format(code))
+                if code >= 0:
+                    self._report_keep_alive_time = curr_time
+                if curr_time - self.arm_cmd.last_comm_time > 90:
+                    logger.error('client timeout over 90s, disconnect')
+                    return -1
+        if not self.reported:
+            if self._replay is not None and self._stream_report is not None:
+                logger.info('the replay of the recording is finished')
+                return -1
+            # self.get_err_warn_code()
+            if self._report_socket_connected:
+                self._report_socket_connected = False
+                self._report_connect_changed_callback(None, False)
+            self._connect_report()
+            if not self.reported:
+                self._report_connect_failed_cnt += 1
+                if self.connected and (self._report_connect_failed_cnt <= max_reconnect_cnts or self._report_protocol_identifier == 3):
+                    return 1
+                logger.error('report thread is break, connected={}, failed_cnts={}'.format(self.connected, self._report_connect_failed_cnt))
+                return -1
+        self._report_connect_failed_cnt = 0
+        if not self._report_socket_connected:
+            self._report_socket_connected = True
+            self._report_connect_changed_callback(None, True)
+        return 0
+
+    def _handle_report_frame(self, stream_report, recv_data):
+        try:
+            size = convert.bytes_to_u32(recv_data)
+            if self._is_old_protocol and size > 256:
+                self._is_old_protocol = False
+            self._handle_report_data(recv_data)
+        finally:
+            stream_report.release(recv_data)
+
+    def _report_link_closed(self):
+        if self._pause_cnts > 0:
+            with self._pause_cond:
+                self._pause_cond.notifyAll()
+        self.disconnect()
 
+    def _report_thread_handle(self):
+        self._start_report_link()
         while self.connected:
             try:
-                curr_time = time.monotonic()
-                if self._keep_heart:
-                    if protocol_identifier != 3 and self.version_is_ge(1, 8, 6) and self.arm_cmd.set_protocol_identifier(3) == 0:
-                        protocol_identifier = 3
-                    if protocol_identifier == 3 and curr_time - last_send_time > 10 and curr_time - self.arm_cmd.last_comm_time > 30:
-                        code, _ = self.get_state()
-                        # print('send heartbeat, code={}'.format(code))
-                        if code >= 0:
-                            last_send_time = curr_time
-                        if curr_time - self.arm_cmd.last_comm_time > 90:
-                            logger.error('client timeout over 90s, disconnect')
-                            break
-                if not self.reported:
-                    # self.get_err_warn_code()
-                    if report_socket_connected:
-                        report_socket_connected = False
-                        self._report_connect_changed_callback(main_socket_connected, report_socket_connected)
-                    self._connect_report()
-                    if not self.reported:
-                        connect_failed_cnt += 1
-                        if self.connected and (connect_failed_cnt <= max_reconnect_cnts or protocol_identifier == 3):
-                            time.sleep(2)
-                        elif not self.connected or protocol_identifier == 2:
-                            logger.error('report thread is break, connected={}, failed_cnts={}'.format(self.connected, connect_failed_cnt))
-                            break
-                        continue
-                    else:
-                        connect_failed_cnt = 0
-                connect_failed_cnt = 0
-                if not report_socket_connected:
-                    report_socket_connected = True
-                    self._report_connect_changed_callback(main_socket_connected, report_socket_connected)
-                recv_data = self._stream_report.read(1)
+                ret = self._keep_report_link()
+                if ret < 0:
+                    break
+                if ret > 0:
+                    time.sleep(2)
+                    continue
+                stream_report = self._stream_report
+                recv_data = stream_report.read(1)
                 if recv_data != -1:
-                    size = convert.bytes_to_u32(recv_data)
-                    if self._is_old_protocol and size > 256:
-                        self._is_old_protocol = False
-                    self._handle_report_data(recv_data)
+                    handle_start = time.monotonic()
+                    self._handle_report_frame(stream_report, recv_data)
+                    if self._report_max_rate > 0:
+                        # the frames received meanwhile are left to the policy of the report queue
+                        delay = 1.0 / self._report_max_rate - (time.monotonic() - handle_start)
+                        if delay > 0:
+                            time.sleep(delay)
+                    # the next frame may be waiting already (e.g. a replay as fast as possible)
+                    continue
                 # else:
                 #     if self.connected:
                 #         code, err_warn = self.get_err_warn_code()
@@ -1242,23 +1468,65 @@ class Base(BaseObject, Events):
                 if not self._stream_report or not self._stream_report.connected:
                     self._connect_report()
             time.sleep(0.001)
-        if self._pause_cnts > 0:
-            with self._pause_cond:
-                self._pause_cond.notifyAll()
-        self.disconnect()
+        self._report_link_closed()
+
+    def _report_hub_tick(self):
+        # io_hub: the connection part of the report thread, a blocking timer of the hub
+        if self.connected and time.monotonic() < self._report_retry_time:
+            return
+        try:
+            ret = self._keep_report_link() if self.connected else -1
+        except Exception as e:
+            logger.error(e)
+            ret = 0 if self.connected else -1
+        if ret > 0:
+            self._report_retry_time = time.monotonic() + 2
+        elif ret < 0:
+            self._stop_report_hub()
+            self._report_link_closed()
+
+    def _report_hub_handle(self):
+        # io_hub: the frame part of the report thread, a HubTask scheduled by the report socket after each frame
+        stream_report = self._stream_report
+        if self._report_timer is None or stream_report is None:
+            return
+        while self.connected:
+            if self._report_max_rate > 0:
+                delay = 1.0 / self._report_max_rate - (time.monotonic() - self._report_handle_time)
+                if delay > 0:
+                    # the frames received meanwhile are left to the policy of the report queue
+                    if self._report_resume_timer is None:
+                        self._report_resume_timer = self._io_hub.call_later(delay, self._resume_report_hub)
+                    return
+            recv_data = stream_report.read(0)
+            if recv_data == -1:
+                return
+            self._report_handle_time = time.monotonic()
+            self._handle_report_frame(stream_report, recv_data)
+
+    def _resume_report_hub(self):
+        self._report_resume_timer = None
+        if self._report_task is not None:
+            self._report_task.schedule()
+
+    def _stop_report_hub(self):
+        for hub_work in (self._report_timer, self._report_task, self._report_resume_timer):
+            if hub_work is not None:
+                hub_work.cancel()
+        self._report_timer = self._report_task = self._report_resume_timer = None
 
     def _handle_report_data(self, data):
-        def __handle_report_normal_old(rx_data):
+        def __handle_report_normal_old(frame):
             report_time = time.monotonic()
             interval = report_time - self._last_report_time
             self._max_report_interval = max(self._max_report_interval, interval)
             self._last_report_time = report_time
-            # print('length:', convert.bytes_to_u32(rx_data[0:4]))
-            state, mtbrake, mtable, error_code, warn_code = rx_data[4:9]
-            angles = convert.bytes_to_fp32s(rx_data[9:7 * 4 + 9], 7)
-            pose = convert.bytes_to_fp32s(rx_data[37:6 * 4 + 37], 6)
-            cmd_num = convert.bytes_to_u16(rx_data[61:63])
-            pose_offset = convert.bytes_to_fp32s(rx_data[63:6 * 4 + 63], 6)
+            # print('length:', frame.total)
+            state, mtbrake, mtable, error_code, warn_code = frame.state, frame.mtbrake, frame.mtable, frame.error_code, frame.warn_code
+            angles = frame.angles
+            pose = frame.pose
+            cmd_num = frame.cmd_num
+            pose_offset = frame.pose_offset
 
             if error_code != self._error_code or warn_code != self._warn_code:
                 if error_code != self._error_code:
@@ -1288,10 +1556,8 @@ class Base(BaseObject, Events):
                 self._state = state
                 self._report_state_changed_callback()
 
-            mtbrake = [mtbrake & 0x01, mtbrake >> 1 & 0x01, mtbrake >> 2 & 0x01, mtbrake >> 3 & 0x01,
-                       mtbrake >> 4 & 0x01, mtbrake >> 5 & 0x01, mtbrake >> 6 & 0x01, mtbrake >> 7 & 0x01]
-            mtable = [mtable & 0x01, mtable >> 1 & 0x01, mtable >> 2 & 0x01, mtable >> 3 & 0x01,
-                      mtable >> 4 & 0x01, mtable >> 5 & 0x01, mtable >> 6 & 0x01, mtable >> 7 & 0x01]
+            mtbrake = bits_to_list(mtbrake)
+            mtable = bits_to_list(mtable)
 
             if mtbrake != self._arm_motor_brake_states or mtable != self._arm_motor_enable_states:
                 self._arm_motor_enable_states = mtable
@@ -1386,14 +1652,14 @@ class Base(BaseObject, Events):
                 self._sync()
                 self._is_sync = True
 
-        def __handle_report_rich_old(rx_data):
-            __handle_report_normal_old(rx_data)
+        def __handle_report_rich_old(frame):
+            __handle_report_normal_old(frame)
             (self._arm_type,
              arm_axis,
              self._arm_master_id,
              self._arm_slave_id,
              self._arm_motor_tid,
-             self._arm_motor_fid) = rx_data[87:93]
+             self._arm_motor_fid) = frame.arm_info
 
             if 7 >= arm_axis >= 5:
                 self._arm_axis = arm_axis
@@ -1404,10 +1670,9 @@ class Base(BaseObject, Events):
             elif self._arm_type == 3:
                 self._arm_axis = 7
 
-            ver_msg = rx_data[93:122]
-            # self._version = str(ver_msg, 'utf-8')
+            # self._version = str(frame.version, 'utf-8')
 
-            trs_msg = convert.bytes_to_fp32s(rx_data[123:143], 5)
+            trs_msg = frame.trs_msg
             # trs_msg = [i[0] for i in trs_msg]
             (self._tcp_jerk,
              self._min_tcp_acc,
@@ -1418,7 +1683,7 @@ class Base(BaseObject, Events):
             #     self._tcp_jerk, self._min_tcp_acc, self._max_tcp_acc, self._min_tcp_speed, self._max_tcp_speed
             # ))
 
-            p2p_msg = convert.bytes_to_fp32s(rx_data[143:163], 5)
+            p2p_msg = frame.p2p_msg
             # p2p_msg = [i[0] for i in p2p_msg]
             (self._joint_jerk,
              self._min_joint_acc,
@@ -1430,20 +1695,19 @@ class Base(BaseObject, Events):
             #     self._min_joint_speed, self._max_joint_speed
             # ))
 
-            rot_msg = convert.bytes_to_fp32s(rx_data[163:171], 2)
+            rot_msg = frame.rot_msg
             # rot_msg = [i[0] for i in rot_msg]
             self._rot_jerk, self._max_rot_acc = rot_msg
             # print('rot_jerk: {}, mac_acc: {}'.format(self._rot_jerk, self._max_rot_acc))
 
-            sv3_msg = convert.bytes_to_u16s(rx_data[171:187], 8)
             self._first_report_over = True
 
-        def __handle_report_real(rx_data):
-            state, mode = rx_data[4] & 0x0F, rx_data[4] >> 4
-            cmd_num = convert.bytes_to_u16(rx_data[5:7])
-            angles = convert.bytes_to_fp32s(rx_data[7:7 * 4 + 7], 7)
-            pose = convert.bytes_to_fp32s(rx_data[35:6 * 4 + 35], 6)
-            torque = convert.bytes_to_fp32s(rx_data[59:7 * 4 + 59], 7)
+        def __handle_report_real(frame):
+            state, mode = frame.state_mode & 0x0F, frame.state_mode >> 4
+            cmd_num = frame.cmd_num
+            angles = frame.angles
+            pose = frame.pose
+            torque = frame.torque
             if cmd_num != self._cmd_num:
                 self._cmd_num = cmd_num
                 self._report_cmdnum_changed_callback()
@@ -1475,36 +1739,35 @@ class Base(BaseObject, Events):
             if not self._is_sync and self._state not in [4, 5]:
                 self._sync()
                 self._is_sync = True
-            length = len(rx_data)
-            if length >= 135:
+            if frame.has('ft_ext_force'):
                 # FT_SENSOR
-                self._ft_ext_force = convert.bytes_to_fp32s(rx_data[87:111], 6)
-                self._ft_raw_force = convert.bytes_to_fp32s(rx_data[111:135], 6)
+                self._ft_ext_force = frame.ft_ext_force
+                self._ft_raw_force = frame.ft_raw_force
 
-        def __handle_report_normal(rx_data):
+        def __handle_report_normal(frame):
             report_time = time.monotonic()
             interval = report_time - self._last_report_time
             self._max_report_interval = max(self._max_report_interval, interval)
             self._last_report_time = report_time
-            # print('length:', convert.bytes_to_u32(rx_data[0:4]), len(rx_data))
-            state, mode = rx_data[4] & 0x0F, rx_data[4] >> 4
+            # print('length:', frame.total, frame.length)
+            state, mode = frame.state_mode & 0x0F, frame.state_mode >> 4
             # if state != self._state or mode != self._mode:
             #     print('mode: {}, state={}, time={}'.format(mode, state, time.monotonic()))
-            cmd_num = convert.bytes_to_u16(rx_data[5:7])
-            angles = convert.bytes_to_fp32s(rx_data[7:7 * 4 + 7], 7)
-            pose = convert.bytes_to_fp32s(rx_data[35:6 * 4 + 35], 6)
-            torque = convert.bytes_to_fp32s(rx_data[59:7 * 4 + 59], 7)
-            mtbrake, mtable, error_code, warn_code = rx_data[87:91]
-            pose_offset = convert.bytes_to_fp32s(rx_data[91:6 * 4 + 91], 6)
-            tcp_load = convert.bytes_to_fp32s(rx_data[115:4 * 4 + 115], 4)
-            collis_sens, teach_sens = rx_data[131:133]
+            cmd_num = frame.cmd_num
+            angles = frame.angles
+            pose = frame.pose
+            torque = frame.torque
+            mtbrake, mtable, error_code, warn_code = frame.mtbrake, frame.mtable, frame.error_code, frame.warn_code
+            pose_offset = frame.pose_offset
+            tcp_load = frame.tcp_load
+            collis_sens, teach_sens = frame.collis_sens, frame.teach_sens
             # if (collis_sens not in list(range(6)) or teach_sens not in list(range(6))) \
             #         and ((error_code != 0 and error_code not in controller_error_keys) or (warn_code != 0 and warn_code not in controller_warn_keys)):
             #     self._stream_report.close()
-            #     logger.warn('ReportDataException: data={}'.format(rx_data))
+            #     logger.warn('ReportDataException: data={}'.format(frame.data))
             #     return
-            length = convert.bytes_to_u32(rx_data[0:4])
-            data_len = len(rx_data)
+            length = frame.total
+            data_len = frame.length
             if (length != data_len and (length != 233 or data_len != 245)) or collis_sens not in list(range(6)) or teach_sens not in list(range(6)) \
                 or mode not in list(range(12)) or state not in list(range(10)):
                 self._stream_report.close()
@@ -1515,7 +1778,7 @@ class Base(BaseObject, Events):
                     state, mode, collis_sens, teach_sens, error_code, warn_code
                 ))
                 return
-            self._gravity_direction = convert.bytes_to_fp32s(rx_data[133:3*4 + 133], 3)
+            self._gravity_direction = frame.gravity_direction
 
             reset_tgpio_params = False
             reset_linear_track_params = False
@@ -1591,10 +1854,8 @@ class Base(BaseObject, Events):
                 self._mode = mode
                 self._report_mode_changed_callback()
 
-            mtbrake = [mtbrake & 0x01, mtbrake >> 1 & 0x01, mtbrake >> 2 & 0x01, mtbrake >> 3 & 0x01,
-                       mtbrake >> 4 & 0x01, mtbrake >> 5 & 0x01, mtbrake >> 6 & 0x01, mtbrake >> 7 & 0x01]
-            mtable = [mtable & 0x01, mtable >> 1 & 0x01, mtable >> 2 & 0x01, mtable >> 3 & 0x01,
-                      mtable >> 4 & 0x01, mtable >> 5 & 0x01, mtable >> 6 & 0x01, mtable >> 7 & 0x01]
+            mtbrake = bits_to_list(mtbrake)
+            mtable = bits_to_list(mtable)
 
             if mtbrake != self._arm_motor_brake_states or mtable != self._arm_motor_enable_states:
                 self._arm_motor_enable_states = mtable
@@ -1666,22 +1927,22 @@ class Base(BaseObject, Events):
                 self._need_sync = False
                 self._sync()
 
-        def __handle_report_rich(rx_data):
+        def __handle_report_rich(frame):
             # print('interval={}, max_interval={}'.format(interval, self._max_report_interval))
-            __handle_report_normal(rx_data)
+            __handle_report_normal(frame)
             (self._arm_type,
              arm_axis,
              self._arm_master_id,
              self._arm_slave_id,
              self._arm_motor_tid,
-             self._arm_motor_fid) = rx_data[145:151]
+             self._arm_motor_fid) = frame.arm_info
 
             if 7 >= arm_axis >= 5:
                 self._arm_axis = arm_axis
 
-            # self._version = str(rx_data[151:180], 'utf-8')
+            # self._version = str(frame.version, 'utf-8')
 
-            trs_msg = convert.bytes_to_fp32s(rx_data[181:201], 5)
+            trs_msg = frame.trs_msg
             # trs_msg = [i[0] for i in trs_msg]
             (self._tcp_jerk,
              self._min_tcp_acc,
@@ -1692,7 +1953,7 @@ class Base(BaseObject, Events):
             #     self._tcp_jerk, self._min_tcp_acc, self._max_tcp_acc, self._min_tcp_speed, self._max_tcp_speed
             # ))
 
-            p2p_msg = convert.bytes_to_fp32s(rx_data[201:221], 5)
+            p2p_msg = frame.p2p_msg
             # p2p_msg = [i[0] for i in p2p_msg]
             (self._joint_jerk,
              self._min_joint_acc,
@@ -1704,42 +1965,42 @@ class Base(BaseObject, Events):
             #     self._min_joint_speed, self._max_joint_speed
             # ))
 
-            rot_msg = convert.bytes_to_fp32s(rx_data[221:229], 2)
+            rot_msg = frame.rot_msg
             # rot_msg = [i[0] for i in rot_msg]
             self._rot_jerk, self._max_rot_acc = rot_msg
             # print('rot_jerk: {}, mac_acc: {}'.format(self._rot_jerk, self._max_rot_acc))
 
-            servo_codes = [val for val in rx_data[229:245]]
-            for i in range(self.axis):
-                if self._servo_codes[i][0] != servo_codes[i * 2] or self._servo_codes[i][1] != servo_codes[i * 2 + 1]:
-                    print('servo_error_code, servo_id={}, status={}, code={}'.format(i + 1, servo_codes[i * 2], servo_codes[i * 2 + 1]))
-                self._servo_codes[i][0] = servo_codes[i * 2]
-                self._servo_codes[i][1] = servo_codes[i * 2 + 1]
+            # servo codes rarely change, they are only decoded when the raw bytes differ
+            servo_codes_raw = frame.raw('servo_codes')
+            if servo_codes_raw != self._servo_codes_raw:
+                self._servo_codes_raw = servo_codes_raw
+                servo_codes = frame.servo_codes
+                for i in range(self.axis):
+                    if self._servo_codes[i][0] != servo_codes[i * 2] or self._servo_codes[i][1] != servo_codes[i * 2 + 1]:
+                        print('servo_error_code, servo_id={}, status={}, code={}'.format(i + 1, servo_codes[i * 2], servo_codes[i * 2 + 1]))
+                    self._servo_codes[i][0] = servo_codes[i * 2]
+                    self._servo_codes[i][1] = servo_codes[i * 2 + 1]
 
             self._first_report_over = True
 
-            # length = convert.bytes_to_u32(rx_data[0:4])
-            length = len(rx_data)
-            if length >= 252:
-                temperatures = list(struct.unpack('>7b', struct.pack('>7B', *rx_data[245:252])))
-                # temperatures = list(map(int, rx_data[245:252]))
+            if frame.has('temperatures'):
+                temperatures = frame.temperatures
                 if temperatures != self.temperatures:
                     self._temperatures = temperatures
                     self._report_temperature_changed_callback()
-            if length >= 284:
-                speeds = convert.bytes_to_fp32s(rx_data[252:8 * 4 + 252], 8)
+            if frame.has('speeds'):
+                speeds = frame.speeds
                 self._realtime_tcp_speed = speeds[0]
                 self._realtime_joint_speeds = speeds[1:]
                 # print(speeds[0], speeds[1:])
-            if length >= 288:
-                count = convert.bytes_to_u32(rx_data[284:288])
-                # print(count, rx_data[284:288])
+            if frame.has('count'):
+                count = frame.count
                 if self._count != -1 and count != self._count:
                     self._count = count
                     self._report_count_changed_callback()
                 self._count = count
-            if length >= 312:
-                world_offset = convert.bytes_to_fp32s(rx_data[288:6 * 4 + 288], 6)
+            if frame.has('world_offset'):
+                world_offset = frame.world_offset
                 for i in range(len(world_offset)):
                     if i < 3:
                         world_offset[i] = float('{:.3f}'.format(world_offset[i]))
@@ -1747,69 +2008,76 @@ class Base(BaseObject, Events):
                         world_offset[i] = float('{:.6f}'.format(world_offset[i]))
                 if math.inf not in world_offset and -math.inf not in world_offset and not (10 <= self._error_code <= 17):
                     self._world_offset = world_offset
-            if length >= 314:
-                self._cgpio_reset_enable, self._tgpio_reset_enable = rx_data[312:314]
-            if length >= 417:
-                self._is_simulation_robot = bool(rx_data[314])
-                self._is_collision_detection, self._collision_tool_type = rx_data[315:317]
-                self._collision_tool_params = convert.bytes_to_fp32s(rx_data[317:341], 6)
-
-                voltages = convert.bytes_to_u16s(rx_data[341:355], 7)
-                voltages = list(map(lambda x: x / 100, voltages))
-                self._voltages = voltages
-
-                currents = convert.bytes_to_fp32s(rx_data[355:383], 7)
-                self._currents = currents
-
-                cgpio_states = []
-                cgpio_states.extend(rx_data[383:385])
-                cgpio_states.extend(convert.bytes_to_u16s(rx_data[385:401], 8))
-                cgpio_states[6:10] = list(map(lambda x: x / 4095.0 * 10.0, cgpio_states[6:10]))
-                cgpio_states.append(list(map(int, rx_data[401:409])))
-                cgpio_states.append(list(map(int, rx_data[409:417])))
-                if self._control_box_type_is_1300 and length >= 433:
-                    cgpio_states[-2].extend(list(map(int, rx_data[417:425])))
-                    cgpio_states[-1].extend(list(map(int, rx_data[425:433])))
-                self._cgpio_states = cgpio_states
-            if length >= 481:
+            if frame.has('gpio_reset_enable'):
+                self._cgpio_reset_enable, self._tgpio_reset_enable = frame.gpio_reset_enable
+            if frame.has('is_simulation_robot'):
+                self._is_simulation_robot = bool(frame.is_simulation_robot)
+                self._is_collision_detection, self._collision_tool_type = frame.collision_detection
+                self._collision_tool_params = frame.collision_tool_params
+                self._voltages = list(map(lambda x: x / 100, frame.voltages))
+                self._currents = frame.currents
+                self._currents_reported = True
+                self._cgpio_states = cgpio_states_from_frame(frame, extend=self._control_box_type_is_1300)
+            if frame.has('ft_ext_force'):
                 # FT_SENSOR
-                self._ft_ext_force = convert.bytes_to_fp32s(rx_data[433:457], 6)
-                self._ft_raw_force = convert.bytes_to_fp32s(rx_data[457:481], 6)
-            if length >= 482:
-                iden_progress = rx_data[481]
+                self._ft_ext_force = frame.ft_ext_force
+                self._ft_raw_force = frame.ft_raw_force
+            if frame.has('iden_progress'):
+                iden_progress = frame.iden_progress
                 if iden_progress != self._iden_progress:
                     self._iden_progress = iden_progress
                     self._report_iden_progress_changed_callback()
-            if length >= 494:
-                pose_aa = convert.bytes_to_fp32s(rx_data[482:494], 3)
+            if frame.has('pose_aa'):
+                pose_aa = frame.pose_aa
                 for i in range(len(pose_aa)):
                     pose_aa[i] = filter_invaild_number(pose_aa[i], 6, default=self._pose_aa[i])
                 self._pose_aa = self._position[:3] + pose_aa
-            if length >= 495:
-                self._is_reduced_mode = rx_data[494] & 0x01
-                self._is_fence_mode = (rx_data[494] >> 1) & 0x01
-                self._is_report_current = (rx_data[494] >> 2) & 0x01  # 针对get_report_tau_or_i的结果
-                self._is_approx_motion = (rx_data[494] >> 3) & 0x01
-                self._is_cart_continuous = (rx_data[494] >> 4) & 0x01
+            if frame.has('flags'):
+                flags = frame.flags
+                self._is_reduced_mode = flags & 0x01
+                self._is_fence_mode = (flags >> 1) & 0x01
+                self._is_report_current = (flags >> 2) & 0x01  # 针对get_report_tau_or_i的结果
+                self._is_approx_motion = (flags >> 3) & 0x01
+                self._is_cart_continuous = (flags >> 4) & 0x01
 
         try:
+            frame = get_report_layout(self._report_type, self._is_old_protocol).decode(data)
             if self._report_type == 'real':
-                __handle_report_real(data)
+                __handle_report_real(frame)
             elif self._report_type == 'rich':
                 if self._is_old_protocol:
-                    __handle_report_rich_old(data)
+                    __handle_report_rich_old(frame)
                 else:
-                    __handle_report_rich(data)
+                    __handle_report_rich(frame)
             else:
                 if self._is_old_protocol:
-                    __handle_report_normal_old(data)
+                    __handle_report_normal_old(frame)
                 else:
-                    __handle_report_normal(data)
+                    __handle_report_normal(frame)
+            self._publish_state_snapshot()
         except Exception as e:
             logger.error(e)
 
+    def _publish_state_snapshot(self):
+        # the snapshot is built outside of the lock, readers only ever see a complete one
+        snapshot = RobotState.from_arm(self, self._state_snapshot_seq + 1, time.monotonic())
+        with self._state_snapshot_cond:
+            self._state_snapshot_seq = snapshot.seq
+            self._state_snapshot = snapshot
+            self._state_snapshot_cond.notify_all()
+        if self._fb_transid_future_map:
+            self._resolve_motion_futures(snapshot)
+        if self._telemetry_history is not None:
+            self._telemetry_history.append(snapshot, self._currents if self._currents_reported else None)
+        for report_id, name in ((self.REPORT_ID, 'report'), (self.REPORT_LOCATION_ID, 'location')):
+            for item in self._report_callbacks.get(report_id, ()):
+                subscription = item.get('subscription', None)
+                if subscription is not None:
+                    subscription.offer(snapshot, lambda func, msg: self._run_callback(func, msg, name=name))
+
     def _auto_get_report_thread(self):
         logger.debug('get report thread start')
+        poller = self._status_poller
         while self.connected:
             try:
                 cmd_num = self._cmd_num
@@ -1817,15 +2085,8 @@ class Base(BaseObject, Events):
                 error_code = self._error_code
                 warn_code = self._warn_code
 
-                self.get_cmdnum()
-                time.sleep(0.01)
-                self.get_state()
-                time.sleep(0.01)
-                self.get_err_warn_code()
-                time.sleep(0.01)
-                self.get_servo_angle()
-                time.sleep(0.01)
-                self.get_position()
+                start = time.monotonic()
+                poller.poll()
 
                 if self.state != 3 and (state == 3 or self._pause_cnts > 0):
                     with self._pause_cond:
@@ -1834,7 +2095,7 @@ class Base(BaseObject, Events):
                     self._report_cmdnum_changed_callback()
                 if state != self._state:
                     self._report_state_changed_callback()
-                if state in [4, 5]:
+                if self._state in [4, 5]:
                     # if self._is_ready:
                     #     pretty_print('[report], xArm is not ready to move', color='red')
                     self._sleep_finish_time = 0
@@ -1850,11 +2111,14 @@ class Base(BaseObject, Events):
 
                 self._report_location_callback()
                 self._report_callback()
+                if not self._is_sync and self._error_code == 0 and self._state not in [4, 5, 6]:
+                    self._sync()
+                    self._is_sync = True
+                self._last_report_time = time.monotonic()
+                self._publish_state_snapshot()
 
-                if self._cmd_num >= self._max_cmd_num:
-                    time.sleep(1)
                 self._first_report_over = True
-                time.sleep(0.1)
+                poller.wait(start)
             except:
                 pass
         self.disconnect()
@@ -2117,6 +2381,41 @@ class Base(BaseObject, Events):
         self.get_state()
         return self._state == 1
 
+    def batch(self):
+        return CommandBatch(self)
+
+    def get_state_snapshot(self):
+        return self._state_snapshot
+
+    def wait_for_new_snapshot(self, seq=None, timeout=None):
+        with self._state_snapshot_cond:
+            if seq is None:
+                seq = self._state_snapshot_seq
+            expired = None if timeout is None else time.monotonic() + timeout
+            while self._state_snapshot_seq <= seq and self.connected:
+                remaining = None if expired is None else expired - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._state_snapshot_cond.wait(remaining)
+            snapshot = self._state_snapshot
+        return snapshot if snapshot is not None and snapshot.seq > seq else None
+
+    def set_callback_options(self, callback, overflow=None, maxsize=None, budget=None):
+        if self._callback_executor is None:
+            return APIState.API_EXCEPTION
+        self._callback_executor.set_options(callback, overflow=overflow, maxsize=maxsize, budget=budget)
+        return 0
+
+    def get_callback_stats(self):
+        if self._callback_executor is None:
+            return 0, {}
+        return 0, self._callback_executor.stats()
+
+    def get_comm_stats(self, reset=False):
+        if self.arm_cmd is None:
+            return APIState.NOT_CONNECTED, {}
+        return 0, self.arm_cmd.stats.snapshot(reset=reset)
+
     @xarm_is_connected(_type='get')
     def get_state(self):
         ret = self.arm_cmd.get_state()
@@ -2260,9 +2559,12 @@ class Base(BaseObject, Events):
         return ret[0]
     
     def _gen_feedback_key(self, wait, **kwargs):
-        feedback_key = kwargs.get('feedback_key', '') if self._support_feedback and not wait else ''
+        future = getattr(self._motion_future_local, 'future', None)
+        feedback_key = kwargs.get('feedback_key', '') if self._support_feedback and not wait and future is None else ''
         studio_wait = bool(feedback_key)
-        feedback_key = str(uuid.uuid1()) if wait and self._support_feedback else feedback_key
+        feedback_key = str(uuid.uuid1()) if (wait or future is not None) and self._support_feedback else feedback_key
+        if future is not None and feedback_key:
+            future.feedback_key = feedback_key
         # feedback_key = str(uuid.uuid1()) if wait and self._support_feedback else ''
         self._fb_key_transid_map[feedback_key if feedback_key else 'no_use'] = -1
         return feedback_key, studio_wait
@@ -2274,12 +2576,166 @@ class Base(BaseObject, Events):
         self._fb_key_transid_map[feedback_key] = trans_id
         self._fb_transid_type_map[trans_id] = feedback_type
         self._fb_transid_result_map.pop(trans_id, -1)
+        future = getattr(self._motion_future_local, 'future', None)
+        if future is not None and future.feedback_key == feedback_key:
+            # registered before the request is sent, so the feedback can not be missed
+            future.trans_id = trans_id
+            with self._motion_future_lock:
+                self._fb_transid_future_map[trans_id] = future
+
+    def _new_motion_future(self):
+        future = MotionFuture()
+        future.start_seq = self._state_snapshot_seq
+        self._motion_future_local.future = future
+        return future
+
+    def _start_motion_future(self, future, code):
+        if code != 0:
+            with self._motion_future_lock:
+                self._fb_transid_future_map.pop(future.trans_id, None)
+            future.resolve(code)
+        elif future.trans_id < 0:
+            # no feedback (firmware < 2.0.102), the future waits for the end of all the motions
+            with self._motion_future_lock:
+                self._motion_future_pending.append(future)
+                if self._motion_future_waiter is None:
+                    self._motion_future_waiter = threading.Thread(target=self._wait_motion_futures, daemon=True)
+                    self._motion_future_waiter.start()
+        return future
+
+    def _wait_motion_futures(self):
+        # one wait_move for all the futures pending at its start, the later ones are resolved by the next wait
+        while True:
+            with self._motion_future_lock:
+                futures = list(self._motion_future_pending)
+                if not futures:
+                    self._motion_future_waiter = None
+                    return
+            try:
+                code = self.wait_move()
+            except Exception as e:
+                logger.error('wait motion futures: {}'.format(e))
+                code = APIState.API_EXCEPTION
+            with self._motion_future_lock:
+                del self._motion_future_pending[:len(futures)]
+            for future in futures:
+                future.resolve(code)
+
+    def _resolve_motion_futures(self, snapshot=None, code=None):
+        """
+        Resolve the futures whose feedback was received before the published RobotState snapshot,
+            and the futures stopped by an error or a stop (the futures started within the last
+            _STALE_REPORT_STATES states are not, the reports received meanwhile may be older than the command)
+        """
+        if code is None:
+            if snapshot.error_code != 0:
+                code = APIState.HAS_ERROR
+            elif snapshot.state == 4:
+                code = APIState.EMERGENCY_STOP
+        with self._motion_future_lock:
+            if snapshot is None:
+                resolved = [(future, code) for future in self._fb_transid_future_map.values()]
+            else:
+                resolved = []
+                for future in self._fb_transid_future_map.values():
+                    if code is not None and snapshot.seq - future.start_seq > self._STALE_REPORT_STATES:
+                        resolved.append((future, code))
+                    elif future.feedback_seq is not None and future.feedback_seq < snapshot.seq:
+                        resolved.append((future, 0 if code is None else code))
+            for future, _ in resolved:
+                self._fb_transid_future_map.pop(future.trans_id, None)
+        for future, future_code in resolved:
+            future.resolve(future_code)
     
+    def _state_is_reported(self):
+        # the state is published by the report thread (report socket or status polling), see _publish_state_snapshot
+        report_timer = self._report_timer
+        if report_timer is not None:
+            running = not report_timer.cancelled
+        else:
+            running = self._report_thread is not None and self._report_thread.is_alive()
+        return running and time.monotonic() - self._last_report_time < self._WAIT_REPORT_STALL
+
+    def _wait_motion_reported(self, timeout, expired, trans_id=-1, ignore_log=False):
+        """
+        Wait for the end of the motion on the published RobotState instead of polling get_state,
+            woken up by every published state and by the feedback of trans_id
+        End of the motion:
+            trans_id > 0: the feedback of trans_id is received, and a state published after it is checked
+                (a stop or an error may be reported after the feedback of the aborted motion)
+            else: two states without motion (state not in [0, 1, 3], cmd_num is 0, no pause time) are published,
+                after a motion was reported or _WAIT_MOVE_SETTLE seconds after the start of the wait
+                (state 5 counts as no motion, as in the polling loop: the wait ends with 0 before the state 5 timeout)
+        A stop (state 4) within the first _STALE_REPORT_STATES published states is confirmed with get_state
+        :return: code, None if the state is no longer reported (the caller polls then)
+        """
+        name = 'wait_feedback' if trans_id > 0 else 'wait_move'
+        start = time.monotonic()
+        start_seq = self._state_snapshot_seq
+        seq = -1
+        moved = False
+        idle_cnt = 0
+        state5_time = None
+        feedback_seq = None
+        code = APIState.WAIT_FINISH_TIMEOUT
+        msg = None
+        while timeout is None or time.monotonic() < expired:
+            if not self.connected:
+                code, msg = APIState.NOT_CONNECTED, '{}, xarm is disconnect'.format(name)
+                break
+            snapshot = self._state_snapshot
+            if snapshot is not None and snapshot.seq != seq:
+                seq = snapshot.seq
+                state = snapshot.state
+                if snapshot.error_code != 0:
+                    code, msg = APIState.HAS_ERROR, '{}, xarm has error, error={}'.format(name, snapshot.error_code)
+                    break
+                if trans_id <= 0 and snapshot.mode != 0 and snapshot.mode != 11:
+                    return 0
+                if state == 4 and seq - start_seq <= self._STALE_REPORT_STATES:
+                    # the stop may be older than the command (e.g. just after set_state(0)), asked to the controller
+                    _, state = self.get_state()
+                if state >= 4:
+                    self._sleep_finish_time = 0
+                    state5_time = snapshot.timestamp if state5_time is None else state5_time
+                    if state != 5 or snapshot.timestamp - state5_time >= 1:
+                        code, msg = APIState.EMERGENCY_STOP, '{}, xarm is stop, state={}'.format(name, state)
+                        break
+                else:
+                    state5_time = None
+                if trans_id <= 0:
+                    if state in [0, 1, 3] or snapshot.cmd_num > 0 or snapshot.timestamp < self._sleep_finish_time:
+                        moved = moved or state == 1 or snapshot.cmd_num > 0
+                        idle_cnt = 0
+                    elif snapshot.timestamp >= start:
+                        idle_cnt += 1
+                        if idle_cnt >= 2 and (moved or snapshot.timestamp - start >= self._WAIT_MOVE_SETTLE):
+                            return 0
+                elif feedback_seq is not None and seq > feedback_seq:
+                    return 0
+            with self._state_snapshot_cond:
+                if trans_id > 0 and feedback_seq is None and trans_id in self._fb_transid_result_map:
+                    feedback_seq = self._state_snapshot_seq
+                if self._state_snapshot_seq == seq:
+                    self._state_snapshot_cond.wait(
+                        self._WAIT_REPORT_STALL if timeout is None else min(self._WAIT_REPORT_STALL, expired - time.monotonic()))
+            if self._state_snapshot_seq == seq and not self._state_is_reported():
+                return None
+        if trans_id > 0 and code != APIState.WAIT_FINISH_TIMEOUT:
+            self._fb_transid_result_map.clear()
+        if msg is not None and not ignore_log:
+            self.log_api_info(msg, code=code)
+        return code
+
     def _wait_feedback(self, timeout=None, trans_id=-1, ignore_log=False):
         if timeout is not None:
             expired = time.monotonic() + timeout + (self._sleep_finish_time if self._sleep_finish_time > time.monotonic() else 0)
         else:
             expired = 0
+        if self._state_is_reported():
+            code = self._wait_motion_reported(timeout, expired, trans_id=trans_id, ignore_log=ignore_log)
+            if code is not None:
+                return code, self._fb_transid_result_map.pop(trans_id, -1) if code == 0 else -1
         state5_cnt = 0
         while timeout is None or time.monotonic() < expired:
             if not self.connected:
@@ -2312,12 +2768,17 @@ class Base(BaseObject, Events):
         return APIState.WAIT_FINISH_TIMEOUT, -1
     
     def wait_move(self, timeout=None, trans_id=-1):
+        self._status_poller.wakeup()
         if self._support_feedback and trans_id > 0:
             return self._wait_feedback(timeout, trans_id)[0]
         if timeout is not None:
             expired = time.monotonic() + timeout + (self._sleep_finish_time if self._sleep_finish_time > time.monotonic() else 0)
         else:
             expired = 0
+        if self._state_is_reported():
+            code = self._wait_motion_reported(timeout, expired)
+            if code is not None:
+                return code
         _, state = self.get_state()
         cnt = 0
         state5_cnt = 0
@@ -2534,7 +2995,31 @@ class Base(BaseObject, Events):
             dh_params.extend([0] * (28 - len(dh_params)))
         ret = self.arm_cmd.set_dh_params(dh_params, flag)
         ret[0] = self._check_code(ret[0])
+        self._kinematics = None
         return ret[0]
+
+    def get_kinematics(self, refresh=False):
+        """
+        Local kinematics built from the DH parameters of the controller (nominal ones of xArm5/xArm6 if
+            get_dh_params fails), kept until refresh or set_dh_params, the TCP/world offsets follow the arm
+        """
+        kin = self._kinematics
+        if kin is None or refresh:
+            code, dh_params = self.get_dh_params()
+            try:
+                if code == 0 and any(dh_params):
+                    kin = Kinematics(dh_params, axis=self.axis, arm_type=self.device_type)
+                else:
+                    kin = Kinematics.nominal(self.axis, arm_type=self.device_type)
+                    logger.warning('no DH parameters from the controller (code={}), the nominal ones are used'.format(code))
+            except (ImportError, ValueError) as e:
+                logger.error('get_kinematics: {}'.format(e))
+                return APIState.API_EXCEPTION if code == 0 else code, None
+            kin.set_default_seed(self._angles)
+            self._kinematics = kin
+        if kin.offsets != (tuple(self._position_offset), tuple(self._world_offset)):
+            kin.set_offsets(self._position_offset, self._world_offset)
+        return 0, kin
     
     def _feedback_thread_handle(self):
         while self.connected:
@@ -2549,6 +3034,18 @@ class Base(BaseObject, Events):
         feedback_type = self._fb_transid_type_map.pop(trans_id, -1)
         if feedback_type != -1:
             self._fb_transid_result_map[trans_id] = data[12]  # feedback_code
+            with self._state_snapshot_cond:
+                self._state_snapshot_cond.notify_all()
+        future = self._fb_transid_future_map.get(trans_id, None)
+        if future is not None and data[8] & (XCONF.FeedbackType.MOTION_FINISH | XCONF.FeedbackType.OTHER_FINISH):
+            future.feedback_code = data[12]
+            if self._state_is_reported():
+                # resolved by the next published state, a stop or an error may be reported after the feedback
+                future.feedback_seq = self._state_snapshot_seq
+            else:
+                with self._motion_future_lock:
+                    self._fb_transid_future_map.pop(trans_id, None)
+                future.resolve(0)
         if feedback_type & data[8] == 0:
             return
         self.__report_callback(self.FEEDBACK_ID, data, name='feedback')
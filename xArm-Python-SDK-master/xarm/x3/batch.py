@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+from .code import APIState
+
+# commands after which the state is read back in the same batch
+_STATE_CHANGING_CMDS = ('motion_en', 'set_state', 'clean_err')
+
+
+class CommandBatch(object):
+    """
+    Commands recorded in a batch are written to the socket together and their responses are waited together
+    Usage:
+        with arm.batch() as batch:
+            batch.clean_warn()
+            batch.clean_error()
+            batch.motion_enable(True)
+            batch.set_mode(0)
+            batch.set_state(0)
+        print(batch.codes)
+    Any command of arm.arm_cmd can be recorded by its name as well, e.g. batch.tgpio_set_digital(0, 1),
+    the result of a command is batch.results[index], index is returned when it is recorded
+    Note: the commands are executed by the controller in the recorded order,
+        only the waiting of the responses is shared, the checks of the XArmAPI methods are not done
+    """
+    def __init__(self, arm):
+        self._arm = arm
+        self._calls = []
+        self.results = []
+        self.codes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.send()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(self._arm.arm_cmd, name, None)):
+            raise AttributeError('{} is not a command'.format(name))
+
+        def record(*args, **kwargs):
+            return self._record(name, *args, **kwargs)
+        return record
+
+    def _record(self, name, *args, **kwargs):
+        self._calls.append((name, args, kwargs))
+        return len(self._calls) - 1
+
+    def clean_warn(self):
+        return self._record('clean_war')
+
+    def clean_error(self):
+        return self._record('clean_err')
+
+    def motion_enable(self, enable=True, servo_id=None):
+        return self._record('motion_en', 8 if servo_id is None else servo_id, int(enable))
+
+    def set_mode(self, mode=0, detection_param=0):
+        detection_param = max(detection_param, 0) if self._arm.version_is_ge(1, 10, 0) else -1
+        return self._record('set_mode', mode, detection_param=detection_param)
+
+    def set_state(self, state=0):
+        return self._record('set_state', state)
+
+    def send(self):
+        """
+        Send the recorded commands
+        :return: the codes of the commands in the recorded order
+        """
+        calls, self._calls = self._calls, []
+        if not calls:
+            return []
+        if not self._arm.connected:
+            self.results = [[APIState.NOT_CONNECTED] for _ in calls]
+            self.codes = [APIState.NOT_CONNECTED] * len(calls)
+            return self.codes
+        refresh_state = any(name in _STATE_CHANGING_CMDS for name, _, _ in calls)
+        if refresh_state:
+            calls.append(('get_state', (), {}))
+        results = self._arm.arm_cmd.run_batch(calls)
+        if refresh_state:
+            ret = results.pop()
+            if self._arm._check_code(ret[0]) == 0:
+                self._arm._state = ret[1]
+                self._arm._is_ready = ret[1] not in [4, 5]
+            calls.pop()
+        self.results = results
+        self.codes = [self._arm._check_code(ret[0]) if isinstance(ret, list) else ret for ret in results]
+        self._arm.log_api_info('API -> batch({}) -> codes={}'.format(
+            ','.join(name for name, _, _ in calls), self.codes), code=max(self.codes, key=abs))
+        return self.codes
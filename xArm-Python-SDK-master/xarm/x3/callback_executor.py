@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import time
+import threading
+import collections
+from ..core.utils.log import logger
+from ..core.utils.comm_stats import LatencyHistogram
+
+
+class _CallbackLane(object):
+    """
+    Bounded queue of the calls of one callback (per event name), run by one worker at a time in the order of the calls
+    """
+    def __init__(self, name, callback, overflow, maxsize, budget):
+        self.name = name
+        self.callback = callback
+        self.overflow = overflow
+        self.maxsize = max(int(maxsize), 1)
+        self.budget = budget
+        self.items = collections.deque()
+        self.not_full = None
+        self.scheduled = False
+        self.calls = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked_time = 0
+        self.max_depth = 0
+        self.over_budget = 0
+        self.last_warn_time = 0
+        self.lag = LatencyHistogram()
+        self.exec_time = LatencyHistogram()
+
+    def stats(self):
+        return {
+            'overflow': self.overflow,
+            'maxsize': self.maxsize,
+            'depth': len(self.items),
+            'max_depth': self.max_depth,
+            'calls': self.calls,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'blocked_time': round(self.blocked_time, 6),
+            'budget': self.budget,
+            'over_budget': self.over_budget,
+            'lag': self.lag.snapshot(),
+            'exec_time': self.exec_time.snapshot(),
+        }
+
+
+class CallbackExecutor(object):
+    """
+    Runs the report callbacks on worker threads, every callback (per event name) has its own bounded queue,
+        so a slow callback only delays itself (as long as fewer callbacks than workers are slow at the same time)
+    Overflow of a queue:
+        drop_oldest: the oldest call is dropped
+        latest: the calls are coalesced, only the latest one is kept (maxsize is ignored)
+        block: the caller (the report thread) waits for free space
+    Default overflow: latest for the periodic report/location callbacks, drop_oldest for the other (changed) events
+    budget: execution time (seconds) of a call above which a warning is logged (at most every WARN_INTERVAL seconds)
+    lag: time between the submission and the start of the calls
+    """
+    DROP_OLDEST = 'drop_oldest'
+    LATEST = 'latest'
+    BLOCK = 'block'
+    OVERFLOWS = (DROP_OLDEST, LATEST, BLOCK)
+    # periodic callbacks, only their latest data matters
+    PERIODIC_NAMES = ('report', 'location')
+    WARN_INTERVAL = 10
+
+    def __init__(self, workers=2, maxsize=16, overflow=None, budget=0.05):
+        if overflow is not None and overflow not in self.OVERFLOWS:
+            raise ValueError('callback overflow must be one of {}'.format(self.OVERFLOWS))
+        self.workers = max(int(workers), 1)
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.budget = budget
+        self._lanes = {}
+        self._options = {}
+        self._ready = collections.deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._alive = True
+
+    def set_options(self, callback, overflow=None, maxsize=None, budget=None):
+        """
+        Options of a callback, for all its event names, None means the default of the executor
+        """
+        if overflow is not None and overflow not in self.OVERFLOWS:
+            raise ValueError('callback overflow must be one of {}'.format(self.OVERFLOWS))
+        with self._cond:
+            self._options[callback] = (overflow, maxsize, budget)
+            for lane in self._lanes.values():
+                if lane.callback == callback:
+                    lane.overflow = overflow or self._default_overflow(lane.name)
+                    lane.maxsize = max(int(maxsize or self.maxsize), 1)
+                    lane.budget = self.budget if budget is None else budget
+
+    def _default_overflow(self, name):
+        if self.overflow is not None:
+            return self.overflow
+        return self.LATEST if name in self.PERIODIC_NAMES else self.DROP_OLDEST
+
+    def _get_lane(self, name, callback):
+        key = (name, callback)
+        lane = self._lanes.get(key, None)
+        if lane is None:
+            overflow, maxsize, budget = self._options.get(callback, (None, None, None))
+            lane = _CallbackLane(name, callback, overflow or self._default_overflow(name),
+                                 maxsize or self.maxsize, self.budget if budget is None else budget)
+            lane.not_full = threading.Condition(self._cond)
+            self._lanes[key] = lane
+        return lane
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def submit(self, callback, msg, name=''):
+        item = (time.monotonic(), msg)
+        with self._cond:
+            if not self._alive:
+                return False
+            if len(self._threads) < self.workers:
+                self._start_workers()
+            lane = self._get_lane(name, callback)
+            if lane.overflow == self.LATEST:
+                if lane.items:
+                    lane.items.clear()
+                    lane.coalesced += 1
+            elif len(lane.items) >= lane.maxsize:
+                if lane.overflow == self.BLOCK and threading.current_thread() not in self._threads:
+                    start = time.monotonic()
+                    while len(lane.items) >= lane.maxsize and self._alive:
+                        lane.not_full.wait(0.1)
+                    lane.blocked_time += time.monotonic() - start
+                while len(lane.items) >= lane.maxsize:
+                    # drop_oldest (or block called from a callback, which would wait for itself)
+                    lane.items.popleft()
+                    lane.dropped += 1
+            lane.items.append(item)
+            lane.max_depth = max(lane.max_depth, len(lane.items))
+            if not lane.scheduled:
+                lane.scheduled = True
+                self._ready.append(lane)
+                self._cond.notify()
+        return True
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and self._alive:
+                    self._cond.wait()
+                if not self._alive:
+                    return
+                lane = self._ready.popleft()
+                submit_time, msg = lane.items.popleft()
+                lane.not_full.notify_all()
+            start = time.monotonic()
+            try:
+                lane.callback(msg)
+            except Exception as e:
+                logger.error('run {} callback exception: {}'.format(lane.name, e))
+            end = time.monotonic()
+            with self._cond:
+                lane.calls += 1
+                lane.lag.record(start - submit_time)
+                lane.exec_time.record(end - start)
+                over_budget = lane.budget and end - start > lane.budget
+                if over_budget:
+                    lane.over_budget += 1
+                if lane.items:
+                    # back to the end of the ready queue, the other callbacks are not starved
+                    self._ready.append(lane)
+                    self._cond.notify()
+                else:
+                    lane.scheduled = False
+            if over_budget and end - lane.last_warn_time > self.WARN_INTERVAL:
+                lane.last_warn_time = end
+                logger.warning('{} callback {} took {:.1f} ms, over its budget of {:.1f} ms ({} times)'.format(
+                    lane.name, getattr(lane.callback, '__name__', lane.callback),
+                    (end - start) * 1000, lane.budget * 1000, lane.over_budget))
+
+    def stats(self):
+        with self._cond:
+            return {'{}:{}'.format(name, getattr(callback, '__qualname__', callback)): lane.stats()
+                    for (name, callback), lane in self._lanes.items()}
+
+    def shutdown(self):
+        with self._cond:
+            self._alive = False
+            self._cond.notify_all()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(1)
+        self._threads = []
@@ -9,6 +9,7 @@
 
 import time
 import math
+import inspect
 import functools
 from ..core.utils.log import logger
 from .code import APIState
@@ -82,6 +83,30 @@ def xarm_wait_until_cmdnum_lt_max(func):
     return decorator
 
 
+def xarm_motion_future(func):
+    # with future=True (or the motion_future parameter of the arm) and wait=False, a MotionFuture is returned
+    # wait may be passed by position, the arguments are bound to the signature of the wrapped method
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def decorator(self, *args, **kwargs):
+        if not kwargs.get('future', self._motion_future):
+            return func(self, *args, **kwargs)
+        try:
+            wait = signature.bind_partial(self, *args, **kwargs).arguments.get('wait', False)
+        except TypeError:
+            wait = kwargs.get('wait', False)
+        if wait:
+            return func(self, *args, **kwargs)
+        future = self._new_motion_future()
+        try:
+            code = func(self, *args, **kwargs)
+        finally:
+            self._motion_future_local.future = None
+        return self._start_motion_future(future, code)
+    return decorator
+
+
 def xarm_is_not_simulation_mode(ret=0):
     def _xarm_is_not_simulation_mode(func):
         @functools.wraps(func)
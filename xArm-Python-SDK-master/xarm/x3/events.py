@@ -6,6 +6,8 @@
 #
 # Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
 
+from .subscription import ReportSubscription
+
 REPORT_ID = 'REPORT'
 REPORT_LOCATION_ID = 'LOCATION'
 REPORT_CONNECT_CHANGED_ID = 'REPORT_CONNECT_CHANGED'
@@ -76,10 +78,22 @@ class Events(object):
                             return True
         return False
 
+    def _subscribe_report(self, report_id, item, fields=None, max_rate=0, deadband=None):
+        if fields is None and not max_rate and deadband is None:
+            return self._register_report_callback(report_id, item)
+        if not callable(item['callback']):
+            return False
+        if fields is None:
+            fields = [name for name, value in item.items() if name != 'callback' and value]
+        item['subscription'] = ReportSubscription(item['callback'], fields, max_rate=max_rate, deadband=deadband,
+                                                  is_radian=lambda: getattr(self, '_default_is_radian', True))
+        return self._register_report_callback(report_id, item)
+
     def register_report_callback(self, callback=None, report_cartesian=True, report_joints=True,
                                  report_state=True, report_error_code=True, report_warn_code=True,
-                                 report_mtable=True, report_mtbrake=True, report_cmd_num=True):
-        return self._register_report_callback(REPORT_ID, {
+                                 report_mtable=True, report_mtbrake=True, report_cmd_num=True,
+                                 fields=None, max_rate=0, deadband=None):
+        return self._subscribe_report(REPORT_ID, {
             'callback': callback,
             'cartesian': report_cartesian,
             'joints': report_joints,
@@ -89,14 +103,15 @@ class Events(object):
             'mtable': report_mtable,
             'mtbrake': report_mtbrake,
             'cmdnum': report_cmd_num
-        })
+        }, fields=fields, max_rate=max_rate, deadband=deadband)
 
-    def register_report_location_callback(self, callback=None, report_cartesian=True, report_joints=False):
-        ret = self._register_report_callback(REPORT_LOCATION_ID, {
+    def register_report_location_callback(self, callback=None, report_cartesian=True, report_joints=False,
+                                          fields=None, max_rate=0, deadband=None):
+        ret = self._subscribe_report(REPORT_LOCATION_ID, {
             'callback': callback,
             'cartesian': report_cartesian,
             'joints': report_joints,
-        })
+        }, fields=fields, max_rate=max_rate, deadband=deadband)
         return ret
 
     def register_connect_changed_callback(self, callback=None):
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import math
+import collections
+try:
+    import numpy as np
+except:
+    np = None
+from ..core.config.x_config import XCONF
+
+
+# order of the 4 parameters of a joint in the 28 values of get_dh_params/set_dh_params (standard DH)
+DH_ORDER = ('theta_offset', 'd', 'alpha', 'a')
+
+# nominal standard DH parameters (theta_offset(rad), d(mm), alpha(rad), a(mm)) per joint, used when the controller
+# does not return its (calibrated) parameters
+NOMINAL_DH = {
+    XCONF.Robot.Axis.XARM5: [
+        (0, 267, -math.pi / 2, 0),
+        (-1.3849179, 0, 0, 289.48866),
+        (2.7331843, 0, 0, 351.158796),
+        (-1.3482664, 0, -math.pi / 2, 76),
+        (0, 97, 0, 0),
+    ],
+    XCONF.Robot.Axis.XARM6: [
+        (0, 267, -math.pi / 2, 0),
+        (-1.3849179, 0, 0, 289.48866),
+        (1.3849179, 0, -math.pi / 2, 77.5),
+        (0, 342.5, math.pi / 2, 0),
+        (0, 0, -math.pi / 2, 76),
+        (0, 97, 0, 0),
+    ],
+}
+
+
+def rpy_to_matrix(rpy):
+    """
+    Rotation matrices of roll/pitch/yaw (radians, shape (n, 3)), R = Rz(yaw) * Ry(pitch) * Rx(roll)
+    """
+    rpy = np.asarray(rpy, dtype=np.float64).reshape(-1, 3)
+    cr, sr = np.cos(rpy[:, 0]), np.sin(rpy[:, 0])
+    cp, sp = np.cos(rpy[:, 1]), np.sin(rpy[:, 1])
+    cy, sy = np.cos(rpy[:, 2]), np.sin(rpy[:, 2])
+    R = np.empty((rpy.shape[0], 3, 3))
+    R[:, 0, 0] = cy * cp
+    R[:, 0, 1] = cy * sp * sr - sy * cr
+    R[:, 0, 2] = cy * sp * cr + sy * sr
+    R[:, 1, 0] = sy * cp
+    R[:, 1, 1] = sy * sp * sr + cy * cr
+    R[:, 1, 2] = sy * sp * cr - cy * sr
+    R[:, 2, 0] = -sp
+    R[:, 2, 1] = cp * sr
+    R[:, 2, 2] = cp * cr
+    return R
+
+
+def matrix_to_rpy(R):
+    """
+    Roll/pitch/yaw (radians, shape (n, 3)) of rotation matrices (shape (n, 3, 3)), inverse of rpy_to_matrix
+    """
+    pitch = np.arcsin(np.clip(-R[:, 2, 0], -1.0, 1.0))
+    roll = np.arctan2(R[:, 2, 1], R[:, 2, 2])
+    yaw = np.arctan2(R[:, 1, 0], R[:, 0, 0])
+    # gimbal lock: only roll - yaw (or roll + yaw) is defined, yaw is set to 0
+    lock = np.hypot(R[:, 0, 0], R[:, 1, 0]) < 1e-9
+    if lock.any():
+        roll[lock] = np.arctan2(-R[lock, 1, 2], R[lock, 1, 1])
+        yaw[lock] = 0
+    return np.stack([roll, pitch, yaw], axis=1)
+
+
+def _pose_to_matrix(pose):
+    pose = np.asarray(pose, dtype=np.float64).reshape(-1, 6)
+    T = np.zeros((pose.shape[0], 4, 4))
+    T[:, :3, :3] = rpy_to_matrix(pose[:, 3:])
+    T[:, :3, 3] = pose[:, :3]
+    T[:, 3, 3] = 1
+    return T
+
+
+def _rotation_error(R_target, R):
+    # rotation vectors (shape (n, 3)) of R_target * R^T, in the base frame
+    E = np.matmul(R_target, np.transpose(R, (0, 2, 1)))
+    v = np.stack([E[:, 2, 1] - E[:, 1, 2], E[:, 0, 2] - E[:, 2, 0], E[:, 1, 0] - E[:, 0, 1]], axis=1)
+    cos = np.clip((E[:, 0, 0] + E[:, 1, 1] + E[:, 2, 2] - 1) / 2, -1.0, 1.0)
+    angle = np.arccos(cos)
+    sin = np.sin(angle)
+    scale = np.where(sin > 1e-6, angle / np.maximum(2 * sin, 1e-12), 0.5)
+    rotvec = v * scale[:, None]
+    # close to 180 degrees the skew part vanishes, the axis is taken from the diagonal
+    flip = (sin <= 1e-6) & (cos < 0)
+    if flip.any():
+        diag = np.sqrt(np.maximum((np.diagonal(E[flip], axis1=1, axis2=2) + 1) / 2, 0))
+        rotvec[flip] = diag * math.pi
+    return rotvec
+
+
+class Kinematics(object):
+    """
+    Local forward/inverse kinematics of the arm (standard DH), computed in batches with numpy
+    The units are mm and radians, the poses are [x, y, z, roll, pitch, yaw] as get_position(is_radian=True)
+    tcp_offset and world_offset are applied as the controller does (see set_tcp_offset/set_world_offset)
+    Usage:
+        code, kin = arm.get_kinematics()
+        poses = kin.fk(angles)  # angles: (n, axis) -> poses: (n, 6)
+        angles, ok = kin.ik(poses)  # ok[i] is False if poses[i] was not reached within the tolerances
+    Repeated IK targets solved from the default seed are served from a LRU cache (cache_size entries)
+    """
+    # IK: damped least squares
+    MAX_ITER = 100
+    DAMPING = 1.0           # mm
+    ORIENT_WEIGHT = 200.0   # mm per radian of orientation error
+    MAX_STEP = 0.3          # rad per iteration and joint
+    POS_TOL = 1e-3          # mm
+    ORIENT_TOL = 1e-5       # rad
+    CACHE_DECIMALS = 4
+
+    def __init__(self, dh_params, axis=None, arm_type=None, tcp_offset=None, world_offset=None, cache_size=1024):
+        """
+        :param dh_params: the 28 values of get_dh_params (4 per joint, see DH_ORDER), or a list of the rows per joint
+        :param axis: number of joints, default is the number of the non-zero rows
+        :param arm_type: XCONF.Robot.Type, selects the joint limits (clamp of the IK), default: no limits
+        :param tcp_offset: [x, y, z, roll, pitch, yaw] (mm, radians), see set_tcp_offset
+        :param world_offset: [x, y, z, roll, pitch, yaw] (mm, radians), see set_world_offset
+        """
+        if np is None:
+            raise ImportError('Kinematics requires numpy')
+        dh = np.asarray(dh_params, dtype=np.float64).reshape(-1, 4)
+        if axis is None:
+            axis = int(np.count_nonzero(np.any(dh != 0, axis=1)))
+        if axis <= 0 or dh.shape[0] < axis:
+            raise ValueError('dh_params must have 4 values per joint, {} joints'.format(axis))
+        dh = dh[:axis].copy()
+        if np.all(np.abs(dh[:, [1, 3]]) < 5):
+            # lengths in meters
+            dh[:, [1, 3]] *= 1000
+        self.axis = axis
+        self.arm_type = arm_type
+        self.dh = dh
+        self._theta_offset, self._d, self._alpha, self._a = (dh[:, i] for i in range(4))
+        self._cos_alpha = np.cos(self._alpha)
+        self._sin_alpha = np.sin(self._alpha)
+        limits = XCONF.Robot.JOINT_LIMITS.get(axis, {}).get(arm_type, None)
+        if limits is not None and len(limits) >= axis:
+            self.lower = np.array([limits[i][0] for i in range(axis)], dtype=np.float64)
+            self.upper = np.array([limits[i][1] for i in range(axis)], dtype=np.float64)
+        else:
+            self.lower = np.full(axis, -np.inf)
+            self.upper = np.full(axis, np.inf)
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.default_seed = None
+        self.set_default_seed([0] * axis)
+        self._tcp = np.eye(4)
+        self._world = np.eye(4)
+        self.offsets = ((0,) * 6, (0,) * 6)
+        self.set_offsets(tcp_offset, world_offset)
+
+    @classmethod
+    def nominal(cls, axis, arm_type=None, **kwargs):
+        """
+        Kinematics of the nominal (not calibrated) DH parameters, xArm5 and xArm6 only
+        """
+        if axis not in NOMINAL_DH:
+            raise ValueError('no nominal DH parameters of {} axis, use get_dh_params'.format(axis))
+        return cls(NOMINAL_DH[axis], axis=axis, arm_type=arm_type, **kwargs)
+
+    def set_offsets(self, tcp_offset=None, world_offset=None):
+        # None keeps the current offset, the cache is cleared
+        if tcp_offset is not None:
+            self._tcp = _pose_to_matrix(tcp_offset[:6])[0]
+            self.offsets = (tuple(tcp_offset[:6]), self.offsets[1])
+        if world_offset is not None:
+            self._world = np.linalg.inv(_pose_to_matrix(world_offset[:6])[0])
+            self.offsets = (self.offsets[0], tuple(world_offset[:6]))
+        self.clear_cache()
+
+    def set_default_seed(self, angles):
+        # seed of the IK without seed (the cache is cleared), the current angles of the arm are a good choice
+        self.default_seed = np.clip(np.asarray(angles[:self.axis], dtype=np.float64), self.lower, self.upper)
+        self.clear_cache()
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def _joints(self, angles):
+        q = np.asarray(angles, dtype=np.float64)
+        q = q.reshape(1, -1) if q.ndim == 1 else q
+        if q.shape[1] < self.axis:
+            raise ValueError('angles must have {} joints'.format(self.axis))
+        return q[:, :self.axis]
+
+    def _chain(self, q):
+        # frames of the base and of every joint (shape (n, 4, 4)) and the TCP frame
+        n = q.shape[0]
+        M = np.broadcast_to(self._world, (n, 4, 4))
+        frames = [M]
+        A = np.zeros((n, 4, 4))
+        A[:, 3, 3] = 1
+        for i in range(self.axis):
+            theta = q[:, i] + self._theta_offset[i]
+            ct, st = np.cos(theta), np.sin(theta)
+            ca, sa = self._cos_alpha[i], self._sin_alpha[i]
+            A[:, 0, 0] = ct
+            A[:, 0, 1] = -st * ca
+            A[:, 0, 2] = st * sa
+            A[:, 0, 3] = self._a[i] * ct
+            A[:, 1, 0] = st
+            A[:, 1, 1] = ct * ca
+            A[:, 1, 2] = -ct * sa
+            A[:, 1, 3] = self._a[i] * st
+            A[:, 2, 1] = sa
+            A[:, 2, 2] = ca
+            A[:, 2, 3] = self._d[i]
+            M = np.matmul(M, A)
+            frames.append(M)
+        return frames, np.matmul(M, self._tcp)
+
+    def fk_matrix(self, angles):
+        """
+        :param angles: joint angles (radians), shape (axis,) or (n, axis)
+        :return: homogeneous transforms of the TCP, shape (n, 4, 4)
+        """
+        return self._chain(self._joints(angles))[1]
+
+    def fk(self, angles):
+        """
+        :param angles: joint angles (radians), shape (axis,) or (n, axis)
+        :return: poses [x, y, z, roll, pitch, yaw] (mm, radians), shape (n, 6)
+        """
+        T = self.fk_matrix(angles)
+        return np.concatenate([T[:, :3, 3], matrix_to_rpy(T[:, :3, :3])], axis=1)
+
+    def jacobian(self, angles):
+        """
+        Geometric jacobian of the TCP in the base frame, rows vx, vy, vz (mm/rad), wx, wy, wz
+        :return: shape (n, 6, axis)
+        """
+        frames, T = self._chain(self._joints(angles))
+        return self._jacobian(frames, T)
+
+    def _jacobian(self, frames, T):
+        p = T[:, :3, 3]
+        J = np.empty((p.shape[0], 6, self.axis))
+        for i in range(self.axis):
+            z = frames[i][:, :3, 2]
+            J[:, :3, i] = np.cross(z, p - frames[i][:, :3, 3])
+            J[:, 3:, i] = z
+        return J
+
+    def _solve(self, targets, seeds):
+        q = np.clip(seeds.copy(), self.lower, self.upper)
+        n = q.shape[0]
+        active = np.ones(n, dtype=bool)
+        weight = np.array([1, 1, 1, self.ORIENT_WEIGHT, self.ORIENT_WEIGHT, self.ORIENT_WEIGHT])
+        damping = self.DAMPING ** 2 * np.eye(6)
+        for _ in range(self.MAX_ITER):
+            idx = np.nonzero(active)[0]
+            if idx.size == 0:
+                break
+            frames, T = self._chain(q[idx])
+            dp = targets[idx, :3, 3] - T[:, :3, 3]
+            dr = _rotation_error(targets[idx, :3, :3], T[:, :3, :3])
+            done = (np.linalg.norm(dp, axis=1) < self.POS_TOL) & (np.linalg.norm(dr, axis=1) < self.ORIENT_TOL)
+            active[idx[done]] = False
+            keep = ~done
+            if not keep.any():
+                break
+            idx = idx[keep]
+            J = self._jacobian([f[keep] for f in frames], T[keep]) * weight[None, :, None]
+            e = np.concatenate([dp[keep], dr[keep]], axis=1) * weight
+            JT = np.transpose(J, (0, 2, 1))
+            dq = np.matmul(JT, np.linalg.solve(np.matmul(J, JT) + damping, e[:, :, None]))[:, :, 0]
+            step = np.max(np.abs(dq), axis=1, keepdims=True)
+            dq *= np.minimum(1, self.MAX_STEP / np.maximum(step, 1e-12))
+            q[idx] = np.clip(q[idx] + dq, self.lower, self.upper)
+        return q, ~active
+
+    def ik(self, poses, seed=None):
+        """
+        Inverse kinematics by damped least squares, all the poses are solved together
+        The solution is the one reached from the seed (closest branch), clamped to the joint limits
+        :param poses: [x, y, z, roll, pitch, yaw] (mm, radians), shape (6,) or (n, 6)
+        :param seed: joint angles (radians) to start from, shape (axis,) or (n, axis), default is default_seed
+            (the poses solved from the default seed are cached)
+        :return: (angles (n, axis), success (n,))
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        poses = poses.reshape(1, -1)[:, :6] if poses.ndim == 1 else poses[:, :6]
+        n = poses.shape[0]
+        angles = np.empty((n, self.axis))
+        success = np.zeros(n, dtype=bool)
+        if seed is not None:
+            seeds = np.broadcast_to(self._joints(seed), (n, self.axis))
+            todo = np.arange(n)
+            keys = None
+        else:
+            seeds = np.broadcast_to(self.default_seed, (n, self.axis))
+            keys = [tuple(row) for row in np.round(poses, self.CACHE_DECIMALS).tolist()] if self.cache_size else None
+            todo = []
+            for i in range(n):
+                hit = self._cache.get(keys[i], None) if keys is not None else None
+                if hit is None:
+                    todo.append(i)
+                else:
+                    self._cache.move_to_end(keys[i])
+                    angles[i], success[i] = hit
+            self.cache_hits += n - len(todo)
+            self.cache_misses += len(todo)
+            todo = np.array(todo, dtype=int)
+        if todo.size:
+            q, ok = self._solve(_pose_to_matrix(poses[todo]), seeds[todo])
+            angles[todo] = q
+            success[todo] = ok
+            if keys is not None:
+                for j, i in enumerate(todo):
+                    self._cache[keys[i]] = (q[j].copy(), bool(ok[j]))
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return angles, success
+
+    def cache_info(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses,
+                'size': len(self._cache), 'maxsize': self.cache_size}
+
+    def compare(self, arm, angles):
+        """
+        Cross-check with the controller, get_forward_kinematics and get_inverse_kinematics are called for every row
+        :param arm: XArmAPI (or XArm) instance
+        :param angles: joint angles (radians), shape (axis,) or (n, axis)
+        :return: dict, the maximum errors (mm, radians) and the number of the requests which failed
+            fk_position/fk_orientation: local FK vs controller FK
+            ik_position/ik_orientation: local FK of the controller IK vs the pose
+        """
+        q = self._joints(angles)
+        poses = self.fk(q)
+        fk_err = np.zeros((q.shape[0], 2))
+        ik_err = np.zeros((q.shape[0], 2))
+        failed = 0
+        for i in range(q.shape[0]):
+            code, pose = arm.get_forward_kinematics(q[i].tolist(), input_is_radian=True, return_is_radian=True)
+            if code != 0:
+                failed += 1
+                continue
+            fk_err[i] = self._pose_error(poses[i], pose)
+            code, joints = arm.get_inverse_kinematics(poses[i].tolist(), input_is_radian=True, return_is_radian=True)
+            if code != 0:
+                failed += 1
+                continue
+            ik_err[i] = self._pose_error(poses[i], self.fk(joints[:self.axis])[0])
+        return {
+            'count': int(q.shape[0]),
+            'failed': failed,
+            'fk_position': float(fk_err[:, 0].max()),
+            'fk_orientation': float(fk_err[:, 1].max()),
+            'ik_position': float(ik_err[:, 0].max()),
+            'ik_orientation': float(ik_err[:, 1].max()),
+        }
+
+    @staticmethod
+    def _pose_error(pose, other):
+        pose = np.asarray(pose, dtype=np.float64).reshape(1, 6)
+        other = np.asarray(other, dtype=np.float64)[:6].reshape(1, 6)
+        dr = _rotation_error(rpy_to_matrix(pose[:, 3:]), rpy_to_matrix(other[:, 3:]))
+        return np.linalg.norm(pose[0, :3] - other[0, :3]), np.linalg.norm(dr[0])
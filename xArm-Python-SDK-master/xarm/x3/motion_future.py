@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import threading
+from concurrent.futures import Future
+
+
+class MotionFuture(Future):
+    """
+    Future of a motion command sent with wait=False and future=True, resolved by the feedback of its transaction
+    result(timeout): code of the motion, as the code of the same command with wait=True
+        0: the motion is finished (feedback_code is the code of the feedback, see XCONF.FeedbackCode)
+        else: the code of the command if it failed, or the error which stopped the motion (APIState)
+    Usage:
+        future = arm.set_position(x=300, y=0, z=200, wait=False, future=True)
+        ...
+        code = future.result(timeout=10)
+        # or: future.add_done_callback(func), await asyncio.wrap_future(future)
+    """
+    def __init__(self):
+        super(MotionFuture, self).__init__()
+        self.set_running_or_notify_cancel()
+        self.trans_id = -1
+        self.feedback_key = None
+        self.feedback_code = None
+        # seqs of the last published RobotState when the command was sent and when the feedback was received,
+        # see Base._resolve_motion_futures
+        self.start_seq = 0
+        self.feedback_seq = None
+        self._resolve_lock = threading.Lock()
+        self._resolved = False
+
+    @property
+    def code(self):
+        # the code of the motion, None if it is not finished
+        return self.result() if self.done() else None
+
+    def resolve(self, code):
+        # called by the feedback, the report and the disconnecting threads, the first code is kept:
+        # claimed under the lock, set_result (which runs the done callbacks) outside of it
+        with self._resolve_lock:
+            if self._resolved:
+                return False
+            self._resolved = True
+        self.set_result(code)
+        return True
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import math
+try:
+    import numpy as np
+except:
+    np = None
+
+
+def _accel_time(v, acc, jerk):
+    # duration of a jerk-limited acceleration from 0 to v (S-curve), trapezoidal acceleration if v >= acc^2 / jerk
+    if jerk is None or jerk <= 0:
+        return v / acc
+    return np.where(v >= acc * acc / jerk, v / acc + acc / jerk, 2 * np.sqrt(np.maximum(v, 0) / jerk))
+
+
+def _segment_time(length, v, ends, acc, jerk):
+    # time of a segment at cruise speed v, with `ends` (0, 1, 2) ends at rest (each costs half an acceleration)
+    return length / v + ends * _accel_time(v, acc, jerk) / 2
+
+
+def _bisect(func, lo, hi, iterations=60):
+    # vectorized bisection of the increasing func(v) = 0 on [lo, hi]
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        positive = func(mid) > 0
+        hi = np.where(positive, mid, hi)
+        lo = np.where(positive, lo, mid)
+    return lo
+
+
+class MotionPlan(object):
+    """
+    Linear moves through waypoints with a speed and a blend radius per segment, see plan_linear_path
+    The times are estimates of a jerk-limited profile along the straight segments (the orientation is not timed),
+        the controller executes the moves with its own profile
+    Arrays (mm, mm/s, radians):
+        poses: (n, 6) waypoints
+        speeds, radii, times, min_times: (n - 1,) per segment, radii[i] is the blend radius at the end of
+            segment i (-1: the arm stops at the waypoint)
+        feasible: (n - 1,) False where the requested time is below the minimum time of the segment
+    """
+    def __init__(self, poses, speeds, mvacc, radii, times, min_times, feasible):
+        self.poses = poses
+        self.speeds = speeds
+        self.mvacc = mvacc
+        self.radii = radii
+        self.times = times
+        self.min_times = min_times
+        self.feasible = feasible
+
+    @property
+    def total_time(self):
+        return float(self.times.sum())
+
+    @property
+    def min_total_time(self):
+        return float(self.min_times.sum())
+
+    @property
+    def is_feasible(self):
+        return bool(self.feasible.all())
+
+    def commands(self):
+        """
+        :return: the kwargs of set_position (is_radian=True) of every segment, the first waypoint is not included
+        """
+        return [{
+            'x': pose[0], 'y': pose[1], 'z': pose[2], 'roll': pose[3], 'pitch': pose[4], 'yaw': pose[5],
+            'speed': float(speed), 'mvacc': self.mvacc, 'radius': float(radius), 'is_radian': True,
+        } for pose, speed, radius in zip(self.poses[1:].tolist(), self.speeds, self.radii)]
+
+    def execute(self, arm, move_to_start=True, wait=True, timeout=None):
+        """
+        Send the moves of the plan, the blended moves are queued without waiting so that they can be blended
+        :param arm: XArmAPI (or XArm) instance
+        :param move_to_start: move (and wait) to the first waypoint first
+        :param wait: wait for the end of the last move
+        :return: code
+        """
+        if move_to_start:
+            pose = self.poses[0].tolist()
+            code = arm.set_position(*pose, speed=float(self.speeds[0]), mvacc=self.mvacc, is_radian=True,
+                                    wait=True, timeout=timeout)
+            if code != 0:
+                return code
+        for command in self.commands():
+            code = arm.set_position(wait=False, **command)
+            if code != 0:
+                return code
+        if wait:
+            return arm.wait_move(timeout) if hasattr(arm, 'wait_move') else arm.arm.wait_move(timeout)
+        return 0
+
+    def summary(self):
+        return {
+            'segments': len(self.speeds),
+            'total_time': round(self.total_time, 4),
+            'min_total_time': round(self.min_total_time, 4),
+            'feasible': self.is_feasible,
+            'speeds': [round(v, 3) for v in self.speeds.tolist()],
+            'radii': [round(r, 3) for r in self.radii.tolist()],
+            'times': [round(t, 4) for t in self.times.tolist()],
+        }
+
+
+def plan_linear_path(waypoints, segment_times=None, cycle_time=None, max_speed=1000, mvacc=2000, jerk=10000,
+                     is_radian=True, blend_ratio=0.4, max_blend_angle=math.radians(150), min_length=0.1):
+    """
+    Time-parameterization of linear moves through the waypoints, all the segments are computed together
+    Target:
+        segment_times: time of every segment (n - 1 values), the speed of a segment is the lowest one reaching it
+        cycle_time: total time, one cruise speed for the whole path (smooth blended motion)
+        neither: the fastest plan within max_speed
+    The arm stops at the first/last waypoint and where the path turns by more than max_blend_angle (or a segment is
+        shorter than min_length), elsewhere the moves are blended: the radius is the tangent distance of an arc
+        passing the corner at the cruise speed with mvacc (v^2 / mvacc * tan(turn / 2)),
+        capped at blend_ratio of the shortest adjacent segment
+    :param waypoints: [[x, y, z, roll, pitch, yaw], ...] (mm, radians or degrees)
+    :param max_speed/mvacc/jerk: limits of the TCP (mm/s, mm/s^2, mm/s^3)
+    :return: MotionPlan
+    """
+    if np is None:
+        raise ImportError('plan_linear_path requires numpy')
+    poses = np.array(waypoints, dtype=np.float64)
+    if poses.ndim != 2 or poses.shape[0] < 2 or poses.shape[1] < 6:
+        raise ValueError('waypoints must be at least 2 poses of 6 values')
+    poses = poses[:, :6]
+    if not is_radian:
+        poses[:, 3:] = np.radians(poses[:, 3:])
+    count = poses.shape[0] - 1
+    delta = np.diff(poses[:, :3], axis=0)
+    lengths = np.linalg.norm(delta, axis=1)
+
+    # turn angle at every inner waypoint, the arm stops where it can not blend
+    directions = delta / np.maximum(lengths, 1e-9)[:, None]
+    cos_turn = np.clip(np.sum(directions[:-1] * directions[1:], axis=1), -1.0, 1.0)
+    turn = np.arccos(cos_turn)
+    short = lengths < min_length
+    blend = (turn <= max_blend_angle) & ~short[:-1] & ~short[1:]
+    # ends at rest of every segment
+    stop_at_start = np.concatenate([[True], ~blend])
+    stop_at_end = np.concatenate([~blend, [True]])
+    ends = stop_at_start.astype(np.float64) + stop_at_end
+    lengths = np.maximum(lengths, min_length)
+
+    # highest speed of every segment: max_speed, or the speed whose accelerations take the whole segment
+    def overrun(v):
+        return ends * v * _accel_time(v, mvacc, jerk) / 2 - lengths
+    lo = np.full(count, 1e-6)
+    hi = np.full(count, float(max_speed))
+    reachable = overrun(hi) <= 0
+    v_max = np.where(reachable, hi, _bisect(overrun, lo, hi))
+    min_times = _segment_time(lengths, v_max, ends, mvacc, jerk)
+
+    if segment_times is not None:
+        targets = np.asarray(segment_times, dtype=np.float64).reshape(-1)
+        if targets.shape[0] != count:
+            raise ValueError('segment_times must have {} values'.format(count))
+        feasible = targets >= min_times - 1e-9
+        speeds = np.where(feasible, _bisect(lambda v: targets - _segment_time(lengths, v, ends, mvacc, jerk),
+                                            lo, v_max), v_max)
+    elif cycle_time is not None:
+        # one cruise speed (capped per segment) whose total time is the cycle time
+        def total_excess(v):
+            return cycle_time - _segment_time(lengths, np.minimum(v, v_max), ends, mvacc, jerk).sum()
+        feasible = np.full(count, cycle_time >= min_times.sum() - 1e-9)
+        speed = _bisect(total_excess, np.array(1e-6), np.array(float(max_speed))) if feasible.all() else max_speed
+        speeds = np.minimum(float(speed), v_max)
+    else:
+        feasible = np.ones(count, dtype=bool)
+        speeds = v_max
+    times = _segment_time(lengths, speeds, ends, mvacc, jerk)
+
+    # blend radius at the end of every segment
+    corner_speed = np.minimum(speeds[:-1], speeds[1:])
+    radii = np.minimum(corner_speed ** 2 / mvacc * np.tan(turn / 2),
+                       blend_ratio * np.minimum(lengths[:-1], lengths[1:]))
+    radii = np.concatenate([np.where(blend, radii, -1), [-1]])
+    return MotionPlan(poses, speeds, float(mvacc), radii, times, min_times, feasible)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import math
+import time
+import threading
+import collections
+from ..core.utils.log import logger
+from .code import APIState
+
+
+class MotionQueue(object):
+    """
+    Streams motion targets to the command cache of the controller, keeping cmd_num between two watermarks
+    The feeder thread ends when all the targets are sent, wait() then waits for the end of the motion
+    When the reported cmd_num drops to low_watermark, the targets are sent up to high_watermark in one batch
+        (one socket write with arm_cmd.run_batch, the responses are waited together), then the next report
+        is waited for, so the cache never runs dry between the segments of a long blended path
+    Without reports (serial, enable_report=False), cmd_num is requested every POLL_INTERVAL seconds
+    Progress: sent targets, completed targets (sent - cmd_num) and the index of the executing one
+    Usage:
+        queue = arm.create_motion_queue(low_watermark=4, high_watermark=16)
+        queue.extend(poses, radius=5)  # (n, 6) numpy array or list, mm and radians/degrees
+        queue.start()
+        queue.progress  # {'total': n, 'sent': ..., 'completed': ..., 'executing': ...}
+        code = queue.wait()
+    """
+    LINE = 'line'
+    JOINT = 'joint'
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, arm, low_watermark=4, high_watermark=16):
+        if not 0 <= low_watermark < high_watermark:
+            raise ValueError('low_watermark must be below high_watermark')
+        self._arm = arm
+        self.low_watermark = low_watermark
+        self.high_watermark = min(high_watermark, arm._max_cmd_num)
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._alive = False
+        self._done = threading.Event()
+        self.code = 0
+        self.total = 0
+        self.sent = 0
+        self.batches = 0
+        self.cmd_num = 0
+        # lowest cmd_num seen when a batch was due (after the first one), 0 means the controller was starved
+        self.min_cmd_num = None
+
+    def extend(self, targets, kind=LINE, speed=None, mvacc=None, radius=None, is_radian=None):
+        """
+        Add targets, the targets are sent in the order they are added
+        :param targets: [[x, y, z, roll, pitch, yaw], ...] (kind='line') or [[angle-1, ..., angle-n], ...]
+            (kind='joint'), a list or a numpy array
+        :param speed/mvacc/radius: one value or one value per target, default is the last speed/acceleration of
+            the arm and no blending (radius -1)
+        :return: the index of the first added target
+        """
+        if kind not in (self.LINE, self.JOINT):
+            raise ValueError('kind must be {} or {}'.format(self.LINE, self.JOINT))
+        arm = self._arm
+        is_radian = arm.default_is_radian if is_radian is None else is_radian
+        targets = targets.tolist() if hasattr(targets, 'tolist') else list(targets)
+        count = len(targets)
+
+        def per_target(value, default, is_angle=False):
+            values = value.tolist() if hasattr(value, 'tolist') else value
+            values = list(values) if isinstance(values, (list, tuple)) else [values] * count
+            if len(values) != count:
+                raise ValueError('{} values expected, {} given'.format(count, len(values)))
+            return [default if v is None else float(v) if is_radian or not is_angle else math.radians(v)
+                    for v in values]
+        if kind == self.LINE:
+            speeds = per_target(speed, arm._last_tcp_speed)
+            accs = per_target(mvacc, arm._last_tcp_acc)
+        else:
+            speeds = per_target(speed, arm._last_joint_speed, is_angle=True)
+            accs = per_target(mvacc, arm._last_joint_acc, is_angle=True)
+        radii = per_target(radius, -1)
+        commands = []
+        for target, spd, acc, rad in zip(targets, speeds, accs, radii):
+            if kind == self.LINE:
+                pose = [float(target[i]) if is_radian or i < 3 else math.radians(target[i]) for i in range(6)]
+                commands.append(self._line_command(pose, spd, acc, rad))
+            else:
+                joints = [0] * 7
+                for i in range(min(len(target), arm.axis)):
+                    joints[i] = float(target[i]) if is_radian else math.radians(target[i])
+                commands.append(self._joint_command(joints, spd, acc, rad))
+        with self._lock:
+            index = self.total
+            self._pending.extend(commands)
+            self.total += count
+            self._done.clear()
+        return index
+
+    def extend_plan(self, plan):
+        """
+        Add the moves of a MotionPlan (see plan_linear_path), the first waypoint is not included
+        """
+        return self.extend(plan.poses[1:], kind=self.LINE, speed=plan.speeds, mvacc=plan.mvacc, radius=plan.radii,
+                           is_radian=True)
+
+    def _line_command(self, pose, spd, acc, radius):
+        # as XArm._set_position_absolute
+        if self._arm.version_is_ge(1, 11, 100):
+            return 'move_line_common', (pose, spd, acc, 0, radius), {}
+        if radius >= 0:
+            return 'move_lineb', (pose, spd, acc, 0, radius), {}
+        return 'move_line', (pose, spd, acc, 0), {}
+
+    def _joint_command(self, joints, spd, acc, radius):
+        # as XArm._set_servo_angle_absolute
+        if self._arm.version_is_ge(1, 5, 20) and radius >= 0:
+            return 'move_jointb', (joints, spd, acc, radius), {}
+        return 'move_joint', (joints, spd, acc, 0), {}
+
+    def start(self):
+        if not self._arm.connected:
+            return APIState.NOT_CONNECTED
+        if self._thread is not None and self._thread.is_alive():
+            return 0
+        self.code = 0
+        self._done.clear()
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return 0
+
+    def _next_cmd_num(self, seq):
+        # cmd_num reported after seq, requested if the reports stall
+        arm = self._arm
+        if arm._state_is_reported():
+            snapshot = arm.wait_for_new_snapshot(seq, timeout=arm._WAIT_REPORT_STALL)
+            if snapshot is not None:
+                return snapshot.seq, snapshot.cmd_num
+        else:
+            time.sleep(self.POLL_INTERVAL)
+        code, cmd_num = arm.get_cmdnum()
+        return arm._state_snapshot_seq, cmd_num if code == 0 else self.high_watermark
+
+    def _run(self):
+        arm = self._arm
+        arm_cmd = arm.arm_cmd
+        seq = arm._state_snapshot_seq
+        try:
+            while self._alive and arm.connected:
+                if arm.has_error:
+                    self.code = APIState.HAS_ERROR
+                    break
+                with self._lock:
+                    if not self._pending:
+                        break
+                seq, self.cmd_num = self._next_cmd_num(seq)
+                if self.cmd_num > self.low_watermark:
+                    continue
+                with self._lock:
+                    count = min(self.high_watermark - self.cmd_num, len(self._pending))
+                    calls = [self._pending.popleft() for _ in range(count)]
+                if self.batches and (self.min_cmd_num is None or self.cmd_num < self.min_cmd_num):
+                    self.min_cmd_num = self.cmd_num
+                arm._status_poller.wakeup()
+                arm._has_motion_cmd = True
+                if hasattr(arm_cmd, 'run_batch'):
+                    results = arm_cmd.run_batch(calls)
+                else:
+                    results = [getattr(arm_cmd, name)(*args, **kwargs) for name, args, kwargs in calls]
+                self.batches += 1
+                arm._is_set_move = True
+                for ret in results:
+                    code = arm._check_code(ret[0], is_move_cmd=True)
+                    if code != 0:
+                        self.code = code
+                        break
+                    self.sent += 1
+                if self.code != 0:
+                    logger.error('MotionQueue: target {} failed, code={}'.format(self.sent, self.code))
+                    break
+                last = calls[-1][1][0]
+                if calls[-1][0].startswith('move_line'):
+                    arm._last_position = list(last)
+                else:
+                    arm._last_angles = list(last)
+                # the batch is counted by the controller from the next report on
+                seq = arm._state_snapshot_seq
+        except Exception as e:
+            self.code = APIState.API_EXCEPTION
+            logger.error('MotionQueue exception: {}'.format(e))
+        finally:
+            self._alive = False
+            self._done.set()
+
+    def stop(self, clear=True):
+        """
+        Stop feeding, the targets already sent are executed by the controller
+        :param clear: drop the targets not sent yet
+        """
+        self._alive = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        if clear:
+            with self._lock:
+                self.total -= len(self._pending)
+                self._pending.clear()
+
+    def wait(self, timeout=None):
+        """
+        Wait until all the targets are sent and executed
+        :return: code, APIState.WAIT_FINISH_TIMEOUT on timeout
+        """
+        expired = None if timeout is None else time.monotonic() + timeout
+        if self._thread is not None and not self._done.wait(timeout):
+            return APIState.WAIT_FINISH_TIMEOUT
+        if self.code != 0:
+            return self.code
+        remaining = None if expired is None else max(expired - time.monotonic(), 0.001)
+        return self._arm.wait_move(remaining)
+
+    @property
+    def running(self):
+        return self._alive
+
+    @property
+    def progress(self):
+        cmd_num = self.cmd_num if self._alive else self._arm.cmd_num
+        completed = max(self.sent - cmd_num, 0)
+        return {
+            'total': self.total,
+            'sent': self.sent,
+            'completed': completed,
+            # index of the target being executed, None if the controller is idle
+            'executing': completed if cmd_num > 0 else None,
+        }
+
+    def stats(self):
+        stats = self.progress
+        stats.update({
+            'code': self.code,
+            'batches': self.batches,
+            'cmd_num': self.cmd_num,
+            'min_cmd_num': self.min_cmd_num,
+            'low_watermark': self.low_watermark,
+            'high_watermark': self.high_watermark,
+        })
+        return stats
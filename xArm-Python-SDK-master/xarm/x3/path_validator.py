@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import math
+try:
+    import numpy as np
+except:
+    np = None
+from ..core.config.x_config import XCONF
+
+
+class PathValidator(object):
+    """
+    Checks whole paths (joint or cartesian waypoints) against the limits of the arm in one pass, before they are sent
+    Joint waypoints: the joint limits of the arm type (XCONF.Robot.JOINT_LIMITS), narrowed by the joint ranges of the
+        reduced mode when it is on
+    Cartesian waypoints: the orientation limits of the arm type (XCONF.Robot.TCP_LIMITS, shifted by the TCP and
+        world offsets as XArm._is_out_of_tcp_range), and the TCP boundary when the reduced mode or the safety
+        boundary is on
+    The units are mm and radians
+    Usage:
+        code, validator = arm.get_path_validator()
+        bad = validator.check_joints(path)  # path: (n, axis), bad: indices of the waypoints out of the limits
+    """
+    # margin of the joint/orientation limits, as XArm._is_out_of_joint_range
+    TOLERANCE = math.radians(0.1)
+
+    def __init__(self, axis, arm_type, tcp_offset=None, world_offset=None, reduced_states=None, tolerance=None):
+        """
+        :param reduced_states: states of get_reduced_states(is_radian=True), None: the reduced mode is ignored
+        """
+        if np is None:
+            raise ImportError('PathValidator requires numpy')
+        self.axis = axis
+        self.arm_type = arm_type
+        self.tolerance = self.TOLERANCE if tolerance is None else tolerance
+        self.reduced_states = reduced_states
+        tcp_offset = [0] * 6 if tcp_offset is None else list(tcp_offset)
+        world_offset = [0] * 6 if world_offset is None else list(world_offset)
+        self.offsets = (tcp_offset, world_offset)
+
+        lower = np.full(axis, -np.inf)
+        upper = np.full(axis, np.inf)
+        joint_limit = XCONF.Robot.JOINT_LIMITS.get(axis, {}).get(arm_type, [])
+        for i in range(min(axis, len(joint_limit))):
+            lower[i], upper[i] = joint_limit[i][0] - self.tolerance, joint_limit[i][1] + self.tolerance
+        self.reduced = bool(reduced_states and reduced_states[0])
+        fence = bool(reduced_states and len(reduced_states) > 5 and reduced_states[5])
+        # reduced mode and safety boundary flags, as reported (see Base._is_reduced_mode/_is_fence_mode)
+        self.flags = (int(self.reduced), int(fence))
+        if self.reduced and len(reduced_states) > 4:
+            joint_range = list(reduced_states[4])
+            for i in range(min(axis, len(joint_range) // 2)):
+                if joint_range[i * 2] == joint_range[i * 2 + 1]:
+                    continue
+                lower[i] = max(lower[i], joint_range[i * 2] - self.tolerance)
+                upper[i] = min(upper[i], joint_range[i * 2 + 1] + self.tolerance)
+        self.joint_lower, self.joint_upper = lower, upper
+
+        # columns of the poses: x, y, z, roll, pitch, yaw
+        lower = np.full(6, -np.inf)
+        upper = np.full(6, np.inf)
+        tcp_range = XCONF.Robot.TCP_LIMITS.get(axis, {}).get(arm_type, [])
+        for i in range(3, min(6, len(tcp_range))):
+            if tcp_range[i][0] == tcp_range[i][1]:
+                continue
+            offset = tcp_offset[i] + world_offset[i]
+            lower[i] = tcp_range[i][0] + offset - self.tolerance
+            upper[i] = tcp_range[i][1] + offset + self.tolerance
+        self.boundary = None
+        if (self.reduced or fence) and len(reduced_states) > 1 and any(reduced_states[1]):
+            # [x_max, x_min, y_max, y_min, z_max, z_min]
+            boundary = list(reduced_states[1])
+            self.boundary = boundary
+            for i in range(3):
+                upper[i] = max(boundary[i * 2], boundary[i * 2 + 1])
+                lower[i] = min(boundary[i * 2], boundary[i * 2 + 1])
+        self.tcp_lower, self.tcp_upper = lower, upper
+
+    @staticmethod
+    def _points(path, size):
+        points = np.asarray(path, dtype=np.float64)
+        points = points.reshape(1, -1) if points.ndim == 1 else points
+        if points.ndim != 2 or points.shape[1] < size:
+            raise ValueError('path must have {} values per waypoint'.format(size))
+        return points[:, :size]
+
+    def joint_violations(self, path):
+        """
+        :param path: joint waypoints (radians), shape (n, axis) or (n, 7)
+        :return: bool array (n, axis), True where a joint is out of its limits (or not a number)
+        """
+        q = self._points(path, self.axis)
+        return ~((q >= self.joint_lower) & (q <= self.joint_upper))
+
+    def pose_violations(self, path):
+        """
+        :param path: cartesian waypoints [x, y, z, roll, pitch, yaw] (mm, radians), shape (n, 6)
+        :return: bool array (n, 6), True where a value is out of its limits (or not a number)
+        """
+        p = self._points(path, 6)
+        return ~((p >= self.tcp_lower) & (p <= self.tcp_upper))
+
+    def check_joints(self, path):
+        """
+        :return: indices of the joint waypoints out of the limits, empty if the whole path is valid
+        """
+        return np.flatnonzero(self.joint_violations(path).any(axis=1))
+
+    def check_poses(self, path):
+        """
+        :return: indices of the cartesian waypoints out of the limits, empty if the whole path is valid
+        """
+        return np.flatnonzero(self.pose_violations(path).any(axis=1))
+
+    def check(self, path, is_joint=True, is_radian=True):
+        """
+        :param is_radian: the angles of the path are in radians or not (degrees)
+        :return: indices of the waypoints out of the limits
+        """
+        if not is_radian:
+            path = np.array(path, dtype=np.float64)
+            if is_joint:
+                path = np.radians(path)
+            else:
+                path = path.reshape(-1, path.shape[-1])
+                path[:, 3:6] = np.radians(path[:, 3:6])
+        return self.check_joints(path) if is_joint else self.check_poses(path)
@@ -1,6 +1,298 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2020, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import struct
 from xarm.core.utils import convert
 
 
+def _swap16(value):
+    return ((value & 0xFF) << 8) | (value >> 8)
+
+
+def _swap32(value):
+    return ((value & 0xFF) << 24) | ((value & 0xFF00) << 8) | ((value >> 8) & 0xFF00) | (value >> 24)
+
+
+class ReportField(object):
+    """
+    One field of a report frame
+    fmt: 'f' float(little-endian), 'B'/'b' u8/i8, 'H'/'I' u16/u32(big-endian), 's' bytes
+    """
+    _SIZES = {'f': 4, 'B': 1, 'b': 1, 'H': 2, 'I': 4, 's': 1}
+    _SWAPS = {'H': _swap16, 'I': _swap32}
+
+    def __init__(self, name, offset, fmt, count=1, min_length=None, lazy=False):
+        self.name = name
+        self.offset = offset
+        self.fmt = fmt
+        self.count = count
+        self.end = offset + self._SIZES[fmt] * count
+        # frames shorter than min_length do not carry the field
+        self.min_length = self.end if min_length is None else min_length
+        self.lazy = lazy
+        self.is_list = count > 1 and fmt != 's'
+        self.items = 1 if fmt == 's' else count
+        self.swap = self._SWAPS.get(fmt)
+        # the whole frame is unpacked as little-endian, big-endian integers are swapped afterwards
+        self.code = '{}{}'.format(count if count > 1 or fmt == 's' else '', fmt)
+        self._struct = struct.Struct('<' + self.code)
+
+    def convert(self, values):
+        if self.swap:
+            values = [self.swap(val) for val in values]
+        return list(values) if self.is_list else values[0]
+
+    def unpack_from(self, data):
+        return self.convert(self._struct.unpack_from(data, self.offset))
+
+    def pack_into(self, buffer, value):
+        if self.fmt == 's':
+            struct.pack_into('{}s'.format(self.count), buffer, self.offset, value)
+        else:
+            # packed with the byte order of the frame, not swapped
+            fmt = '{}{}{}'.format('>' if self.swap else '<', self.count, self.fmt)
+            struct.pack_into(fmt, buffer, self.offset, *(value if self.is_list else [value]))
+
+
+class ReportLayout(object):
+    """
+    Declarative layout of a report frame
+    All eager fields present in a frame are decoded by a single struct.unpack_from,
+    the struct is compiled once per frame length, lazy fields are decoded on first access
+    """
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = sorted(fields, key=lambda f: f.offset)
+        self._field_map = {field.name: field for field in self.fields}
+        self._compiled = {}
+
+    def __contains__(self, name):
+        return name in self._field_map
+
+    def field(self, name):
+        return self._field_map[name]
+
+    def _compile(self, length):
+        fmt = '<'
+        pos = 0
+        index = 0
+        plan = []
+        for field in self.fields:
+            if field.lazy or field.min_length > length:
+                continue
+            if field.offset > pos:
+                fmt += '{}x'.format(field.offset - pos)
+            fmt += field.code
+            pos = field.end
+            plan.append((field.name, index, index + field.items, field.is_list, field.swap))
+            index += field.items
+        compiled = (struct.Struct(fmt), tuple(plan))
+        self._compiled[length] = compiled
+        return compiled
+
+    def unpack(self, data):
+        length = len(data)
+        compiled = self._compiled.get(length)
+        if compiled is None:
+            compiled = self._compile(length)
+        values = compiled[0].unpack_from(data)
+        ret = {}
+        for name, start, stop, is_list, swap in compiled[1]:
+            if swap:
+                ret[name] = [swap(val) for val in values[start:stop]] if is_list else swap(values[start])
+            elif is_list:
+                ret[name] = list(values[start:stop])
+            else:
+                ret[name] = values[start]
+        return ret
+
+    def decode(self, data):
+        return ReportFrame(self, data)
+
+    @property
+    def max_length(self):
+        return max(field.end for field in self.fields)
+
+    def pack(self, values, length=None):
+        """
+        Build a frame (the reverse of unpack), 'total' is set to the length of the frame
+        :param values: {name: value}, the missing fields and the fields beyond length are zero
+        :param length: length of the frame, default is the end of the last field
+        """
+        length = self.max_length if length is None else length
+        buffer = bytearray(length)
+        for field in self.fields:
+            if field.end > length:
+                continue
+            if field.name == 'total':
+                field.pack_into(buffer, length)
+            elif field.name in values:
+                field.pack_into(buffer, values[field.name])
+        return bytes(buffer)
+
+
+class ReportFrame(object):
+    """
+    Decoded report frame, fields are read as attributes
+    The frame refers to the receive buffer, call detach() before keeping it past the report callback
+    """
+    __slots__ = ('layout', 'data', 'values')
+
+    def __init__(self, layout, data):
+        self.layout = layout
+        self.data = data
+        self.values = layout.unpack(data)
+
+    def __getattr__(self, name):
+        if name in ReportFrame.__slots__:
+            raise AttributeError(name)
+        try:
+            return self.values[name]
+        except KeyError:
+            pass
+        if name not in self.layout or self.layout.field(name).min_length > len(self.data):
+            raise AttributeError('{} report has no field {} (length={})'.format(self.layout.name, name, len(self.data)))
+        value = self.layout.field(name).unpack_from(self.data)
+        self.values[name] = value
+        return value
+
+    @property
+    def length(self):
+        return len(self.data)
+
+    def has(self, name):
+        return name in self.layout and self.layout.field(name).min_length <= len(self.data)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if self.has(name) else default
+
+    def raw(self, name):
+        field = self.layout.field(name)
+        return bytes(self.data[field.offset:field.end])
+
+    def detach(self):
+        if not isinstance(self.data, bytes):
+            self.data = bytes(self.data)
+        return self
+
+
+def _common_fields():
+    return [
+        ReportField('total', 0, 'I'),
+        ReportField('state_mode', 4, 'B'),
+        ReportField('cmd_num', 5, 'H'),
+        ReportField('angles', 7, 'f', 7),
+        ReportField('pose', 35, 'f', 6),
+        ReportField('torque', 59, 'f', 7),
+    ]
+
+
+def _normal_fields():
+    return _common_fields() + [
+        ReportField('mtbrake', 87, 'B'),
+        ReportField('mtable', 88, 'B'),
+        ReportField('error_code', 89, 'B'),
+        ReportField('warn_code', 90, 'B'),
+        ReportField('pose_offset', 91, 'f', 6),
+        ReportField('tcp_load', 115, 'f', 4),
+        ReportField('collis_sens', 131, 'B'),
+        ReportField('teach_sens', 132, 'B'),
+        ReportField('gravity_direction', 133, 'f', 3),
+    ]
+
+
+REPORT_REAL_LAYOUT = ReportLayout('real', _common_fields() + [
+    ReportField('ft_ext_force', 87, 'f', 6, min_length=135),
+    ReportField('ft_raw_force', 111, 'f', 6, min_length=135),
+])
+
+REPORT_NORMAL_LAYOUT = ReportLayout('normal', _normal_fields())
+
+REPORT_RICH_LAYOUT = ReportLayout('rich', _normal_fields() + [
+    ReportField('arm_info', 145, 'B', 6),
+    ReportField('version', 151, 's', 29, lazy=True),
+    ReportField('trs_msg', 181, 'f', 5),
+    ReportField('p2p_msg', 201, 'f', 5),
+    ReportField('rot_msg', 221, 'f', 2),
+    ReportField('servo_codes', 229, 'B', 16, lazy=True),
+    ReportField('temperatures', 245, 'b', 7),
+    ReportField('speeds', 252, 'f', 8),
+    ReportField('count', 284, 'I'),
+    ReportField('world_offset', 288, 'f', 6),
+    ReportField('gpio_reset_enable', 312, 'B', 2),
+    ReportField('is_simulation_robot', 314, 'B', min_length=417),
+    ReportField('collision_detection', 315, 'B', 2, min_length=417),
+    ReportField('collision_tool_params', 317, 'f', 6, min_length=417),
+    ReportField('voltages', 341, 'H', 7, min_length=417),
+    ReportField('currents', 355, 'f', 7, min_length=417),
+    ReportField('cgpio_func', 383, 'B', 2, min_length=417),
+    ReportField('cgpio_values', 385, 'H', 8, min_length=417),
+    ReportField('cgpio_input_conf', 401, 'B', 8, min_length=417),
+    ReportField('cgpio_output_conf', 409, 'B', 8, min_length=417),
+    ReportField('cgpio_input_conf2', 417, 'B', 8, min_length=433),
+    ReportField('cgpio_output_conf2', 425, 'B', 8, min_length=433),
+    ReportField('ft_ext_force', 433, 'f', 6, min_length=481),
+    ReportField('ft_raw_force', 457, 'f', 6, min_length=481),
+    ReportField('iden_progress', 481, 'B'),
+    ReportField('pose_aa', 482, 'f', 3),
+    ReportField('flags', 494, 'B'),
+])
+
+REPORT_NORMAL_OLD_LAYOUT = ReportLayout('normal_old', [
+    ReportField('total', 0, 'I'),
+    ReportField('state', 4, 'B'),
+    ReportField('mtbrake', 5, 'B'),
+    ReportField('mtable', 6, 'B'),
+    ReportField('error_code', 7, 'B'),
+    ReportField('warn_code', 8, 'B'),
+    ReportField('angles', 9, 'f', 7),
+    ReportField('pose', 37, 'f', 6),
+    ReportField('cmd_num', 61, 'H'),
+    ReportField('pose_offset', 63, 'f', 6),
+])
+
+REPORT_RICH_OLD_LAYOUT = ReportLayout('rich_old', REPORT_NORMAL_OLD_LAYOUT.fields + [
+    ReportField('arm_info', 87, 'B', 6),
+    ReportField('version', 93, 's', 29, lazy=True),
+    ReportField('trs_msg', 123, 'f', 5),
+    ReportField('p2p_msg', 143, 'f', 5),
+    ReportField('rot_msg', 163, 'f', 2),
+    ReportField('sv3_msg', 171, 'H', 8, lazy=True),
+])
+
+
+def get_report_layout(report_type, is_old_protocol=False):
+    if report_type == 'real' or report_type == 'devlop':
+        return REPORT_REAL_LAYOUT
+    elif report_type == 'rich':
+        return REPORT_RICH_OLD_LAYOUT if is_old_protocol else REPORT_RICH_LAYOUT
+    else:
+        return REPORT_NORMAL_OLD_LAYOUT if is_old_protocol else REPORT_NORMAL_LAYOUT
+
+
+def bits_to_list(value):
+    return [value & 0x01, value >> 1 & 0x01, value >> 2 & 0x01, value >> 3 & 0x01,
+            value >> 4 & 0x01, value >> 5 & 0x01, value >> 6 & 0x01, value >> 7 & 0x01]
+
+
+def cgpio_states_from_frame(frame, extend=False):
+    cgpio_states = []
+    cgpio_states.extend(frame.cgpio_func)
+    cgpio_states.extend(frame.cgpio_values)
+    cgpio_states[6:10] = list(map(lambda x: x / 4095.0 * 10.0, cgpio_states[6:10]))
+    cgpio_states.append(frame.cgpio_input_conf)
+    cgpio_states.append(frame.cgpio_output_conf)
+    if extend and frame.has('cgpio_input_conf2'):
+        cgpio_states[-2].extend(frame.cgpio_input_conf2)
+        cgpio_states[-1].extend(frame.cgpio_output_conf2)
+    return cgpio_states
+
+
 class ReportHandler(object):
     def __init__(self, report_type):
         self.buffer = b''
@@ -14,6 +306,7 @@ class ReportHandler(object):
             self.parse_handler = self._parse_report_tcp_rich_data
         else:
             self.parse_handler = None
+        self.layout = get_report_layout(report_type)
         self.source_data = b''
         self.parse_dict = {}
 
@@ -62,143 +355,112 @@ class ReportHandler(object):
             self.buffer = self.buffer[self.report_size:]
         self.source_data = data
         if self.parse_handler:
-            return self.parse_handler(data)
-
-    def __parse_report_common_data(self, rx_data):
-        # length = convert.bytes_to_u32(rx_data[0:4])
-        length = len(rx_data)
-        state, mode = rx_data[4] & 0x0F, rx_data[4] >> 4
-        cmd_num = convert.bytes_to_u16(rx_data[5:7])
-        angles = convert.bytes_to_fp32s(rx_data[7:7 * 4 + 7], 7)
-        pose = convert.bytes_to_fp32s(rx_data[35:6 * 4 + 35], 6)
-        torque = convert.bytes_to_fp32s(rx_data[59:7 * 4 + 59], 7)
+            return self.parse_handler(self.layout.decode(data))
+
+    def __parse_report_common_data(self, frame):
+        length = frame.length
+        state, mode = frame.state_mode & 0x0F, frame.state_mode >> 4
         self.parse_dict['length'] = length
         self.parse_dict['state'] = state
         self.parse_dict['mode'] = mode
-        self.parse_dict['cmd_num'] = cmd_num
-        self.parse_dict['angles'] = angles
-        self.parse_dict['pose'] = pose
-        self.parse_dict['torque'] = torque
-        return [length, state, mode, cmd_num, angles, pose, torque]
-
-    def _parse_report_tcp_develop_data(self, rx_data):
-        ret = self.__parse_report_common_data(rx_data)
+        self.parse_dict['cmd_num'] = frame.cmd_num
+        self.parse_dict['angles'] = frame.angles
+        self.parse_dict['pose'] = frame.pose
+        self.parse_dict['torque'] = frame.torque
+        return [length, state, mode, frame.cmd_num, frame.angles, frame.pose, frame.torque]
+
+    def _parse_report_tcp_develop_data(self, frame):
+        ret = self.__parse_report_common_data(frame)
         return ret
 
-    def _parse_report_tcp_normal_data(self, rx_data):
-        ret = self.__parse_report_common_data(rx_data)
-        mtbrake, mtable, error_code, warn_code = rx_data[87:91]
-        tcp_offset = convert.bytes_to_fp32s(rx_data[91:6 * 4 + 91], 6)
-        tcp_load = convert.bytes_to_fp32s(rx_data[115:4 * 4 + 115], 4)
-        collis_sens, teach_sens = rx_data[131:133]
-        gravity_direction = convert.bytes_to_fp32s(rx_data[133:3 * 4 + 133], 3)
-        mtbrake = [mtbrake & 0x01, mtbrake >> 1 & 0x01, mtbrake >> 2 & 0x01, mtbrake >> 3 & 0x01,
-                   mtbrake >> 4 & 0x01, mtbrake >> 5 & 0x01, mtbrake >> 6 & 0x01, mtbrake >> 7 & 0x01]
-        mtable = [mtable & 0x01, mtable >> 1 & 0x01, mtable >> 2 & 0x01, mtable >> 3 & 0x01,
-                  mtable >> 4 & 0x01, mtable >> 5 & 0x01, mtable >> 6 & 0x01, mtable >> 7 & 0x01]
+    def _parse_report_tcp_normal_data(self, frame):
+        ret = self.__parse_report_common_data(frame)
+        mtbrake = bits_to_list(frame.mtbrake)
+        mtable = bits_to_list(frame.mtable)
         self.parse_dict['mtbrake'] = mtbrake
         self.parse_dict['mtable'] = mtable
-        self.parse_dict['tcp_offset'] = tcp_offset
-        self.parse_dict['tcp_load'] = tcp_load
-        self.parse_dict['error_code'] = error_code
-        self.parse_dict['warn_code'] = warn_code
-        self.parse_dict['collis_sens'] = collis_sens
-        self.parse_dict['teach_sens'] = teach_sens
-        self.parse_dict['gravity_direction'] = gravity_direction
-        ret.extend([mtbrake, mtable, error_code, warn_code, tcp_offset, tcp_load, collis_sens, teach_sens, gravity_direction])
+        self.parse_dict['tcp_offset'] = frame.pose_offset
+        self.parse_dict['tcp_load'] = frame.tcp_load
+        self.parse_dict['error_code'] = frame.error_code
+        self.parse_dict['warn_code'] = frame.warn_code
+        self.parse_dict['collis_sens'] = frame.collis_sens
+        self.parse_dict['teach_sens'] = frame.teach_sens
+        self.parse_dict['gravity_direction'] = frame.gravity_direction
+        ret.extend([mtbrake, mtable, frame.error_code, frame.warn_code, frame.pose_offset, frame.tcp_load,
+                    frame.collis_sens, frame.teach_sens, frame.gravity_direction])
         return ret
 
-    def _parse_report_tcp_rich_data(self, rx_data):
-        ret = self._parse_report_tcp_normal_data(rx_data)
-        length = ret[0]
-        if length >= 151:
-            arm_type, arm_axis, arm_master_id, arm_slave_id, arm_motor_tid, arm_motor_fid = rx_data[145:151]
+    def _parse_report_tcp_rich_data(self, frame):
+        ret = self._parse_report_tcp_normal_data(frame)
+        if frame.has('arm_info'):
+            arm_type, arm_axis, arm_master_id, arm_slave_id, arm_motor_tid, arm_motor_fid = frame.arm_info
             self.parse_dict['arm_type'] = arm_type
             self.parse_dict['arm_axis'] = arm_axis
             self.parse_dict['arm_master_id'] = arm_master_id
             self.parse_dict['arm_slave_id'] = arm_slave_id
             self.parse_dict['arm_motor_tid'] = arm_motor_tid
             self.parse_dict['arm_motor_fid'] = arm_motor_fid
-            ret.extend([arm_type, arm_axis, arm_master_id, arm_slave_id, arm_motor_tid, arm_motor_fid])
-        if length >= 181:
-            version = str(rx_data[151:180], 'utf-8')
+            ret.extend(frame.arm_info)
+        if frame.has('version'):
+            version = str(frame.version, 'utf-8')
             self.parse_dict['version'] = version
             ret.append(version)
-        if length >= 201:
-            trs_msg = convert.bytes_to_fp32s(rx_data[181:201], 5)
-            tcp_jerk, min_tcp_acc, max_tcp_acc, min_tcp_speed, max_tcp_speed = trs_msg
+        if frame.has('trs_msg'):
+            tcp_jerk, min_tcp_acc, max_tcp_acc, min_tcp_speed, max_tcp_speed = frame.trs_msg
             self.parse_dict['tcp_jerk'] = tcp_jerk
             self.parse_dict['min_tcp_acc'] = min_tcp_acc
             self.parse_dict['max_tcp_acc'] = max_tcp_acc
             self.parse_dict['min_tcp_speed'] = min_tcp_speed
             self.parse_dict['max_tcp_speed'] = max_tcp_speed
-            ret.extend([tcp_jerk, min_tcp_acc, max_tcp_acc, min_tcp_speed, max_tcp_speed])
-        if length >= 221:
-            p2p_msg = convert.bytes_to_fp32s(rx_data[201:221], 5)
-            joint_jerk, min_joint_acc, max_joint_acc, min_joint_speed, max_joint_speed = p2p_msg
+            ret.extend(frame.trs_msg)
+        if frame.has('p2p_msg'):
+            joint_jerk, min_joint_acc, max_joint_acc, min_joint_speed, max_joint_speed = frame.p2p_msg
             self.parse_dict['joint_jerk'] = joint_jerk
             self.parse_dict['min_joint_acc'] = min_joint_acc
             self.parse_dict['max_joint_acc'] = max_joint_acc
             self.parse_dict['min_joint_speed'] = min_joint_speed
             self.parse_dict['max_joint_speed'] = max_joint_speed
-            ret.extend([joint_jerk, min_joint_acc, max_joint_acc, min_joint_speed, max_joint_speed])
-        if length >= 229:
-            rot_msg = convert.bytes_to_fp32s(rx_data[221:229], 2)
-            rot_jerk, max_rot_acc = rot_msg
+            ret.extend(frame.p2p_msg)
+        if frame.has('rot_msg'):
+            rot_jerk, max_rot_acc = frame.rot_msg
             self.parse_dict['rot_jerk'] = rot_jerk
             self.parse_dict['max_rot_acc'] = max_rot_acc
-            ret.extend([rot_jerk, max_rot_acc])
-        if length >= 245:
-            servo_code = [val for val in rx_data[229:245]]
+            ret.extend(frame.rot_msg)
+        if frame.has('servo_codes'):
+            servo_code = frame.servo_codes
             self.parse_dict['servo_code'] = servo_code
             ret.extend([servo_code[:-2], servo_code[-2:]])
-        if length >= 252:
-            temperatures = list(map(int, rx_data[245:252]))
+        if frame.has('temperatures'):
+            # unsigned here, as ReportHandler always reported them
+            temperatures = list(frame.raw('temperatures'))
             self.parse_dict['temperatures'] = temperatures
             ret.append(temperatures)
-        if length >= 284:
-            speeds = convert.bytes_to_fp32s(rx_data[252:8 * 4 + 252], 8)
-            self.parse_dict['speeds'] = speeds
-            ret.append(speeds)
-        if length >= 288:
-            count = convert.bytes_to_u32(rx_data[284:288])
-            self.parse_dict['count'] = count
-            ret.append(count)
-        if length >= 312:
-            world_offset = convert.bytes_to_fp32s(rx_data[288:6 * 4 + 288], 6)
-            self.parse_dict['world_offset'] = world_offset
-            ret.append(world_offset)
-        if length >= 314:
-            cgpio_reset_enable, tgpio_reset_enable = rx_data[312:314]
+        if frame.has('speeds'):
+            self.parse_dict['speeds'] = frame.speeds
+            ret.append(frame.speeds)
+        if frame.has('count'):
+            self.parse_dict['count'] = frame.count
+            ret.append(frame.count)
+        if frame.has('world_offset'):
+            self.parse_dict['world_offset'] = frame.world_offset
+            ret.append(frame.world_offset)
+        if frame.has('gpio_reset_enable'):
+            cgpio_reset_enable, tgpio_reset_enable = frame.gpio_reset_enable
             self.parse_dict['cgpio_reset_enable'] = cgpio_reset_enable
             self.parse_dict['tgpio_reset_enable'] = tgpio_reset_enable
-            ret.extend([cgpio_reset_enable, tgpio_reset_enable])
-        if length >= 416:
-        # if length >= 340:
-            is_collision_check, collision_tool_type = rx_data[314:316]
-            collision_tool_params = convert.bytes_to_fp32s(rx_data[316:340], 6)
+            ret.extend(frame.gpio_reset_enable)
+        if frame.has('collision_detection'):
+            is_collision_check, collision_tool_type = frame.collision_detection
             self.parse_dict['is_collision_check'] = is_collision_check
             self.parse_dict['collision_tool_type'] = collision_tool_type
-            self.parse_dict['collision_tool_params'] = collision_tool_params
-            ret.extend([is_collision_check, collision_tool_type, collision_tool_params])
-        # if length >= 354:
-            voltages = convert.bytes_to_u16s(rx_data[340:354], 7)
-            voltages = list(map(lambda x: x / 100, voltages))
+            self.parse_dict['collision_tool_params'] = frame.collision_tool_params
+            ret.extend([is_collision_check, collision_tool_type, frame.collision_tool_params])
+            voltages = list(map(lambda x: x / 100, frame.voltages))
             self.parse_dict['voltages'] = voltages
             ret.append(voltages)
-        # if length >= 382:
-            currents = convert.bytes_to_fp32s(rx_data[354:382], 7)
-            self._currents = currents
-            self.parse_dict['currents'] = currents
-            ret.append(currents)
-        # if length >= 416:
-            cgpio_states = []
-            cgpio_states.extend(rx_data[382:384])
-            cgpio_states.extend(convert.bytes_to_u16s(rx_data[384:400], 8))
-            cgpio_states[6:10] = list(map(lambda x: x / 4095.0 * 10.0, cgpio_states[6:10]))
-            cgpio_states.append(list(map(int, rx_data[400:408])))
-            cgpio_states.append(list(map(int, rx_data[408:416])))
+            self.parse_dict['currents'] = frame.currents
+            ret.append(frame.currents)
+            cgpio_states = cgpio_states_from_frame(frame)
             self.parse_dict['cgpio_states'] = cgpio_states
             ret.append(cgpio_states)
         return ret
-
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import collections
+
+_FIELDS = (
+    'seq',                    # sequence number, increased by one per published snapshot
+    'timestamp',              # time.monotonic() of the publication
+    'state',
+    'mode',
+    'cmd_num',
+    'error_code',
+    'warn_code',
+    'is_ready',
+    'position',               # (x(mm), y(mm), z(mm), roll(rad), pitch(rad), yaw(rad))
+    'angles',                 # (rad, ...)
+    'position_offset',        # tcp offset, (x(mm), y(mm), z(mm), roll(rad), pitch(rad), yaw(rad))
+    'joints_torque',
+    'motor_brake_states',
+    'motor_enable_states',
+    'realtime_tcp_speed',     # mm/s
+    'realtime_joint_speeds',  # (rad/s, ...)
+    'temperatures',
+    'ft_ext_force',
+    'ft_raw_force',
+)
+
+
+class RobotState(collections.namedtuple('RobotState', _FIELDS)):
+    """
+    Immutable snapshot of the arm, built once per report and published with one reference swap,
+    so all the fields of a snapshot belong to the same report
+    The sequences are tuples, the lengths are in mm and the angles are in radians whatever is_radian is
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_arm(cls, arm, seq, timestamp):
+        return cls(
+            seq, timestamp, arm._state, arm._mode, arm._cmd_num, arm._error_code, arm._warn_code, arm._is_ready,
+            tuple(arm._position), tuple(arm._angles), tuple(arm._position_offset), tuple(arm._joints_torque),
+            tuple(arm._arm_motor_brake_states), tuple(arm._arm_motor_enable_states),
+            arm._realtime_tcp_speed, tuple(arm._realtime_joint_speeds), tuple(arm._temperatures),
+            tuple(arm._ft_ext_force), tuple(arm._ft_raw_force),
+        )
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import gc
+import math
+import time
+import threading
+try:
+    import numpy as np
+except:
+    np = None
+from ..core.config.x_config import XCONF
+from ..core.utils import convert
+from ..core.utils.log import logger
+from ..core.utils.comm_stats import LatencyHistogram
+from .code import APIState
+
+
+class ServoStreamer(object):
+    """
+    Sends a trajectory in servo mode (mode 1) at a fixed rate from its own thread
+        (set_servo_angle_j / set_servo_cartesian without the per call conversions)
+    The frames of a trajectory (list or numpy array) are encoded before the start, the points of a generator
+        are encoded while waiting for the deadline of the previous one
+    Every frame k is sent at start + k * period (time.perf_counter), the thread sleeps until spin seconds before
+        the deadline and spins for the rest
+    The streaming stops at the end of the trajectory, on stop() or when a frame fails (see code)
+    Usage:
+        arm.set_mode(1)
+        arm.set_state(0)
+        streamer = arm.create_servo_streamer(angles_array, rate=200)  # shape: (n, axis), radians
+        streamer.start()
+        code = streamer.wait()
+        streamer.stats()  # achieved period, jitter percentiles, late frames
+    """
+    JOINT = 'joint'
+    CARTESIAN = 'cartesian'
+    # a frame is late if it is sent more than LATE_FRACTION period after its deadline
+    LATE_FRACTION = 0.5
+
+    def __init__(self, arm, trajectory, rate=200, kind=JOINT, speed=None, mvacc=None, is_radian=None,
+                 is_tool_coord=False, spin=0.001, drop_late=False, validate=True, disable_gc=False):
+        """
+        :param arm: XArm instance (XArmAPI.arm)
+        :param trajectory: points, [angle-1, ..., angle-n] (kind='joint') or [x, y, z, roll, pitch, yaw]
+            (kind='cartesian'), a list, a numpy array (n, axis/6) or a generator of points
+        :param rate: frames per second (100~250 with the servo mode)
+        :param speed/mvacc: speed/acceleration fields of every frame, joint (°/s, °/s^2 or radians, see is_radian)
+            or TCP (mm/s, mm/s^2), default is the last joint/TCP speed/acceleration of the arm
+        :param is_radian: the angles of the trajectory are in radians or not, default is arm.default_is_radian
+        :param spin: seconds of busy waiting before every deadline (precision against sleep granularity)
+        :param drop_late: skip the frames whose deadline is over by more than a period (keeps the timing)
+        :param validate: check the trajectory (not a generator) against the limits first, see check_path_limits
+        :param disable_gc: disable the garbage collector (of the whole process) while streaming
+        """
+        if kind not in (self.JOINT, self.CARTESIAN):
+            raise ValueError('kind must be {} or {}'.format(self.JOINT, self.CARTESIAN))
+        self._arm = arm
+        self.kind = kind
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.spin = spin
+        self.drop_late = drop_late
+        self.validate = validate
+        self.disable_gc = disable_gc
+        self.is_radian = arm.default_is_radian if is_radian is None else is_radian
+        self.is_tool_coord = is_tool_coord
+        if kind == self.JOINT:
+            self._funcode = XCONF.UxbusReg.MOVE_SERVOJ
+            speed = arm._last_joint_speed if speed is None else speed if self.is_radian else math.radians(speed)
+            mvacc = arm._last_joint_acc if mvacc is None else mvacc if self.is_radian else math.radians(mvacc)
+            # mvtime, as set_servo_angle_j
+            self._params = [speed, mvacc, 0]
+            self._size = 7
+        else:
+            self._funcode = XCONF.UxbusReg.MOVE_SERVO_CART
+            speed = arm._last_tcp_speed if speed is None else speed
+            mvacc = arm._last_tcp_acc if mvacc is None else mvacc
+            self._params = [speed, mvacc, int(is_tool_coord)]
+            self._size = 6
+        self._generator = not isinstance(trajectory, (list, tuple)) \
+            and not (np is not None and isinstance(trajectory, np.ndarray))
+        self._trajectory = trajectory
+        self._frames = None
+        self._thread = None
+        self._alive = False
+        self._done = threading.Event()
+        self.code = 0
+        self.sent = 0
+        self.dropped = 0
+        self.late = 0
+        self.start_time = None
+        self.end_time = None
+        # time between the sends of two frames, lateness of the sends, round trip of the frames
+        self.period_hist = LatencyHistogram()
+        self.jitter = LatencyHistogram()
+        self.send_hist = LatencyHistogram()
+
+    def _encode(self, point):
+        values = [0] * self._size
+        for i in range(min(len(point), self._size)):
+            values[i] = float(point[i]) if self.is_radian or (self.kind == self.CARTESIAN and i < 3) \
+                else math.radians(point[i])
+        if self.kind == self.JOINT:
+            for i in range(self._arm.axis, 7):
+                values[i] = 0
+        return convert.fp32s_to_bytes(values + self._params, self._size + 3)
+
+    def _encode_all(self, points):
+        if np is None:
+            return [self._encode(point) for point in points]
+        points = np.asarray(points, dtype=np.float64)
+        points = points.reshape(1, -1) if points.ndim == 1 else points
+        width = self._size + 3
+        data = np.zeros((points.shape[0], width), dtype='<f4')
+        cols = min(points.shape[1], self._size, self._arm.axis if self.kind == self.JOINT else 6)
+        data[:, :cols] = points[:, :cols]
+        if not self.is_radian:
+            if self.kind == self.JOINT:
+                data[:, :cols] = np.radians(points[:, :cols])
+            else:
+                data[:, 3:6] = np.radians(points[:, 3:6])
+        data[:, self._size:] = self._params
+        buf = data.tobytes()
+        size = width * 4
+        return [buf[i * size:(i + 1) * size] for i in range(points.shape[0])]
+
+    def start(self):
+        """
+        :return: code, 0 if the streaming is started
+            APIState.OUT_OF_RANGE: the trajectory is out of the limits (validate=True)
+            APIState.MODE_IS_NOT_CORRECT: the reported mode is not the servo mode
+        """
+        arm = self._arm
+        if self._thread is not None:
+            return 0
+        if not arm.connected:
+            return APIState.NOT_CONNECTED
+        if arm._enable_report and arm._stream_type == 'socket' and arm.mode != 1:
+            logger.error('ServoStreamer: the servo mode (1) is required, mode={}'.format(arm.mode))
+            return APIState.MODE_IS_NOT_CORRECT
+        if not self._generator:
+            if self.validate:
+                code, indexes = arm.check_path_limits(self._trajectory, is_joint=self.kind == self.JOINT,
+                                                      is_radian=self.is_radian)
+                if code == 0 and indexes:
+                    return APIState.OUT_OF_RANGE
+            self._frames = self._encode_all(self._trajectory)
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return 0
+
+    def _wait_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.perf_counter() < deadline:
+            pass
+
+    def _run(self):
+        arm = self._arm
+        arm_cmd = arm.arm_cmd
+        funcode = self._funcode
+        period = self.period
+        late_after = period * self.LATE_FRACTION
+        frames = iter(self._frames) if self._frames is not None else (self._encode(p) for p in self._trajectory)
+        gc_enabled = gc.isenabled()
+        if self.disable_gc:
+            gc.disable()
+        arm._has_motion_cmd = True
+        last_send = None
+        try:
+            frame = next(frames, None)
+            deadline = self.start_time = time.perf_counter()
+            while self._alive and frame is not None:
+                self._wait_until(deadline)
+                now = time.perf_counter()
+                if self.drop_late and now - deadline > period:
+                    skip = int((now - deadline) / period)
+                    for _ in range(skip):
+                        frame = next(frames, None)
+                        if frame is None:
+                            break
+                        self.dropped += 1
+                    deadline += skip * period
+                    if frame is None:
+                        break
+                self.jitter.record(now - deadline)
+                if now - deadline > late_after:
+                    self.late += 1
+                if last_send is not None:
+                    self.period_hist.record(now - last_send)
+                last_send = self.end_time = now
+                ret = arm_cmd.set_nu8(funcode, frame, len(frame))
+                self.send_hist.record(time.perf_counter() - now)
+                self.sent += 1
+                code = arm._check_code(ret[0], is_move_cmd=True, mode=1)
+                if code != 0:
+                    self.code = code
+                    logger.error('ServoStreamer: frame {} failed, code={}'.format(self.sent - 1, code))
+                    break
+                deadline += period
+                frame = next(frames, None)
+        except Exception as e:
+            self.code = APIState.API_EXCEPTION
+            logger.error('ServoStreamer exception: {}'.format(e))
+        finally:
+            if self.disable_gc and gc_enabled:
+                gc.enable()
+            arm._is_set_move = True
+            self._alive = False
+            self._done.set()
+
+    def stop(self):
+        self._alive = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the end of the streaming
+        :return: code, 0 if all the frames were sent, APIState.WAIT_FINISH_TIMEOUT on timeout
+        """
+        if self._thread is None:
+            return self.code
+        if not self._done.wait(timeout):
+            return APIState.WAIT_FINISH_TIMEOUT
+        return self.code
+
+    @property
+    def running(self):
+        return self._alive
+
+    def stats(self):
+        elapsed = (self.end_time - self.start_time) if self.end_time is not None and self.sent > 1 else 0
+        return {
+            'rate': self.rate,
+            'achieved_rate': round((self.sent - 1) / elapsed, 3) if elapsed > 0 else 0,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'late': self.late,
+            'code': self.code,
+            'period': self.period_hist.snapshot(),
+            'jitter': self.jitter.snapshot(),
+            'send': self.send_hist.snapshot(),
+        }
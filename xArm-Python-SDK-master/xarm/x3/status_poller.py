@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import time
+import threading
+import collections
+from ..core.utils.comm_stats import LatencyHistogram
+from .utils import filter_invaild_number
+
+
+class StatusPoller(object):
+    """
+    Polls the state of the arm when there is no report socket (serial, or socket with poll_status=True)
+    The requests of a poll are written together when the connection can pipeline them (socket),
+        one after the other without delay else (serial),
+        the error/warn codes are only requested when the state byte of a response flags an error or a warning
+    The interval adapts to the arm:
+        fast_interval while it moves, is paused, has commands in its cache or a command was just sent (wakeup)
+        idle_interval else
+    """
+    RATE_WINDOW = 1.0
+
+    def __init__(self, arm, fast_interval=0.01, idle_interval=0.2, grace=1.0):
+        self._arm = arm
+        self.fast_interval = fast_interval
+        self.idle_interval = idle_interval
+        self.grace = grace
+        self._event = threading.Event()
+        self._active_until = 0
+        self._times = collections.deque()
+        self.polls = 0
+        self.failures = 0
+        self.requests = 0
+        self.round_trip = LatencyHistogram()
+
+    def wakeup(self):
+        # a command was sent, poll fast at once
+        self._active_until = time.monotonic() + self.grace
+        self._event.set()
+
+    @property
+    def active(self):
+        arm = self._arm
+        now = time.monotonic()
+        return arm._state in [1, 3] or arm._cmd_num > 0 or now < self._active_until or now < arm._sleep_finish_time
+
+    @property
+    def interval(self):
+        return self.fast_interval if self.active else self.idle_interval
+
+    @property
+    def rate(self):
+        # polls per second achieved over the last RATE_WINDOW seconds
+        times = self._times
+        if len(times) < 2:
+            return 0
+        if time.monotonic() - times[-1] > self.RATE_WINDOW:
+            return 0
+        return (len(times) - 1) / max(times[-1] - times[0], 1e-6)
+
+    def wait(self, start):
+        """
+        Wait for the next poll, start is the time.monotonic() of the start of the last poll
+        """
+        delay = self.interval - (time.monotonic() - start)
+        if delay > 0:
+            self._event.wait(delay)
+        self._event.clear()
+
+    def poll(self):
+        """
+        Request the state, cmd_num, error/warn codes, joint angles and TCP pose and update the arm with them
+        :return: True if all the requests succeeded
+        """
+        arm = self._arm
+        arm_cmd = arm.arm_cmd
+        calls = [('get_state', (), {}), ('get_cmdnum', (), {}), ('get_joint_pos', (), {}), ('get_tcp_pose', (), {})]
+        if arm_cmd.has_err_warn or arm._error_code != 0 or arm._warn_code != 0:
+            calls.append(('get_err_code', (), {}))
+        start = time.monotonic()
+        if hasattr(arm_cmd, 'run_batch'):
+            results = arm_cmd.run_batch(calls)
+        else:
+            results = [getattr(arm_cmd, name)(*args, **kwargs) for name, args, kwargs in calls]
+        end = time.monotonic()
+        self.round_trip.record(end - start)
+        self.requests += len(calls)
+        ok = True
+        for (name, _, _), ret in zip(calls, results):
+            if not isinstance(ret, list) or arm._check_code(ret[0]) != 0:
+                ok = False
+                continue
+            if name == 'get_state':
+                arm._state = ret[1]
+                arm._last_update_state_time = end
+            elif name == 'get_cmdnum':
+                arm._cmd_num = ret[1]
+                arm._last_update_cmdnum_time = end
+            elif name == 'get_joint_pos' and len(ret) > 7:
+                arm._angles = [filter_invaild_number(ret[i], 6, default=arm._angles[i - 1]) for i in range(1, 8)]
+            elif name == 'get_tcp_pose' and len(ret) > 6:
+                arm._position = [filter_invaild_number(ret[i], 6, default=arm._position[i - 1]) for i in range(1, 7)]
+            elif name == 'get_err_code':
+                arm._error_code, arm._warn_code = ret[1:3]
+                arm._last_update_err_time = end
+        self.polls += 1
+        if not ok:
+            self.failures += 1
+        self._times.append(end)
+        while self._times and end - self._times[0] > self.RATE_WINDOW:
+            self._times.popleft()
+        return ok
+
+    def stats(self):
+        return {
+            'rate': round(self.rate, 2),
+            'interval': self.interval,
+            'active': self.active,
+            'polls': self.polls,
+            'failures': self.failures,
+            'requests': self.requests,
+            'round_trip': self.round_trip.snapshot(),
+        }
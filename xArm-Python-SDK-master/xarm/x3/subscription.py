@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import math
+import threading
+from ..core.utils.log import logger
+from .robot_state import RobotState
+
+
+def _position_to_user(value, is_radian):
+    return list(value) if is_radian else [math.degrees(v) if 2 < i < 6 else v for i, v in enumerate(value)]
+
+
+def _angles_to_user(value, is_radian):
+    return list(value) if is_radian else [math.degrees(v) for v in value]
+
+
+def _bools(value, is_radian):
+    return [bool(v) for v in value]
+
+
+# names of the report callback data => (RobotState field, conversion to the format of the report callback)
+FIELD_ALIASES = {
+    'cartesian': ('position', _position_to_user),
+    'joints': ('angles', _angles_to_user),
+    'mtable': ('motor_enable_states', _bools),
+    'mtbrake': ('motor_brake_states', _bools),
+    'cmdnum': ('cmd_num', None),
+}
+
+
+class ReportSubscription(object):
+    """
+    Filter of a report callback, fed with the RobotState of every report
+    fields: names of the data, RobotState fields (e.g. 'position', 'temperatures', values as in RobotState)
+        or the names of the report callback ('cartesian', 'joints', 'mtable', 'mtbrake', 'cmdnum', values as before)
+    max_rate: at most max_rate calls per second, 0 means every report
+    deadband: if not None, a report is delivered only if a field changed since the last delivered report,
+        by more than deadband[field] for the fields in it (e.g. {'cartesian': 0.5}),
+        thresholds are in the units of RobotState (mm, rad), compared per element
+    A call which is still pending (callback thread/asyncio) is not queued again, its data is replaced by the latest
+    """
+    def __init__(self, callback, fields, max_rate=0, deadband=None, is_radian=None):
+        self.callback = callback
+        self._fields = []
+        for name in fields:
+            source, convert = FIELD_ALIASES.get(name, (name, None))
+            if source not in RobotState._fields:
+                raise ValueError('unknown report field: {}'.format(name))
+            self._fields.append((name, RobotState._fields.index(source), convert))
+        self._min_interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0
+        self._deadband = None if deadband is None else [deadband.get(name, 0) for name, _, _ in self._fields]
+        # callable which returns the is_radian of the arm for the converted fields
+        self._is_radian = is_radian if is_radian is not None else (lambda: True)
+        self._last_time = None
+        self._last_values = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._scheduled = False
+        self.coalesced_count = 0
+
+    def _changed(self, values):
+        for value, last, threshold in zip(values, self._last_values, self._deadband):
+            if value == last:
+                continue
+            if isinstance(value, tuple):
+                if len(value) != len(last):
+                    return True
+                for a, b in zip(value, last):
+                    if abs(a - b) > threshold:
+                        return True
+            elif isinstance(value, (int, float)):
+                if abs(value - last) > threshold:
+                    return True
+            elif value != last:
+                return True
+        return False
+
+    def offer(self, snapshot, run):
+        """
+        :param snapshot: RobotState
+        :param run: run(func, msg), runs the callback like the other report callbacks
+        """
+        if self._min_interval and self._last_time is not None \
+                and snapshot.timestamp - self._last_time < self._min_interval:
+            return
+        values = [snapshot[index] for _, index, _ in self._fields]
+        if self._deadband is not None and self._last_values is not None and not self._changed(values):
+            return
+        self._last_time = snapshot.timestamp
+        self._last_values = values
+        is_radian = self._is_radian()
+        data = {name: value if convert is None else convert(value, is_radian)
+                for (name, _, convert), value in zip(self._fields, values)}
+        with self._lock:
+            if self._scheduled:
+                self.coalesced_count += 1
+                self._pending = data
+                return
+            self._scheduled = True
+            self._pending = data
+        run(self._drain, None)
+
+    def _drain(self, _=None):
+        while True:
+            with self._lock:
+                data, self._pending = self._pending, None
+                if data is None:
+                    self._scheduled = False
+                    return
+            try:
+                self.callback(data)
+            except Exception as e:
+                logger.error('run report callback exception: {}'.format(e))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2018, UFACTORY, Inc.
+# All rights reserved.
+#
+# Author: Vinman <vinman.wen@ufactory.cc> <vinman.cub@gmail.com>
+
+import time
+import threading
+try:
+    import numpy as np
+except:
+    np = None
+
+
+class TelemetryHistory(object):
+    """
+    Fixed-capacity ring buffer of the reports, filled with the RobotState of every report
+    The units are those of RobotState: mm and radians whatever is_radian is
+    Columns:
+        t: time.monotonic() of the report
+        seq, state, mode: one value per report
+        angles(7), position(6), joints_torque(7), currents(7), ft_ext_force(6): one row per report
+        currents are only reported by the rich report (report_type='rich'), the rows of the other reports are NaN
+    The queries return copies taken under the lock, so the columns of a result always belong to the same reports
+    Usage:
+        arm = XArmAPI('192.168.1.185', telemetry_history=2500)
+        window = arm.telemetry_history.window(seconds=2)
+        window['t'], window['angles']  # shape: (n,), (n, 7)
+    """
+    ROWS = (('angles', 7), ('position', 6), ('joints_torque', 7), ('currents', 7), ('ft_ext_force', 6))
+    VALUES = (('seq', 'int64'), ('state', 'int8'), ('mode', 'int8'))
+
+    def __init__(self, capacity=2500):
+        if np is None:
+            raise ImportError('TelemetryHistory requires numpy')
+        self.capacity = int(capacity)
+        if self.capacity <= 0:
+            raise ValueError('capacity must be positive')
+        self._lock = threading.Lock()
+        self._t = np.zeros(self.capacity, dtype=np.float64)
+        self._columns = {name: np.zeros(self.capacity, dtype=dtype) for name, dtype in self.VALUES}
+        self._columns.update({name: np.full((self.capacity, size), np.nan) for name, size in self.ROWS})
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total(self):
+        # number of the reports appended since the creation (or the last clear)
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+
+    def append(self, snapshot, currents=None):
+        """
+        :param snapshot: RobotState
+        :param currents: currents of the joints, None if the report has no currents
+        """
+        with self._lock:
+            i = self._count % self.capacity
+            self._t[i] = snapshot.timestamp
+            columns = self._columns
+            columns['seq'][i] = snapshot.seq
+            columns['state'][i] = snapshot.state
+            columns['mode'][i] = snapshot.mode
+            columns['angles'][i] = snapshot.angles
+            columns['position'][i] = snapshot.position
+            columns['joints_torque'][i] = snapshot.joints_torque
+            columns['ft_ext_force'][i] = snapshot.ft_ext_force
+            columns['currents'][i] = np.nan if currents is None else currents
+            self._count += 1
+
+    def _ordered_indices(self):
+        # ring indices of the stored reports, oldest first
+        n = min(self._count, self.capacity)
+        return np.arange(self._count - n, self._count) % self.capacity
+
+    def _select(self, indices, fields):
+        result = {'t': self._t[indices]}
+        for name in (fields or self._columns):
+            result[name] = self._columns[name][indices]
+        return result
+
+    def _check_fields(self, fields):
+        for name in fields or ():
+            if name not in self._columns:
+                raise ValueError('unknown telemetry field: {}'.format(name))
+
+    def last(self, n, fields=None):
+        """
+        The last n reports
+        :param n: number of reports
+        :param fields: names of the columns, None means all
+        :return: dict of arrays, oldest first
+        """
+        self._check_fields(fields)
+        with self._lock:
+            indices = self._ordered_indices()[-n:] if n > 0 else self._ordered_indices()[:0]
+            return self._select(indices, fields)
+
+    def window(self, seconds=None, start=None, end=None, fields=None):
+        """
+        The reports of a time window
+        :param seconds: the last seconds before now, ignored if start is given
+        :param start: time.monotonic() of the start of the window, None means the oldest report
+        :param end: time.monotonic() of the end of the window, None means the latest report
+        :param fields: names of the columns, None means all
+        :return: dict of arrays, oldest first
+        """
+        self._check_fields(fields)
+        if start is None and seconds is not None:
+            start = time.monotonic() - seconds
+        with self._lock:
+            indices = self._ordered_indices()
+            t = self._t[indices]
+            lo = 0 if start is None else np.searchsorted(t, start, side='left')
+            hi = len(t) if end is None else np.searchsorted(t, end, side='right')
+            return self._select(indices[lo:hi], fields)
+
+    def interpolate(self, t, field='angles'):
+        """
+        Value of a row column at the time t, linearly interpolated between the two reports around t
+        :param t: time.monotonic()
+        :param field: name of a row column
+        :return: array, None if t is out of the stored reports
+        """
+        if field not in dict(self.ROWS):
+            raise ValueError('not a row field: {}'.format(field))
+        with self._lock:
+            indices = self._ordered_indices()
+            times = self._t[indices]
+            if len(times) == 0 or t < times[0] or t > times[-1]:
+                return None
+            if len(times) == 1:
+                lo = hi = 0
+            else:
+                hi = min(max(int(np.searchsorted(times, t, side='left')), 1), len(times) - 1)
+                lo = hi - 1
+            a = self._columns[field][indices[lo]].copy()
+            b = self._columns[field][indices[hi]].copy()
+            t0, t1 = times[lo], times[hi]
+        ratio = (t - t0) / (t1 - t0) if t1 > t0 else 0
+        delta = b - a
+        if field == 'position':
+            # roll/pitch/yaw are interpolated along the shortest way
+            delta[3:] = (delta[3:] + np.pi) % (2 * np.pi) - np.pi
+        value = a + delta * ratio
+        if field == 'position':
+            value[3:] = (value[3:] + np.pi) % (2 * np.pi) - np.pi
+        return value
+
+    def pose_at(self, t):
+        """
+        TCP pose at the time t, see interpolate
+        :return: array([x(mm), y(mm), z(mm), roll(rad), pitch(rad), yaw(rad)]), None if t is out of the stored reports
+        """
+        return self.interpolate(t, field='position')
+
+    def stats(self, field, seconds=None, start=None, end=None):
+        """
+        Statistics of a column over a time window (see window), per element for the row columns
+        :return: {'count', 'min', 'max', 'rms'}, min/max/rms are None if the window is empty
+        """
+        values = self.window(seconds=seconds, start=start, end=end, fields=(field,))[field]
+        if len(values) == 0:
+            return {'count': 0, 'min': None, 'max': None, 'rms': None}
+        values = values.astype(np.float64)
+        return {
+            'count': len(values),
+            'min': np.min(values, axis=0),
+            'max': np.max(values, axis=0),
+            'rms': np.sqrt(np.mean(np.square(values), axis=0)),
+        }
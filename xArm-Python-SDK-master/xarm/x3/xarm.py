@@ -25,8 +25,12 @@ from .ft_sensor import FtSensor
 from .modbus_tcp import ModbusTcp
 from .parse import GcodeParser
 from .code import APIState
-from .decorator import xarm_is_connected, xarm_is_ready, xarm_wait_until_not_pause, xarm_wait_until_cmdnum_lt_max
+from .decorator import xarm_is_connected, xarm_is_ready, xarm_wait_until_not_pause, xarm_wait_until_cmdnum_lt_max, xarm_motion_future
 from .utils import to_radian
+from .path_validator import PathValidator
+from .servo_streamer import ServoStreamer
+from .motion_planner import plan_linear_path
+from .motion_queue import MotionQueue
 try:
     # from ..tools.blockly_tool import BlocklyTool
     from ..tools.blockly import BlocklyTool
@@ -226,6 +230,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
             return self._set_position_absolute(*tcp_pos, radius=radius, speed=speed, mvacc=mvacc, mvtime=mvtime,
                                                is_radian=True, wait=wait, timeout=timeout, **kwargs)
 
+    @xarm_motion_future
     @xarm_wait_until_not_pause
     @xarm_wait_until_cmdnum_lt_max
     @xarm_is_ready(_type='set')
@@ -249,6 +254,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
                                                speed=speed, mvacc=mvacc, mvtime=mvtime, is_radian=is_radian,
                                                wait=wait, timeout=timeout, **kwargs)
 
+    @xarm_motion_future
     @xarm_wait_until_not_pause
     @xarm_wait_until_cmdnum_lt_max
     @xarm_is_ready(_type='set')
@@ -294,6 +300,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
             self.__update_tcp_motion_params(spd, acc, mvt)
         return ret[0]
 
+    @xarm_motion_future
     @xarm_wait_until_not_pause
     @xarm_wait_until_cmdnum_lt_max
     @xarm_is_ready(_type='set')
@@ -448,6 +455,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
             return self._set_servo_angle_absolute(joints, speed=speed, mvacc=mvacc, mvtime=mvtime, is_radian=True,
                                                   wait=wait, timeout=timeout, radius=radius, **kwargs)
 
+    @xarm_motion_future
     @xarm_wait_until_not_pause
     @xarm_wait_until_cmdnum_lt_max
     @xarm_is_ready(_type='set')
@@ -518,6 +526,15 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
         self._is_set_move = True
         return ret[0]
 
+    def create_servo_streamer(self, trajectory, rate=200, kind=ServoStreamer.JOINT, speed=None, mvacc=None,
+                              is_radian=None, is_tool_coord=False, **kwargs):
+        return ServoStreamer(self, trajectory, rate=rate, kind=kind, speed=speed, mvacc=mvacc, is_radian=is_radian,
+                             is_tool_coord=is_tool_coord, **kwargs)
+
+    def create_motion_queue(self, low_watermark=4, high_watermark=16):
+        return MotionQueue(self, low_watermark=low_watermark, high_watermark=high_watermark)
+
+    @xarm_motion_future
     @xarm_wait_until_not_pause
     @xarm_wait_until_cmdnum_lt_max
     @xarm_is_ready(_type='set')
@@ -559,6 +576,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
             self.__update_tcp_motion_params(spd, acc, mvt)
         return ret[0]
 
+    @xarm_motion_future
     @xarm_wait_until_not_pause
     @xarm_wait_until_cmdnum_lt_max
     @xarm_is_ready(_type='set')
@@ -703,6 +721,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
     def set_reduced_mode(self, on_off):
         ret = self.arm_cmd.set_reduced_mode(int(on_off))
         self.log_api_info('API -> set_reduced_mode -> code={}'.format(ret[0]), code=ret[0])
+        self._path_validator = None
         return ret[0]
 
     @xarm_is_connected(_type='set')
@@ -748,6 +767,7 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
         limits[4:6] = boundary[4:6] if boundary[4] >= boundary[5] else boundary[4:6][::-1]
         ret = self.arm_cmd.set_xyz_limits(limits)
         self.log_api_info('API -> set_reduced_tcp_boundary -> code={}, boundary={}'.format(ret[0], limits), code=ret[0])
+        self._path_validator = None
         return ret[0]
 
     @xarm_is_connected(_type='set')
@@ -778,12 +798,14 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
                     return APIState.OUT_OF_RANGE
         ret = self.arm_cmd.set_reduced_jrange(limits)
         self.log_api_info('API -> set_reduced_joint_range -> code={}, boundary={}'.format(ret[0], limits), code=ret[0])
+        self._path_validator = None
         return ret[0]
 
     @xarm_is_connected(_type='set')
     def set_fense_mode(self, on_off):
         ret = self.arm_cmd.set_fense_on(int(on_off))
         self.log_api_info('API -> set_fense_mode -> code={}, on={}'.format(ret[0], on_off), code=ret[0])
+        self._path_validator = None
         return ret
 
     @xarm_is_connected(_type='set')
@@ -1086,6 +1108,62 @@ class XArm(Gripper, Servo, Record, RobotIQ, BaseBoard, Track, FtSensor, ModbusTc
         else:
             return ret[0], None
 
+    def get_path_validator(self, refresh=False):
+        """
+        PathValidator of the arm, the reduced mode states are requested once, again on refresh or when the reported
+            reduced mode/safety boundary flags or the TCP/world offsets change
+        """
+        validator = self._path_validator
+        offsets = (list(self._position_offset), list(self._world_offset))
+        if validator is None or refresh or validator.offsets != offsets \
+                or validator.flags != (self._is_reduced_mode, self._is_fence_mode):
+            code, states = self.get_reduced_states(is_radian=True) if self.connected else (APIState.NOT_CONNECTED, None)
+            if code != 0:
+                logger.warning('get_reduced_states failed (code={}), the reduced mode is ignored'.format(code))
+                states = None
+            try:
+                validator = PathValidator(self.axis, self.device_type, tcp_offset=offsets[0], world_offset=offsets[1],
+                                          reduced_states=states)
+            except ImportError as e:
+                logger.error('get_path_validator: {}'.format(e))
+                return APIState.API_EXCEPTION, None
+            self._path_validator = validator
+        return 0, validator
+
+    def plan_linear_path(self, waypoints, segment_times=None, cycle_time=None, speed=None, mvacc=None, jerk=None,
+                         is_radian=None, **kwargs):
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        try:
+            plan = plan_linear_path(waypoints, segment_times=segment_times, cycle_time=cycle_time,
+                                    max_speed=self._max_tcp_speed if speed is None else speed,
+                                    mvacc=self._last_tcp_acc if mvacc is None else mvacc,
+                                    jerk=self._tcp_jerk if jerk is None else jerk, is_radian=is_radian, **kwargs)
+        except (ImportError, ValueError) as e:
+            logger.error('plan_linear_path: {}'.format(e))
+            return APIState.API_EXCEPTION, None
+        code, indexes = self.check_path_limits(plan.poses, is_joint=False, is_radian=True)
+        if code == 0 and indexes:
+            return APIState.OUT_OF_RANGE, plan
+        if not plan.is_feasible:
+            logger.warning('plan_linear_path: the target time can not be reached, {:.3f}s instead of {:.3f}s'.format(
+                plan.total_time, cycle_time if cycle_time is not None else sum(segment_times)))
+        return code, plan
+
+    def check_path_limits(self, path, is_joint=True, is_radian=None):
+        is_radian = self._default_is_radian if is_radian is None else is_radian
+        code, validator = self.get_path_validator()
+        if code != 0:
+            return code, []
+        try:
+            indexes = validator.check(path, is_joint=is_joint, is_radian=is_radian)
+        except ValueError as e:
+            logger.error('check_path_limits: {}'.format(e))
+            return APIState.API_EXCEPTION, []
+        if len(indexes):
+            self.log_api_info('API -> check_path_limits -> code={}, out of range: {} of {} waypoints, first={}'.format(
+                APIState.OUT_OF_RANGE, len(indexes), len(path), indexes[0]), code=APIState.OUT_OF_RANGE)
+        return 0, indexes.tolist()
+
     def emergency_stop(self):
         logger.info('emergency_stop--begin')
         self.set_state(4)